@@ -1,21 +1,53 @@
 import os
+import json
 import asyncio
+import functools
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Depends, status
+import anyio
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from datetime import datetime
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from datetime import datetime, timedelta
 
 from backend.lib.db import (
-    db, create_tables, init_admin_user,
-    User, Connector, Node, Workflow, Job
+    db, connection_scope, load_payloads,
+    User, Connector, Node, Workflow, Job, JobBatch, JobPayload, Schedule
 )
 from backend.lib.auth import (
-    get_current_user, get_admin_user, 
-    hash_password, generate_api_token
+    get_current_user, get_admin_user, get_stream_user,
+    hash_password, generate_api_token, revoke_user_tokens
+)
+from backend.lib.bootstrap import bootstrap, is_ready
+from backend.lib.node import execute_node_async
+from backend.lib.workflow import execute_workflow, enqueue_workflow
+from backend.lib.queue import parse_priority, queue_depth
+from backend.lib.metrics import (
+    QUEUE_DEPTH, THREADPOOL_BUSY, THREADPOOL_QUEUED, THREADPOOL_THREADS, render_metrics, start_metrics_writer
+)
+from backend.lib.schedule import CronExpression, check_offsets, compute_next_run
+from backend.lib.retention import read_archived_job
+from backend.lib.batch import parse_inputs, submit_batch, batch_progress
+from backend.lib.response_cache import etag_matches, make_etag, response_cache, table_version
+from backend.lib.trace import TRACE_FORMATS, export_trace
+from backend.lib.traffic import traffic_recorder
+from backend.lib.validation import InputValidationError, check_workflow_schema, validate_flow_input
+from backend.lib.profiling import PROFILE_SAMPLE_INTERVAL_MS, ProfilerBusy, install_profile_signal, profile
+from backend.lib.definitions import KINDS, MATCH_MODES, export_chunk, import_definitions
+from backend.lib.events import (
+    JOB_EVENT_KEEPALIVE, TERMINAL_STATUSES, event_bus, event_relay,
+    format_sse, is_terminal, latest_event_id, publish_event
+)
+from backend.lib.pagination import (
+    DEFAULT_JOB_PAGE_SIZE, MAX_PAGE_SIZE,
+    keyset_page, parse_fields, select_columns
+)
+from backend.lib.serializers import (
+    FastJSONResponse, JOB_FIELDS, RESOURCES,
+    job_query, serialize, serialize_many
 )
-from backend.lib.node import execute_node
-from backend.lib.workflow import execute_workflow
 
 # Pydantic models
 class ConnectorCreate(BaseModel):
@@ -57,35 +89,164 @@ class WorkflowCreate(BaseModel):
     description: str
     nodes: dict
 
+    @field_validator("nodes")
+    @classmethod
+    def schema_compiles(cls, nodes: dict) -> dict:
+        """The input schema is compiled on save, so runs never meet an invalid one"""
+        return check_workflow_schema(nodes)
+
 class WorkflowUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     nodes: Optional[dict] = None
 
+    @field_validator("nodes")
+    @classmethod
+    def schema_compiles(cls, nodes: Optional[dict]) -> Optional[dict]:
+        return nodes if nodes is None else check_workflow_schema(nodes)
+
 class NodeRunRequest(BaseModel):
     input: dict = Field(default_factory=dict)
 
 class WorkflowRunRequest(BaseModel):
     input: dict = Field(default_factory=dict)
+    enqueue: bool = False  # Return 202 right away and let the worker run the job
+    idempotency_key: Optional[str] = None  # Only used in enqueue mode
+    priority: str = "normal"  # low, normal, high, critical
+    run_at: Optional[datetime] = None  # Run later (implies enqueue)
+    delay_seconds: Optional[float] = Field(None, ge=0)  # Run after a delay (implies enqueue)
+
+class ScheduleCreate(BaseModel):
+    name: str
+    workflow_id: int
+    cron: str
+    input: dict = Field(default_factory=dict)
+    priority: str = "normal"
+    spread: int = Field(0, ge=0)
+    jitter: int = Field(0, ge=0)
+    enabled: bool = True
+
+class ScheduleUpdate(BaseModel):
+    name: Optional[str] = None
+    cron: Optional[str] = None
+    input: Optional[dict] = None
+    priority: Optional[str] = None
+    spread: Optional[int] = Field(None, ge=0)
+    jitter: Optional[int] = Field(None, ge=0)
+    enabled: Optional[bool] = None
 
 class UserUpdate(BaseModel):
     username: Optional[str] = None
     email: Optional[str] = None
 
+class UserQueueUpdate(BaseModel):
+    queue_weight: Optional[float] = Field(None, gt=0)
+    max_running_jobs: Optional[int] = Field(None, ge=0)
+
 class UserResponse(BaseModel):
     id: int
     username: str
     email: str
     api_token: str
     is_admin: bool
+    queue_weight: float
+    max_running_jobs: Optional[int] = None
     created_at: datetime
     updated_at: datetime
 
     class Config:
         from_attributes = True
 
+def page_response(content: list, next_cursor: Optional[str]) -> FastJSONResponse:
+    return FastJSONResponse(content, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+def list_definitions(model, resource: str, fields: Optional[str], cursor: Optional[str], limit: Optional[int]) -> FastJSONResponse:
+    """List connectors, nodes or workflows by id, one page when a limit is given"""
+    field_map = RESOURCES[resource]
+    try:
+        names = parse_fields(fields, field_map)
+        query = model.select(*select_columns(field_map, names, [model.id]))
+        rows, next_cursor = keyset_page(query, [model.id], cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page_response(serialize_many(resource, rows, names), next_cursor)
+
+def conditional_get(request: Request, table: str, build) -> Response:
+    """GET of definition rows with an ETag: 304 when the client has it, else the cached or a fresh body
+
+    The ETag comes from the table's write counter, so answering 304 or from
+    the cache costs one primary key lookup and no row reads.
+    """
+    # Version and rows from one read transaction, never rows newer or older than the version
+    with db.atomic():
+        etag = make_etag(table, table_version(table), request.url.path, request.url.query)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        cached = response_cache.get(etag)
+        if cached is not None:
+            body, extra = cached
+            return Response(content=body, media_type="application/json", headers={**extra, **headers})
+        response = build()
+
+    extra = {"X-Next-Cursor": response.headers["x-next-cursor"]} if "x-next-cursor" in response.headers else {}
+    response_cache.put(etag, response.body, extra)
+    response.headers.update(headers)
+    return response
+
+def list_jobs(conditions: list, fields: Optional[str], cursor: Optional[str], limit: int) -> FastJSONResponse:
+    """List jobs newest first, one page at a time"""
+    try:
+        names = parse_fields(fields, JOB_FIELDS)
+        query = job_query(names)
+        for condition in conditions:
+            query = query.where(condition)
+        jobs, next_cursor = keyset_page(query, [Job.created_at, Job.id], cursor, limit, descending=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if "input" in names or "output" in names:
+        load_payloads(jobs)
+    return page_response(serialize_many("job", jobs, names), next_cursor)
+
+def job_filters(status_filter: Optional[str], created_after: Optional[datetime], created_before: Optional[datetime]) -> list:
+    """Conditions of the job list filters shared by the job endpoints"""
+    conditions = []
+    if status_filter:
+        conditions.append(Job.status.in_([s.strip() for s in status_filter.split(',') if s.strip()]))
+    if created_after:
+        conditions.append(Job.created_at >= created_after)
+    if created_before:
+        conditions.append(Job.created_at < created_before)
+    return conditions
+
+# Threads running the sync endpoints (database work) of this process
+API_THREADPOOL_SIZE = int(os.getenv('API_THREADPOOL_SIZE', '40'))
+
+def with_connection(func):
+    """Run a sync function inside connection_scope() on whatever thread calls it"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with connection_scope():
+            return func(*args, **kwargs)
+    return wrapper
+
+class ConnectionScopedRoute(APIRoute):
+    """Route whose sync endpoint runs in the thread pool with its own database connection
+
+    Endpoints doing database work are plain `def` so FastAPI runs them in its
+    thread pool and the event loop stays free (/health answers while nodes
+    run). Async endpoints only await non-blocking work.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = with_connection(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
 # Initialize FastAPI app
-app = FastAPI(title="APIFlow", version="1.0.0")
+# Endpoints returning FastJSONResponse themselves skip FastAPI's generic encoding entirely
+app = FastAPI(title="APIFlow", version="1.0.0", default_response_class=FastJSONResponse)
+app.router.route_class = ConnectionScopedRoute
 
 # CORS middleware
 app.add_middleware(
@@ -94,16 +255,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Startup event
 @app.on_event("startup")
 async def startup():
-    # Create tables
-    create_tables()
-    
-    # Initialize admin user
-    admin_user = init_admin_user()
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = API_THREADPOOL_SIZE
+
+    # Threads serving sync endpoints, read when metrics are collected
+    THREADPOOL_THREADS.add_callback(lambda: {('api',): limiter.total_tokens})
+    THREADPOOL_BUSY.add_callback(lambda: {('api',): limiter.borrowed_tokens})
+    THREADPOOL_QUEUED.add_callback(lambda: {('api',): limiter.statistics().tasks_waiting})
+    start_metrics_writer()
+    install_profile_signal(asyncio.get_running_loop())
+
+    # backend/serve.py bootstraps once before starting its workers
+    if os.getenv("APIFLOW_BOOTSTRAPPED") == "1":
+        return
+
+    # Create tables, migrate and initialize the admin user (serialized across processes)
+    admin_user = await run_in_threadpool(bootstrap)
     
     print("=" * 60)
     print("APIFlow API started successfully!")
@@ -114,48 +287,72 @@ async def startup():
     print("Use this token to authenticate API requests")
     print("=" * 60)
 
-# Health check
+# Health checks
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/live")
+async def liveness():
+    """The process is up and its event loop answers"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """The database answers and has the schema this code expects"""
+    reason = await run_in_threadpool(is_ready)
+    if reason:
+        return FastJSONResponse({"status": "unavailable", "reason": reason}, status_code=503)
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics of the API and worker processes sharing METRICS_DIR"""
+    for status_name, count in (await run_in_threadpool(with_connection(queue_depth))).items():
+        QUEUE_DEPTH.set(count, status_name)
+    body = await run_in_threadpool(render_metrics)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.post("/api/v1/admin/profile")
+async def profile_api_process(
+    mode: str = "sampling",
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(PROFILE_SAMPLE_INTERVAL_MS, gt=0),
+    job_id: Optional[int] = None,
+    idle: bool = False,
+    current_user: User = Depends(get_admin_user)
+):
+    """Profile this API process for `seconds`: collapsed stacks (sampling, optionally of one job) or cProfile stats"""
+    try:
+        body = await profile(mode, seconds, interval_ms, job_id, idle)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(body)
+
 # Connector endpoints
-@app.get("/api/v1/connectors", response_model=List[dict])
-async def get_connectors(current_user: User = Depends(get_current_user)):
-    connectors = list(Connector.select())
-    return [
-        {
-            "id": c.id,
-            "name": c.name,
-            "base_url": c.base_url,
-            "method": c.method,
-            "header": c.header,
-            "body": c.body,
-            "created_at": c.created_at,
-            "updated_at": c.updated_at
-        }
-        for c in connectors
-    ]
+@app.get("/api/v1/connectors")
+def get_connectors(
+    request: Request,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    return conditional_get(request, "connector", lambda: list_definitions(Connector, "connector", fields, cursor, limit))
 
 @app.get("/api/v1/connectors/{connector_id}")
-async def get_connector(connector_id: int, current_user: User = Depends(get_current_user)):
-    try:
-        connector = Connector.get(Connector.id == connector_id)
-        return {
-            "id": connector.id,
-            "name": connector.name,
-            "base_url": connector.base_url,
-            "method": connector.method,
-            "header": connector.header,
-            "body": connector.body,
-            "created_at": connector.created_at,
-            "updated_at": connector.updated_at
-        }
-    except Connector.DoesNotExist:
-        raise HTTPException(status_code=404, detail="Connector not found")
+def get_connector(request: Request, connector_id: int, current_user: User = Depends(get_current_user)):
+    def build():
+        try:
+            return FastJSONResponse(serialize("connector", Connector.get(Connector.id == connector_id)))
+        except Connector.DoesNotExist:
+            raise HTTPException(status_code=404, detail="Connector not found")
+    return conditional_get(request, "connector", build)
 
 @app.post("/api/v1/connectors", status_code=201)
-async def create_connector(
+def create_connector(
     connector: ConnectorCreate,
     current_user: User = Depends(get_current_user)
 ):
@@ -166,19 +363,10 @@ async def create_connector(
         header=connector.header,
         body=connector.body
     )
-    return {
-        "id": new_connector.id,
-        "name": new_connector.name,
-        "base_url": new_connector.base_url,
-        "method": new_connector.method,
-        "header": new_connector.header,
-        "body": new_connector.body,
-        "created_at": new_connector.created_at,
-        "updated_at": new_connector.updated_at
-    }
+    return FastJSONResponse(serialize("connector", new_connector), status_code=201)
 
 @app.patch("/api/v1/connectors/{connector_id}")
-async def update_connector(
+def update_connector(
     connector_id: int,
     update: ConnectorUpdate,
     current_user: User = Depends(get_current_user)
@@ -199,21 +387,12 @@ async def update_connector(
         
         connector.save()
         
-        return {
-            "id": connector.id,
-            "name": connector.name,
-            "base_url": connector.base_url,
-            "method": connector.method,
-            "header": connector.header,
-            "body": connector.body,
-            "created_at": connector.created_at,
-            "updated_at": connector.updated_at
-        }
+        return FastJSONResponse(serialize("connector", connector))
     except Connector.DoesNotExist:
         raise HTTPException(status_code=404, detail="Connector not found")
 
 @app.delete("/api/v1/connectors/{connector_id}", status_code=204)
-async def delete_connector(
+def delete_connector(
     connector_id: int,
     current_user: User = Depends(get_current_user)
 ):
@@ -224,48 +403,27 @@ async def delete_connector(
         raise HTTPException(status_code=404, detail="Connector not found")
 
 # Node endpoints
-@app.get("/api/v1/nodes", response_model=List[dict])
-async def get_nodes(current_user: User = Depends(get_current_user)):
-    nodes = list(Node.select())
-    return [
-        {
-            "id": n.id,
-            "name": n.name,
-            "description": n.description,
-            "connector_id": n.connector.id,
-            "path": n.path,
-            "input": n.input,
-            "output": n.output,
-            "data": n.data,
-            "body_template": getattr(n, 'body_template', {}),
-            "created_at": n.created_at,
-            "updated_at": n.updated_at
-        }
-        for n in nodes
-    ]
+@app.get("/api/v1/nodes")
+def get_nodes(
+    request: Request,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    return conditional_get(request, "node", lambda: list_definitions(Node, "node", fields, cursor, limit))
 
 @app.get("/api/v1/nodes/{node_id}")
-async def get_node(node_id: int, current_user: User = Depends(get_current_user)):
-    try:
-        node = Node.get(Node.id == node_id)
-        return {
-            "id": node.id,
-            "name": node.name,
-            "description": node.description,
-            "connector_id": node.connector.id,
-            "path": node.path,
-            "input": node.input,
-            "output": node.output,
-            "data": node.data,
-            "body_template": getattr(node, 'body_template', {}),
-            "created_at": node.created_at,
-            "updated_at": node.updated_at
-        }
-    except Node.DoesNotExist:
-        raise HTTPException(status_code=404, detail="Node not found")
+def get_node(request: Request, node_id: int, current_user: User = Depends(get_current_user)):
+    def build():
+        try:
+            return FastJSONResponse(serialize("node", Node.get(Node.id == node_id)))
+        except Node.DoesNotExist:
+            raise HTTPException(status_code=404, detail="Node not found")
+    return conditional_get(request, "node", build)
 
 @app.post("/api/v1/nodes", status_code=201)
-async def create_node(
+def create_node(
     node: NodeCreate,
     current_user: User = Depends(get_current_user)
 ):
@@ -285,22 +443,10 @@ async def create_node(
         body_template=node.body_template
     )
     
-    return {
-        "id": new_node.id,
-        "name": new_node.name,
-        "description": new_node.description,
-        "connector_id": new_node.connector.id,
-        "path": new_node.path,
-        "input": new_node.input,
-        "output": new_node.output,
-        "data": new_node.data,
-        "body_template": new_node.body_template,
-        "created_at": new_node.created_at,
-        "updated_at": new_node.updated_at
-    }
+    return FastJSONResponse(serialize("node", new_node), status_code=201)
 
 @app.patch("/api/v1/nodes/{node_id}")
-async def update_node(
+def update_node(
     node_id: int,
     update: NodeUpdate,
     current_user: User = Depends(get_current_user)
@@ -331,24 +477,12 @@ async def update_node(
         
         node.save()
         
-        return {
-            "id": node.id,
-            "name": node.name,
-            "description": node.description,
-            "connector_id": node.connector.id,
-            "path": node.path,
-            "input": node.input,
-            "output": node.output,
-            "data": node.data,
-            "body_template": getattr(node, 'body_template', {}),
-            "created_at": node.created_at,
-            "updated_at": node.updated_at
-        }
+        return FastJSONResponse(serialize("node", node))
     except Node.DoesNotExist:
         raise HTTPException(status_code=404, detail="Node not found")
 
 @app.delete("/api/v1/nodes/{node_id}", status_code=204)
-async def delete_node(
+def delete_node(
     node_id: int,
     current_user: User = Depends(get_current_user)
 ):
@@ -364,45 +498,37 @@ async def run_node(
     request: NodeRunRequest,
     current_user: User = Depends(get_current_user)
 ):
+    traffic_recorder.submission("node", node_id, [request.input])
     try:
-        result = execute_node(node_id, request.input)
+        result = await execute_node_async(node_id, request.input)
         return {"status": "success", "output": result}
+    except InputValidationError as e:
+        raise HTTPException(status_code=422, detail=e.detail("body", "input"))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Workflow endpoints
-@app.get("/api/v1/workflows", response_model=List[dict])
-async def get_workflows(current_user: User = Depends(get_current_user)):
-    workflows = list(Workflow.select())
-    return [
-        {
-            "id": w.id,
-            "name": w.name,
-            "description": w.description,
-            "nodes": w.nodes,
-            "created_at": w.created_at,
-            "updated_at": w.updated_at
-        }
-        for w in workflows
-    ]
+@app.get("/api/v1/workflows")
+def get_workflows(
+    request: Request,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    return conditional_get(request, "workflow", lambda: list_definitions(Workflow, "workflow", fields, cursor, limit))
 
 @app.get("/api/v1/workflows/{workflow_id}")
-async def get_workflow(workflow_id: int, current_user: User = Depends(get_current_user)):
-    try:
-        workflow = Workflow.get(Workflow.id == workflow_id)
-        return {
-            "id": workflow.id,
-            "name": workflow.name,
-            "description": workflow.description,
-            "nodes": workflow.nodes,
-            "created_at": workflow.created_at,
-            "updated_at": workflow.updated_at
-        }
-    except Workflow.DoesNotExist:
-        raise HTTPException(status_code=404, detail="Workflow not found")
+def get_workflow(request: Request, workflow_id: int, current_user: User = Depends(get_current_user)):
+    def build():
+        try:
+            return FastJSONResponse(serialize("workflow", Workflow.get(Workflow.id == workflow_id)))
+        except Workflow.DoesNotExist:
+            raise HTTPException(status_code=404, detail="Workflow not found")
+    return conditional_get(request, "workflow", build)
 
 @app.post("/api/v1/workflows", status_code=201)
-async def create_workflow(
+def create_workflow(
     workflow: WorkflowCreate,
     current_user: User = Depends(get_current_user)
 ):
@@ -412,17 +538,10 @@ async def create_workflow(
         nodes=workflow.nodes
     )
     
-    return {
-        "id": new_workflow.id,
-        "name": new_workflow.name,
-        "description": new_workflow.description,
-        "nodes": new_workflow.nodes,
-        "created_at": new_workflow.created_at,
-        "updated_at": new_workflow.updated_at
-    }
+    return FastJSONResponse(serialize("workflow", new_workflow), status_code=201)
 
 @app.patch("/api/v1/workflows/{workflow_id}")
-async def update_workflow(
+def update_workflow(
     workflow_id: int,
     update: WorkflowUpdate,
     current_user: User = Depends(get_current_user)
@@ -439,115 +558,460 @@ async def update_workflow(
         
         workflow.save()
         
-        return {
-            "id": workflow.id,
-            "name": workflow.name,
-            "description": workflow.description,
-            "nodes": workflow.nodes,
-            "created_at": workflow.created_at,
-            "updated_at": workflow.updated_at
-        }
+        return FastJSONResponse(serialize("workflow", workflow))
     except Workflow.DoesNotExist:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
 @app.delete("/api/v1/workflows/{workflow_id}", status_code=204)
-async def delete_workflow(
+def delete_workflow(
     workflow_id: int,
     current_user: User = Depends(get_current_user)
 ):
     try:
         workflow = Workflow.get(Workflow.id == workflow_id)
-        workflow.delete_instance()
+        # SQLite does not enforce ON DELETE CASCADE (foreign_keys is off): its schedules would keep firing
+        with db.atomic():
+            Schedule.delete().where(Schedule.workflow == workflow.id).execute()
+            workflow.delete_instance()
     except Workflow.DoesNotExist:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
+def due_time(run_at: Optional[datetime], delay_seconds: Optional[float]) -> Optional[datetime]:
+    """Due time of a delayed submission, as the naive local time jobs are stored in"""
+    if run_at is not None and run_at.tzinfo is not None:
+        run_at = run_at.astimezone().replace(tzinfo=None)
+    if delay_seconds is not None:
+        run_at = datetime.now() + timedelta(seconds=delay_seconds)
+    return run_at
+
+def delay_seconds_until(run_at: Optional[datetime]) -> Optional[float]:
+    """Seconds from now to a due time, recorded with delayed submissions"""
+    return (run_at - datetime.now()).total_seconds() if run_at is not None else None
+
 @app.post("/api/v1/workflow/{workflow_id}/run")
 async def run_workflow(
     workflow_id: int,
     request: WorkflowRunRequest,
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
+    run_at = due_time(request.run_at, request.delay_seconds)
+
+    if request.enqueue or run_at is not None:
+        try:
+            priority = parse_priority(request.priority)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        try:
+            job, created = await run_in_threadpool(
+                with_connection(enqueue_workflow),
+                workflow_id,
+                request.input,
+                idempotency_key=request.idempotency_key or idempotency_key,
+                user=current_user,
+                priority=priority,
+                run_at=run_at
+            )
+        except InputValidationError as e:
+            raise HTTPException(status_code=422, detail=e.detail("body", "input"))
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        if created:
+            traffic_recorder.submission(
+                "enqueue", workflow_id, [request.input], request.priority, delay_seconds_until(run_at)
+            )
+        return FastJSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={
+                "status": "queued",
+                "job_id": job.id,
+                "job_status": job.status,
+                "run_at": job.run_at.isoformat() if job.run_at else None,
+                "duplicate": not created
+            }
+        )
+
+    traffic_recorder.submission("sync", workflow_id, [request.input])
     try:
-        job = await execute_workflow(workflow_id, request.input)
+        job = await execute_workflow(workflow_id, request.input, user=current_user)
         return {
             "status": "success",
             "job_id": job.id,
             "job_status": job.status
         }
+    except InputValidationError as e:
+        raise HTTPException(status_code=422, detail=e.detail("body", "input"))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Job endpoints
-@app.get("/api/v1/jobs", response_model=List[dict])
-async def get_jobs(current_user: User = Depends(get_current_user)):
-    jobs = list(Job.select().order_by(Job.created_at.desc()))
-    return [
-        {
-            "id": j.id,
-            "name": j.name,
-            "workflow_id": j.workflow.id,
-            "workflow_name": j.workflow.name,
-            "status": j.status,
-            "retry_count": j.retry_count,
-            "input": j.input,
-            "output": j.output,
-            "error": j.error,
-            "created_at": j.created_at,
-            "updated_at": j.updated_at
+@app.post("/api/v1/workflow/{workflow_id}/batch")
+async def submit_workflow_batch(
+    workflow_id: int,
+    request: Request,
+    name: Optional[str] = None,
+    priority: str = "normal",
+    run_at: Optional[datetime] = None,
+    delay_seconds: Optional[float] = Query(None, ge=0),
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """Enqueue one job per input: a JSON list or an NDJSON body (one input per line)"""
+    try:
+        priority_value = parse_priority(priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    ndjson = "ndjson" in content_type or "jsonl" in content_type
+    try:
+        inputs = await run_in_threadpool(parse_inputs, body, ndjson)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    due = due_time(run_at, delay_seconds)
+    try:
+        batch, job_ids, created = await run_in_threadpool(
+            with_connection(submit_batch),
+            workflow_id,
+            inputs,
+            job_name=name,
+            idempotency_key=idempotency_key,
+            user=current_user,
+            priority=priority_value,
+            run_at=due
+        )
+    except InputValidationError as e:
+        raise HTTPException(status_code=422, detail=e.detail("body"))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if created:
+        traffic_recorder.submission("batch", workflow_id, inputs, priority, delay_seconds_until(due))
+    return FastJSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "status": "queued",
+            "batch_id": batch.id,
+            "job_count": len(job_ids),
+            "job_ids": job_ids,
+            "duplicate": not created
         }
-        for j in jobs
-    ]
+    )
+
+@app.get("/api/v1/batches/{batch_id}")
+def get_batch(batch_id: int, current_user: User = Depends(get_current_user)):
+    """Progress of a batch submission"""
+    try:
+        batch = JobBatch.get(JobBatch.id == batch_id)
+    except JobBatch.DoesNotExist:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return FastJSONResponse(batch_progress(batch))
+
+# Definition import/export
+IMPORT_MODELS = {"connector": ConnectorCreate, "node": NodeCreate, "workflow": WorkflowCreate}
+
+def parse_import(body: bytes) -> list:
+    """Validated (kind, id, values) records of an NDJSON import, raises ValueError listing the bad lines"""
+    records, errors = [], []
+    for number, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            kind = record.get("kind") if isinstance(record, dict) else None
+            if kind not in IMPORT_MODELS:
+                raise ValueError(f"kind must be one of {list(IMPORT_MODELS)}")
+            source_id = record.get("id")
+            if source_id is not None and not isinstance(source_id, int):
+                raise ValueError("id must be an integer")
+            records.append((kind, source_id, IMPORT_MODELS[kind].model_validate(record).model_dump()))
+        except ValidationError as e:
+            errors.append(f"Line {number}: " + ", ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+        except ValueError as e:
+            errors.append(f"Line {number}: {e}")
+    if errors:
+        raise ValueError(f"{len(errors)} invalid lines: " + "; ".join(errors[:20]))
+    if not records:
+        raise ValueError("Nothing to import")
+    return records
+
+@app.get("/api/v1/export")
+async def export_definitions(kinds: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """Stream connectors, nodes and workflows as NDJSON, one record per line"""
+    selected = [kind.strip() for kind in kinds.split(",") if kind.strip()] if kinds else list(KINDS)
+    unknown = [kind for kind in selected if kind not in KINDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown kinds {unknown}. Available: {list(KINDS)}")
+
+    async def lines():
+        # Dependency order, so the file imports front to back
+        for kind in [kind for kind in KINDS if kind in selected]:
+            after_id = 0
+            while after_id is not None:
+                chunk, after_id = await run_in_threadpool(with_connection(export_chunk), kind, after_id)
+                yield chunk
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="apiflow-export.ndjson"'}
+    )
+
+@app.post("/api/v1/import")
+async def import_definitions_ndjson(
+    request: Request,
+    match: str = "name",
+    current_user: User = Depends(get_current_user)
+):
+    """Create or update the connectors, nodes and workflows of an NDJSON export, all or nothing"""
+    if match not in MATCH_MODES:
+        raise HTTPException(status_code=400, detail=f"match must be one of {list(MATCH_MODES)}")
+    body = await request.body()
+    try:
+        records = await run_in_threadpool(parse_import, body)
+        result = await run_in_threadpool(with_connection(import_definitions), records, match)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return FastJSONResponse(result)
+
+# Schedule endpoints
+@app.get("/api/v1/schedules")
+def get_schedules(current_user: User = Depends(get_current_user)):
+    schedules = list(Schedule.select().order_by(Schedule.id))
+    return FastJSONResponse(serialize_many("schedule", schedules))
+
+@app.get("/api/v1/schedules/{schedule_id}")
+def get_schedule(schedule_id: int, current_user: User = Depends(get_current_user)):
+    try:
+        return FastJSONResponse(serialize("schedule", Schedule.get(Schedule.id == schedule_id)))
+    except Schedule.DoesNotExist:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+
+@app.post("/api/v1/schedules", status_code=201)
+def create_schedule(
+    schedule: ScheduleCreate,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        workflow = Workflow.get(Workflow.id == schedule.workflow_id)
+    except Workflow.DoesNotExist:
+        raise HTTPException(status_code=400, detail="Workflow not found")
+
+    try:
+        CronExpression(schedule.cron)
+        check_offsets(schedule.cron, schedule.spread, schedule.jitter)
+        priority = parse_priority(schedule.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        schedule.input = validate_flow_input(workflow, schedule.input)
+    except InputValidationError as e:
+        raise HTTPException(status_code=422, detail=e.detail("body", "input"))
+
+    with db.atomic():
+        new_schedule = Schedule.create(
+            name=schedule.name,
+            workflow=workflow,
+            user=current_user,
+            cron=schedule.cron,
+            input=schedule.input,
+            priority=priority,
+            spread=schedule.spread,
+            jitter=schedule.jitter,
+            enabled=schedule.enabled
+        )
+        # The spread offset depends on the id, so the first run is computed after the insert
+        if new_schedule.enabled:
+            new_schedule.base_run_at, new_schedule.next_run_at = compute_next_run(new_schedule)
+            new_schedule.save()
+
+    return FastJSONResponse(serialize("schedule", new_schedule), status_code=201)
+
+@app.patch("/api/v1/schedules/{schedule_id}")
+def update_schedule(
+    schedule_id: int,
+    update: ScheduleUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        schedule = Schedule.get(Schedule.id == schedule_id)
+    except Schedule.DoesNotExist:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+
+    try:
+        if update.cron is not None:
+            CronExpression(update.cron)
+            schedule.cron = update.cron
+        if update.priority is not None:
+            schedule.priority = parse_priority(update.priority)
+        if update.spread is not None:
+            schedule.spread = update.spread
+        if update.jitter is not None:
+            schedule.jitter = update.jitter
+        check_offsets(schedule.cron, schedule.spread, schedule.jitter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if update.name is not None:
+        schedule.name = update.name
+    if update.input is not None:
+        try:
+            schedule.input = validate_flow_input(schedule.workflow, update.input)
+        except InputValidationError as e:
+            raise HTTPException(status_code=422, detail=e.detail("body", "input"))
+    if update.enabled is not None:
+        schedule.enabled = update.enabled
+
+    schedule.base_run_at, schedule.next_run_at = compute_next_run(schedule) if schedule.enabled else (None, None)
+    schedule.save()
+    return FastJSONResponse(serialize("schedule", schedule))
+
+@app.delete("/api/v1/schedules/{schedule_id}", status_code=204)
+def delete_schedule(
+    schedule_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        schedule = Schedule.get(Schedule.id == schedule_id)
+        schedule.delete_instance()
+    except Schedule.DoesNotExist:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+
+# Job endpoints
+@app.get("/api/v1/jobs")
+def get_jobs(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    workflow_id: Optional[int] = None,
+    batch_id: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_JOB_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    conditions = job_filters(status_filter, created_after, created_before)
+    if workflow_id is not None:
+        conditions.append(Job.workflow == workflow_id)
+    if batch_id is not None:
+        conditions.append(Job.batch == batch_id)
+    return list_jobs(conditions, fields, cursor, limit)
 
 @app.get("/api/v1/jobs/{job_id}")
-async def get_job(job_id: int, current_user: User = Depends(get_current_user)):
+def get_job(
+    job_id: int,
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user)
+):
     try:
-        job = Job.get(Job.id == job_id)
-        return {
-            "id": job.id,
-            "name": job.name,
-            "workflow_id": job.workflow.id,
-            "workflow_name": job.workflow.name,
-            "status": job.status,
-            "retry_count": job.retry_count,
-            "input": job.input,
-            "output": job.output,
-            "error": job.error,
-            "created_at": job.created_at,
-            "updated_at": job.updated_at
-        }
+        job = job_query().where(Job.id == job_id).get()
+        data = serialize("job", job)
+        if include_archived and job.archived_at:
+            # Payloads of archived jobs are read back from their segment file
+            archived = read_archived_job(job) or {}
+            data.update({key: archived.get(key, data[key]) for key in ("input", "output")})
+        return FastJSONResponse(data)
     except Job.DoesNotExist:
         raise HTTPException(status_code=404, detail="Job not found")
 
-@app.get("/api/v1/workflow/{workflow_id}/jobs", response_model=List[dict])
-async def get_workflow_jobs(
+@app.get("/api/v1/jobs/{job_id}/trace")
+def get_job_trace(
+    job_id: int,
+    output_format: str = Query("tree", alias="format"),
+    current_user: User = Depends(get_current_user)
+):
+    """Span tree of a finished job run: tree (with its critical path), chrome or otlp"""
+    if output_format not in TRACE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{output_format}'. Available: {list(TRACE_FORMATS)}")
+    job = Job.select(Job.id, Job.archived_at, Job.archive_segment).where(Job.id == job_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    trace = JobPayload.select(JobPayload.trace).where(JobPayload.job == job_id).scalar()
+    if trace is None and job.archived_at:
+        trace = (read_archived_job(job) or {}).get("trace")
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No trace recorded for this job, traces are stored when a run ends")
+    return FastJSONResponse(export_trace(trace, job_id, output_format))
+
+def job_snapshot(job_id: int):
+    """Current job state and the newest event id, the start of an event stream"""
+    job = Job.select(Job.id, Job.status, Job.error).where(Job.id == job_id).first()
+    return job, latest_event_id()
+
+@app.get("/api/v1/jobs/{job_id}/events")
+async def stream_job_events(job_id: int, current_user: User = Depends(get_stream_user)):
+    """Server-sent events of a job: its state, then module and state events until it ends"""
+    # Subscribe before reading the snapshot so no event falls in between
+    queue = event_bus.subscribe(job_id)
+    try:
+        job, since_id = await run_in_threadpool(with_connection(job_snapshot), job_id)
+    except BaseException:
+        event_bus.unsubscribe(job_id, queue)
+        raise
+    if job is None:
+        event_bus.unsubscribe(job_id, queue)
+        raise HTTPException(status_code=404, detail="Job not found")
+    event_relay.ensure_started(job_id, since_id)
+
+    async def events():
+        try:
+            snapshot = {"type": "job", "job_id": job.id, "status": job.status, "error": job.error, "snapshot": True}
+            yield format_sse(snapshot)
+            if is_terminal(snapshot):
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), JOB_EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # A job that ended without its event reaching us must not keep the stream open
+                    current, _ = await run_in_threadpool(with_connection(job_snapshot), job_id)
+                    if current is None:
+                        return
+                    if current.status in TERMINAL_STATUSES:
+                        yield format_sse({
+                            "type": "job", "job_id": job_id, "status": current.status, "error": current.error,
+                            "snapshot": True
+                        })
+                        return
+                    # Keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+                if is_terminal(event):
+                    return
+        finally:
+            event_bus.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/v1/workflow/{workflow_id}/jobs")
+def get_workflow_jobs(
     workflow_id: int,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_JOB_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
     current_user: User = Depends(get_current_user)
 ):
-    jobs = list(Job.select().where(Job.workflow == workflow_id).order_by(Job.created_at.desc()))
-    return [
-        {
-            "id": j.id,
-            "name": j.name,
-            "workflow_id": j.workflow.id,
-            "workflow_name": j.workflow.name,
-            "status": j.status,
-            "retry_count": j.retry_count,
-            "input": j.input,
-            "output": j.output,
-            "error": j.error,
-            "created_at": j.created_at,
-            "updated_at": j.updated_at
-        }
-        for j in jobs
-    ]
+    conditions = job_filters(status_filter, created_after, created_before)
+    conditions.append(Job.workflow == workflow_id)
+    return list_jobs(conditions, fields, cursor, limit)
 
 @app.post("/api/v1/jobs/{job_id}/cancel")
-async def cancel_job(job_id: int, current_user: User = Depends(get_current_user)):
+def cancel_job(job_id: int, current_user: User = Depends(get_current_user)):
     try:
         job = Job.get(Job.id == job_id)
-        if job.status in ['pending', 'running']:
+        if job.status in ['scheduled', 'pending', 'running']:
             job.status = 'cancelled'
             job.save()
+            publish_event(job.id, 'job', status=job.status, error=job.error)
             return {"status": "success", "message": "Job cancelled"}
         else:
             return {"status": "error", "message": f"Cannot cancel job with status: {job.status}"}
@@ -556,7 +1020,7 @@ async def cancel_job(job_id: int, current_user: User = Depends(get_current_user)
 
 # User endpoints
 @app.get("/api/v1/user/{user_id}", response_model=UserResponse)
-async def get_user(user_id: int, current_user: User = Depends(get_admin_user)):
+def get_user(user_id: int, current_user: User = Depends(get_admin_user)):
     try:
         user = User.get(User.id == user_id)
         return UserResponse.from_orm(user)
@@ -564,10 +1028,11 @@ async def get_user(user_id: int, current_user: User = Depends(get_admin_user)):
         raise HTTPException(status_code=404, detail="User not found")
 
 @app.patch("/api/v1/user")
-async def update_user(
+def update_user(
     update: UserUpdate,
     current_user: User = Depends(get_current_user)
 ):
+    changes = {}
     if update.username is not None:
         # Check if username already exists
         existing = User.select().where(
@@ -575,7 +1040,7 @@ async def update_user(
         ).first()
         if existing:
             raise HTTPException(status_code=400, detail="Username already exists")
-        current_user.username = update.username
+        changes[User.username] = update.username
     
     if update.email is not None:
         # Check if email already exists
@@ -584,24 +1049,51 @@ async def update_user(
         ).first()
         if existing:
             raise HTTPException(status_code=400, detail="Email already exists")
-        current_user.email = update.email
+        changes[User.email] = update.email
     
-    current_user.save()
-    return UserResponse.from_orm(current_user)
+    # Only the changed columns: current_user may be a cached row, older than what other processes wrote
+    changes[User.updated_at] = datetime.now()
+    User.update(changes).where(User.id == current_user.id).execute()
+    revoke_user_tokens(current_user.id)
+    return UserResponse.from_orm(User.get_by_id(current_user.id))
 
 @app.post("/api/v1/user/{user_id}/reset_token")
-async def reset_user_token(user_id: int, current_user: User = Depends(get_admin_user)):
+def reset_user_token(user_id: int, current_user: User = Depends(get_admin_user)):
     try:
         user = User.get(User.id == user_id)
         user.api_token = generate_api_token()
         user.save()
+        revoke_user_tokens(user.id)
         return {"status": "success", "new_token": user.api_token}
     except User.DoesNotExist:
         raise HTTPException(status_code=404, detail="User not found")
 
+@app.patch("/api/v1/user/{user_id}/queue", response_model=UserResponse)
+def update_user_queue(
+    user_id: int,
+    update: UserQueueUpdate,
+    current_user: User = Depends(get_admin_user)
+):
+    try:
+        user = User.get(User.id == user_id)
+    except User.DoesNotExist:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    changes = {User.updated_at: datetime.now()}
+    if update.queue_weight is not None:
+        changes[User.queue_weight] = update.queue_weight
+    if 'max_running_jobs' in update.model_fields_set:
+        # Explicit null removes the per-user override
+        changes[User.max_running_jobs] = update.max_running_jobs
+
+    User.update(changes).where(User.id == user.id).execute()
+    revoke_user_tokens(user.id)
+    return UserResponse.from_orm(User.get_by_id(user.id))
+
 @app.delete("/api/v1/user", status_code=204)
-async def delete_user(current_user: User = Depends(get_current_user)):
+def delete_user(current_user: User = Depends(get_current_user)):
     current_user.delete_instance()
+    revoke_user_tokens(current_user.id)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,13 +1,26 @@
 import os
+import time
 import secrets
 import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Set
 from fastapi import HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from backend.lib.db import User
+from starlette.concurrency import run_in_threadpool
+from backend.lib.db import User, TokenRevocation, connection_scope
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Token -> user cache of each API process
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', '60'))  # Seconds, 0 disables the cache
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+# Longest time another process may still accept a revoked token
+AUTH_REVOCATION_WINDOW = float(os.getenv('AUTH_REVOCATION_WINDOW', '5'))
+# Seconds of revocations read again on every poll, ids can commit out of order on PostgreSQL
+AUTH_REVOCATION_OVERLAP = float(os.getenv('AUTH_REVOCATION_OVERLAP', '5'))
 
 def hash_password(password: str) -> str:
     """Hash a password using SHA256"""
@@ -21,13 +34,138 @@ def generate_api_token() -> str:
     """Generate a secure API token"""
     return secrets.token_urlsafe(32)
 
+class TokenCache:
+    """LRU cache of API token -> user row with a TTL
+
+    Entries hold the user's column values, every lookup gets its own User
+    instance. Token resets, profile updates and deletions evict the user here
+    and add a TokenRevocation row that the other processes poll at most every
+    AUTH_REVOCATION_WINDOW seconds.
+    """
+
+    def __init__(self, ttl: float = AUTH_CACHE_TTL, max_size: int = AUTH_CACHE_SIZE,
+                 revocation_window: float = AUTH_REVOCATION_WINDOW):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.revocation_window = revocation_window
+        self.entries: OrderedDict = OrderedDict()  # token -> (expires_at, user data)
+        self.user_tokens: Dict[int, Set[str]] = {}
+        self.lock = threading.Lock()
+        self.poll_lock = threading.Lock()  # One poll at a time, the others keep serving
+        self.last_revocation_id = None
+        self.applied_revocations: Dict[int, datetime] = {}  # id -> created_at, within the overlap
+        self.last_poll = 0.0
+
+    def get(self, token: str) -> Optional[User]:
+        """Cached user of a token, None on a miss"""
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at < time.monotonic():
+                self.discard(token)
+                return None
+            self.entries.move_to_end(token)
+        user = User(**data)
+        user._dirty.clear()
+        return user
+
+    def put(self, token: str, user: User):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[token] = (time.monotonic() + self.ttl, dict(user.__data__))
+            self.entries.move_to_end(token)
+            self.user_tokens.setdefault(user.id, set()).add(token)
+            while len(self.entries) > self.max_size:
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, token: str):
+        """Drop one token, caller holds the lock"""
+        entry = self.entries.pop(token, None)
+        if entry is not None:
+            tokens = self.user_tokens.get(entry[1]['id'])
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self.user_tokens[entry[1]['id']]
+
+    def evict_user(self, user_id: int):
+        with self.lock:
+            for token in list(self.user_tokens.get(user_id, ())):
+                self.discard(token)
+
+    def poll_due(self) -> bool:
+        return self.ttl > 0 and time.monotonic() - self.last_poll >= self.revocation_window
+
+    def poll_revocations(self):
+        """Apply the revocations other processes recorded since the last poll
+
+        Rows of the last AUTH_REVOCATION_OVERLAP seconds are read again: on
+        PostgreSQL a row with a lower id can commit after a higher one was read.
+        Rows already applied are skipped.
+        """
+        if not self.poll_due() or not self.poll_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_poll = time.monotonic()
+            if self.last_revocation_id is None:
+                # Nothing is cached before the first poll, only remember where the log ends
+                last = TokenRevocation.select(TokenRevocation.id).order_by(TokenRevocation.id.desc()).first()
+                self.last_revocation_id = last.id if last else 0
+                return
+
+            overlap_start = datetime.now() - timedelta(seconds=AUTH_REVOCATION_OVERLAP)
+            query = (TokenRevocation
+                     .select(TokenRevocation.id, TokenRevocation.user_id, TokenRevocation.created_at)
+                     .where((TokenRevocation.id > self.last_revocation_id)
+                            | (TokenRevocation.created_at >= overlap_start))
+                     .order_by(TokenRevocation.id))
+            for revocation in query:
+                if revocation.id in self.applied_revocations:
+                    continue
+                self.evict_user(revocation.user_id)
+                self.applied_revocations[revocation.id] = revocation.created_at
+                self.last_revocation_id = max(self.last_revocation_id, revocation.id)
+            # Rows older than the overlap are not read again
+            self.applied_revocations = {
+                revocation_id: created_at
+                for revocation_id, created_at in self.applied_revocations.items()
+                if created_at >= overlap_start
+            }
+        finally:
+            self.poll_lock.release()
+
+token_cache = TokenCache()
+
+def revoke_user_tokens(user_id: int):
+    """Stop accepting cached credentials of a user, in this process now and in the others within the window"""
+    token_cache.evict_user(user_id)
+    TokenRevocation.create(user_id=user_id)
+    # Older rows are no longer needed by any process
+    TokenRevocation.delete().where(TokenRevocation.created_at < datetime.now() - timedelta(days=1)).execute()
+
+def find_user(token: str) -> User:
+    """Load the user of a token and cache it, also applies pending revocations"""
+    with connection_scope():
+        token_cache.poll_revocations()
+        user = User.get(User.api_token == token)
+    token_cache.put(token, user)
+    return user
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)) -> User:
     """Get the current user from the API token"""
     token = credentials.credentials
-    
+
+    if not token_cache.poll_due():
+        user = token_cache.get(token)
+        if user is not None:
+            return user
+
     try:
-        user = User.get(User.api_token == token)
-        return user
+        # Database work stays off the event loop
+        return await run_in_threadpool(find_user, token)
     except User.DoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -35,6 +173,24 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+async def get_stream_user(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Security(optional_security)
+) -> User:
+    """Get the current user from the Authorization header or a ?token= parameter
+
+    For event streams: browsers' EventSource cannot set request headers.
+    """
+    if credentials is None:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return await get_current_user(credentials)
+
 async def get_admin_user(credentials: HTTPAuthorizationCredentials = Security(security)) -> User:
     """Get the current user and verify they are an admin"""
     user = await get_current_user(credentials)
@@ -0,0 +1,155 @@
+import os
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from peewee import IntegrityError, fn
+from backend.lib.db import Workflow, Job, JobBatch, JobPayload, User, write_transaction
+from backend.lib.events import TERMINAL_STATUSES
+from backend.lib.validation import json_type, validate_flow_inputs
+from backend.lib.workflow import idempotency_scope
+
+# Jobs per multi-row INSERT statement
+JOB_BATCH_CHUNK_SIZE = int(os.getenv('JOB_BATCH_CHUNK_SIZE', '500'))
+
+# Largest number of jobs in one batch submission
+JOB_BATCH_MAX_SIZE = int(os.getenv('JOB_BATCH_MAX_SIZE', '100000'))
+
+# Validation errors reported at most in one response
+MAX_REPORTED_ERRORS = 20
+
+UNPARSED = object()  # NDJSON line that is not valid JSON, already reported
+
+
+def parse_inputs(body: bytes, ndjson: bool) -> List[Dict[str, Any]]:
+    """Job inputs of a batch body, raises ValueError listing the invalid ones
+
+    JSON bodies are a list of inputs or {"inputs": [...]}, NDJSON bodies hold
+    one input per line (blank lines are skipped). Every input is an object.
+    """
+    errors = []
+    if ndjson:
+        inputs, labels = [], []
+        for number, line in enumerate(body.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                inputs.append(json.loads(line))
+            except ValueError as e:
+                errors.append(f"Line {number}: invalid JSON ({e})")
+                inputs.append(UNPARSED)
+            labels.append(f"Line {number}")
+    else:
+        try:
+            inputs = json.loads(body or b'null')
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON body: {e}")
+        if isinstance(inputs, dict):
+            inputs = inputs.get('inputs')
+        if not isinstance(inputs, list):
+            raise ValueError('Body must be a list of inputs or {"inputs": [...]}')
+        labels = [f"Input {index}" for index in range(len(inputs))]
+
+    if not inputs:
+        raise ValueError("No inputs to submit")
+    if len(inputs) > JOB_BATCH_MAX_SIZE:
+        raise ValueError(f"Too many inputs ({len(inputs)}), at most {JOB_BATCH_MAX_SIZE} per batch")
+
+    for label, value in zip(labels, inputs):
+        if value is not UNPARSED and not isinstance(value, dict):
+            errors.append(f"{label}: must be a JSON object, got {json_type(value)}")
+    if errors:
+        shown = "; ".join(errors[:MAX_REPORTED_ERRORS])
+        more = f" (and {len(errors) - MAX_REPORTED_ERRORS} more)" if len(errors) > MAX_REPORTED_ERRORS else ""
+        raise ValueError(f"{len(errors)} invalid inputs: {shown}{more}")
+    return inputs
+
+
+def batch_job_ids(batch_id: int) -> List[int]:
+    """Ids of a batch's jobs in submission order"""
+    return [job_id for job_id, in Job.select(Job.id).where(Job.batch == batch_id).order_by(Job.id).tuples()]
+
+
+def submit_batch(
+    workflow_id: int,
+    inputs: List[Dict[str, Any]],
+    job_name: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    user: Optional[User] = None,
+    priority: int = 0,
+    run_at: Optional[datetime] = None
+) -> Tuple[JobBatch, List[int], bool]:
+    """Create one pending job per input in a single transaction, returns (batch, job ids, created)
+
+    Jobs and their payloads go in with multi-row INSERTs of JOB_BATCH_CHUNK_SIZE
+    rows, so 10k jobs cost a few dozen statements instead of 20k transactions.
+    """
+    try:
+        workflow = Workflow.get(Workflow.id == workflow_id)
+    except Workflow.DoesNotExist:
+        raise ValueError(f"Workflow with ID {workflow_id} not found")
+    # One bad input rejects the whole batch before anything is written
+    inputs = validate_flow_inputs(workflow, inputs, MAX_REPORTED_ERRORS)
+
+    if idempotency_key:
+        existing = JobBatch.get_or_none(idempotency_scope(JobBatch, idempotency_key, workflow, user))
+        if existing:
+            return existing, batch_job_ids(existing.id), False
+
+    now = datetime.now()
+    row = {
+        'name': job_name or f"Job for {workflow.name}",
+        'workflow': workflow.id,
+        'user': user.id if user else None,
+        # Delayed jobs wait in the due-time queue until the worker promotes them
+        'status': 'scheduled' if run_at and run_at > now else 'pending',
+        'run_at': run_at,
+        'priority': priority,
+        'created_at': now,
+        'updated_at': now
+    }
+
+    try:
+        with write_transaction():
+            batch = JobBatch.create(
+                workflow=workflow, user=user, total=len(inputs), idempotency_key=idempotency_key, created_at=now
+            )
+            row['batch'] = batch.id
+            for start in range(0, len(inputs), JOB_BATCH_CHUNK_SIZE):
+                Job.insert_many([row] * len(inputs[start:start + JOB_BATCH_CHUNK_SIZE])).execute()
+
+            # Ids follow insertion order, which is the order of the inputs
+            job_ids = batch_job_ids(batch.id)
+            for start in range(0, len(inputs), JOB_BATCH_CHUNK_SIZE):
+                JobPayload.insert_many([
+                    {'job': job_id, 'input': input_data, 'output': {}}
+                    for job_id, input_data in zip(
+                        job_ids[start:start + JOB_BATCH_CHUNK_SIZE], inputs[start:start + JOB_BATCH_CHUNK_SIZE]
+                    )
+                ]).execute()
+        return batch, job_ids, True
+    except IntegrityError:
+        # A concurrent submission with the same key won the race
+        if idempotency_key:
+            batch = JobBatch.get(idempotency_scope(JobBatch, idempotency_key, workflow, user))
+            return batch, batch_job_ids(batch.id), False
+        raise
+
+
+def batch_progress(batch: JobBatch) -> Dict[str, Any]:
+    """Aggregate state of a batch: job counts per status"""
+    counts = dict(
+        Job.select(Job.status, fn.COUNT(Job.id))
+        .where(Job.batch == batch.id)
+        .group_by(Job.status)
+        .tuples()
+    )
+    finished = sum(count for status, count in counts.items() if status in TERMINAL_STATUSES)
+    return {
+        "id": batch.id,
+        "workflow_id": batch.workflow_id,
+        "total": batch.total,
+        "counts": counts,
+        "finished": finished,
+        "done": finished >= batch.total,
+        "created_at": batch.created_at
+    }
@@ -0,0 +1,92 @@
+import os
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Optional
+from backend.lib.db import DATABASE_PATH, IS_POSTGRES, db, connection_scope, create_tables, init_admin_user, User
+
+try:
+    import fcntl  # POSIX only, startup is not serialized without it
+except ImportError:
+    fcntl = None
+
+# Lock file serializing schema and admin user setup of processes starting together on this host (SQLite)
+BOOTSTRAP_LOCK_PATH = os.getenv('BOOTSTRAP_LOCK_PATH', DATABASE_PATH + '.bootstrap.lock')
+
+# Advisory lock key serializing the same setup across all hosts sharing a PostgreSQL database
+BOOTSTRAP_LOCK_KEY = 0x4A0B0002
+
+
+@contextmanager
+def bootstrap_lock(path: str = BOOTSTRAP_LOCK_PATH):
+    """Held by one process at a time: an advisory lock on PostgreSQL, a lock file on SQLite"""
+    if IS_POSTGRES:
+        # One transaction for the whole block (create_tables nests in it), the lock goes with its commit
+        with db:
+            db.execute_sql("SELECT pg_advisory_xact_lock(%s)", (BOOTSTRAP_LOCK_KEY,))
+            yield
+        return
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@lru_cache(maxsize=None)
+def latest_schema_version() -> int:
+    """Version of the newest migration shipped with this code"""
+    from backend.migrations import latest_version
+
+    return latest_version()
+
+
+def schema_is_current() -> bool:
+    """Whether the database has every migration of this code applied"""
+    from backend.migrations import current_version
+
+    return current_version() >= latest_schema_version()
+
+
+def ensure_schema() -> bool:
+    """Create tables and run migrations unless the schema is current, returns whether it did
+
+    Runs under the bootstrap lock, so processes starting together wait for the
+    first one instead of racing on CREATE TABLE and migrations.
+    """
+    with connection_scope():
+        # Cheap check first: a current schema needs no lock and no table checks
+        if schema_is_current():
+            return False
+        with bootstrap_lock():
+            if schema_is_current():
+                return False
+            create_tables()
+            return True
+
+
+def bootstrap() -> User:
+    """Schema and admin user setup, done once before serving"""
+    started = time.perf_counter()
+    changed = ensure_schema()
+    with connection_scope(), bootstrap_lock():
+        admin_user = init_admin_user()
+    print(f"Bootstrap done in {(time.perf_counter() - started) * 1000:.0f}ms"
+          f"{'' if changed else ' (schema already current)'}")
+    return admin_user
+
+
+def is_ready() -> Optional[str]:
+    """None when this process can serve requests, else the reason it cannot"""
+    try:
+        with connection_scope():
+            db.execute_sql('SELECT 1')
+            if not schema_is_current():
+                return f"schema is behind version {latest_schema_version()}"
+    except Exception as e:
+        return f"database unavailable: {e}"
+    return None
@@ -0,0 +1,141 @@
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from backend.lib.db import Connector, Node, Workflow, write_transaction
+from backend.lib.serializers import json_bytes, serialize
+
+# Definition kinds in dependency order: nodes use connectors, workflows use nodes
+KINDS = {"connector": Connector, "node": Node, "workflow": Workflow}
+
+# Rows per export query
+EXPORT_CHUNK_SIZE = 500
+
+# How imported records find the row they update: same name, same id, or never (always create)
+MATCH_MODES = ("name", "id", "none")
+
+# Node reference in a workflow module path, see WorkflowExecutor.run_module
+NODE_PATH = re.compile(r"^node/(\d+)(_node_id)?$")
+
+# (kind, id in the exporting environment, column values)
+ImportRecord = Tuple[str, Optional[int], Dict[str, Any]]
+
+
+def export_chunk(kind: str, after_id: int, limit: int = EXPORT_CHUNK_SIZE) -> Tuple[bytes, Optional[int]]:
+    """NDJSON lines of the next rows of a kind after `after_id`, and the id to continue from (None when done)"""
+    model = KINDS[kind]
+    rows = list(model.select().where(model.id > after_id).order_by(model.id).limit(limit))
+    lines = b"".join(json_bytes({"kind": kind, **serialize(kind, row)}) + b"\n" for row in rows)
+    return lines, rows[-1].id if len(rows) == limit else None
+
+
+def existing_ids(model, ids: Set[int]) -> Set[int]:
+    """The subset of `ids` that exist in a table"""
+    if not ids:
+        return set()
+    return {row_id for row_id, in model.select(model.id).where(model.id.in_(list(ids))).tuples()}
+
+
+def node_references(value: Any) -> Set[int]:
+    """Node ids referenced by the module paths of a workflow definition"""
+    if isinstance(value, dict):
+        found = set()
+        for key, item in value.items():
+            match = NODE_PATH.match(item) if key == "path" and isinstance(item, str) else None
+            if match:
+                found.add(int(match.group(1)))
+            else:
+                found |= node_references(item)
+        return found
+    if isinstance(value, list):
+        return set().union(*(node_references(item) for item in value)) if value else set()
+    return set()
+
+
+def remap_node_paths(value: Any, node_ids: Dict[int, int]) -> Any:
+    """Copy of a workflow definition with node/<id> paths pointing to the imported nodes"""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            match = NODE_PATH.match(item) if key == "path" and isinstance(item, str) else None
+            if match and int(match.group(1)) in node_ids:
+                result[key] = f"node/{node_ids[int(match.group(1))]}{match.group(2) or ''}"
+            else:
+                result[key] = remap_node_paths(item, node_ids)
+        return result
+    if isinstance(value, list):
+        return [remap_node_paths(item, node_ids) for item in value]
+    return value
+
+
+def match_targets(model, items: List[ImportRecord], match: str) -> Dict[Any, int]:
+    """Existing rows the records of one kind update, keyed by name or id"""
+    if match == "name":
+        names = [data["name"] for _, _, data in items]
+        duplicates = [name for name, count in Counter(names).items() if count > 1]
+        if duplicates:
+            raise ValueError(f"{model._meta.table_name} names appear more than once in the import: {duplicates[:10]}")
+        rows = list(model.select(model.id, model.name).where(model.name.in_(names)).tuples())
+        ambiguous = [name for name, count in Counter(name for _, name in rows).items() if count > 1]
+        if ambiguous:
+            raise ValueError(
+                f"Several existing {model._meta.table_name}s are named {ambiguous[:10]}, import with match=id or rename them"
+            )
+        return {name: row_id for row_id, name in rows}
+    if match == "id":
+        return {row_id: row_id for row_id in existing_ids(model, {source_id for _, source_id, _ in items if source_id})}
+    return {}
+
+
+def import_definitions(records: List[ImportRecord], match: str = "name") -> Dict[str, Any]:
+    """Create or update connectors, nodes and workflows in one transaction (all or nothing)
+
+    References are resolved in memory: a node's connector_id and a workflow's
+    node/<id> paths that point to a record of the import are rewritten to the
+    id it gets here; references to records outside the import must exist here
+    and are kept as they are.
+    """
+    by_kind = {kind: [record for record in records if record[0] == kind] for kind in KINDS}
+    id_map: Dict[str, Dict[int, int]] = {kind: {} for kind in KINDS}
+    summary = {kind: {"created": 0, "updated": 0} for kind in KINDS}
+
+    with write_transaction():
+        now = datetime.now()
+        for kind, model in KINDS.items():
+            items = by_kind[kind]
+            if not items:
+                continue
+
+            # References outside the import, checked with one query per kind
+            if kind == "node":
+                outside = {data["connector_id"] for _, _, data in items} - set(id_map["connector"])
+                missing = outside - existing_ids(Connector, outside)
+            elif kind == "workflow":
+                outside = set().union(*(node_references(data["nodes"]) for _, _, data in items)) - set(id_map["node"])
+                missing = outside - existing_ids(Node, outside)
+            else:
+                missing = set()
+            if missing:
+                target = "connectors" if kind == "node" else "nodes"
+                raise ValueError(f"{kind}s reference {target} {sorted(missing)[:10]} that are neither imported nor present")
+
+            targets = match_targets(model, items, match)
+            for _, source_id, data in items:
+                values = dict(data)
+                if kind == "node":
+                    connector_id = values.pop("connector_id")
+                    values["connector"] = id_map["connector"].get(connector_id, connector_id)
+                elif kind == "workflow":
+                    values["nodes"] = remap_node_paths(values["nodes"], id_map["node"])
+
+                target_id = targets.get(values["name"] if match == "name" else source_id)
+                if target_id is not None:
+                    model.update(**values, updated_at=now).where(model.id == target_id).execute()
+                    summary[kind]["updated"] += 1
+                else:
+                    target_id = model.insert(**values, created_at=now, updated_at=now).execute()
+                    summary[kind]["created"] += 1
+                if source_id is not None:
+                    id_map[kind][source_id] = target_id
+
+    return {**summary, "ids": id_map}
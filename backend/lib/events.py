@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from backend.lib.db import JobEvent, connection_scope
+from backend.lib.job_writer import job_writer
+
+# Seconds between polls of the job_event table for events published by other processes
+JOB_EVENT_POLL_INTERVAL = float(os.getenv('JOB_EVENT_POLL_INTERVAL', '0.25'))
+
+# Seconds of recent events read again on every poll, catching ids that committed out of order
+JOB_EVENT_POLL_OVERLAP = float(os.getenv('JOB_EVENT_POLL_OVERLAP', '5'))
+
+# Seconds between keep-alive comments on idle event streams
+JOB_EVENT_KEEPALIVE = float(os.getenv('JOB_EVENT_KEEPALIVE', '15'))
+
+# Events buffered per subscriber before a slow client starts losing them
+JOB_EVENT_QUEUE_SIZE = 1000
+
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+# Identifies this process in job_event rows, so its own events are not relayed back
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class EventBus:
+    """In-process pub/sub of job events, each subscriber is an asyncio queue
+
+    publish() may be called from any thread: events are handed to the
+    subscriber's event loop with call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, job_id: int) -> asyncio.Queue:
+        """Queue receiving the events of a job, call from the consuming event loop"""
+        queue = asyncio.Queue(maxsize=JOB_EVENT_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.setdefault(job_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, job_id: int, queue: asyncio.Queue):
+        with self.lock:
+            subscribers = self.subscribers.get(job_id, set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self.subscribers.pop(job_id, None)
+
+    def job_ids(self) -> List[int]:
+        """Jobs with at least one subscriber"""
+        with self.lock:
+            return list(self.subscribers)
+
+    def publish(self, job_id: int, event: dict):
+        """Deliver an event to the local subscribers of a job"""
+        with self.lock:
+            subscribers = list(self.subscribers.get(job_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self.deliver, queue, event)
+            except RuntimeError:
+                pass  # Subscriber's loop is closed
+
+    @staticmethod
+    def deliver(queue: asyncio.Queue, event: dict):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass  # Slow client, drop rather than grow without bound
+
+
+class EventRelay:
+    """Relays events published by other processes (worker, other API workers)
+
+    The job_event table is the broker: publishers append rows through the
+    group-commit writer, and while this process has subscribers it polls for
+    the rows of the subscribed jobs. Each job keeps its own starting point and
+    the ids already relayed. Every poll also reads back the last
+    JOB_EVENT_POLL_OVERLAP seconds, because ids can commit out of order on
+    PostgreSQL. Rows already seen are skipped.
+    """
+
+    def __init__(self, bus: EventBus, poll_interval: float = JOB_EVENT_POLL_INTERVAL):
+        self.bus = bus
+        self.poll_interval = poll_interval
+        # Job id -> (job_event id of its first snapshot, ids relayed since), only touched on the event loop
+        self.jobs: Dict[int, Tuple[int, Set[int]]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def ensure_started(self, job_id: int, since_id: int):
+        """Relay the events of a job newer than `since_id`, start polling if needed
+
+        `since_id` is the newest job_event id when the subscriber read its
+        snapshot: nothing published after the snapshot is skipped.
+        """
+        if job_id in self.jobs:
+            first_id, seen = self.jobs[job_id]
+            self.jobs[job_id] = (min(first_id, since_id), seen)
+        else:
+            self.jobs[job_id] = (since_id, set())
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                subscribed = set(self.bus.job_ids())
+                for job_id in [job_id for job_id in self.jobs if job_id not in subscribed]:
+                    del self.jobs[job_id]
+                if not subscribed:
+                    break
+                if self.jobs:
+                    after_id = min(max(seen, default=first_id) for first_id, seen in self.jobs.values())
+                    try:
+                        rows = await loop.run_in_executor(None, self.fetch, list(self.jobs), after_id)
+                    except Exception as e:
+                        print(f"Job event poll failed: {str(e)}")
+                        rows = []
+                    for row_id, job_id, event in rows:
+                        if job_id not in self.jobs:
+                            continue
+                        first_id, seen = self.jobs[job_id]
+                        if row_id > first_id and row_id not in seen:
+                            seen.add(row_id)
+                            self.bus.publish(job_id, event)
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            self.jobs.clear()
+
+    def fetch(self, job_ids: List[int], after_id: int) -> List[Tuple[int, int, dict]]:
+        """(id, job id, event) of other processes' events newer than `after_id` or the overlap window"""
+        overlap_start = datetime.now() - timedelta(seconds=JOB_EVENT_POLL_OVERLAP)
+        with connection_scope():
+            rows = (
+                JobEvent.select(JobEvent.id, JobEvent.job_id, JobEvent.event)
+                .where(
+                    ((JobEvent.id > after_id) | (JobEvent.created_at >= overlap_start)) &
+                    (JobEvent.job_id.in_(job_ids)) &
+                    (JobEvent.origin != ORIGIN)
+                )
+                .order_by(JobEvent.id)
+                .tuples()
+            )
+            return list(rows)
+
+
+def latest_event_id() -> int:
+    """Newest job_event id, the starting point of a new subscription"""
+    newest = JobEvent.select(JobEvent.id).order_by(JobEvent.id.desc()).first()
+    return newest.id if newest else 0
+
+
+event_bus = EventBus()
+event_relay = EventRelay(event_bus)
+
+
+def publish_event(job_id: int, type: str, **data) -> dict:
+    """Publish a job event to local subscribers and, via job_event, to other processes"""
+    event = {'type': type, 'job_id': job_id, 'time': time.time(), **data}
+    event_bus.publish(job_id, event)
+    job_writer.add_event(job_id, ORIGIN, event)
+    return event
+
+
+def format_sse(event: dict) -> str:
+    """Server-sent event frame, the event type is the SSE event name"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def is_terminal(event: dict) -> bool:
+    return event['type'] == 'job' and event.get('status') in TERMINAL_STATUSES
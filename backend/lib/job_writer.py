@@ -0,0 +1,107 @@
+import os
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from backend.lib.db import Job, JobEvent, connection_scope, save_payload, write_transaction
+
+# Seconds between group commits of buffered job state
+JOB_WRITE_FLUSH_INTERVAL = float(os.getenv('JOB_WRITE_FLUSH_INTERVAL', '0.25'))
+
+# Fields stored in the job_payload table instead of the job row
+PAYLOAD_FIELDS = ('input', 'output', 'trace')
+
+# Seconds job events are kept for other processes to relay
+JOB_EVENT_TTL = float(os.getenv('JOB_EVENT_TTL', '3600'))
+
+
+class JobStateWriter:
+    """Write-behind buffer for job state transitions
+
+    Updates from all running jobs are merged per job and written in one
+    transaction every flush interval, and each UPDATE only touches the columns
+    that changed. Durable updates (terminal states) flush synchronously before
+    returning.
+    """
+
+    def __init__(self, flush_interval: float = JOB_WRITE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.pending: Dict[int, Dict[str, Any]] = {}
+        self.events: List[dict] = []  # job_event rows
+        self.pruned_at = 0.0
+        self.lock = threading.Lock()  # Guards self.pending and self.events
+        self.flush_lock = threading.Lock()  # One group commit at a time
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def update(self, job_id: int, durable: bool = False, **fields):
+        """Buffer new column values for a job, durable updates are committed before returning"""
+        with self.lock:
+            self.pending.setdefault(job_id, {}).update(fields)
+
+        if durable:
+            self.flush()
+        else:
+            self.start()
+
+    def add_event(self, job_id: int, origin: str, event: dict):
+        """Buffer a job event row, written with the next group commit"""
+        with self.lock:
+            self.events.append({'job_id': job_id, 'origin': origin, 'event': event, 'created_at': datetime.now()})
+        self.start()
+
+    def start(self):
+        """Start the background flusher thread if needed"""
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.run, name='job-state-writer', daemon=True)
+                    self.thread.start()
+
+    def run(self):
+        """Background flusher loop"""
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Job state flush failed, will retry: {str(e)}")
+
+    def flush(self):
+        """Commit every buffered update in a single transaction"""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+                events, self.events = self.events, []
+            if not batch and not events:
+                return
+
+            try:
+                now = datetime.now()
+                with connection_scope(), write_transaction():
+                    for job_id, fields in batch.items():
+                        columns = {k: v for k, v in fields.items() if k not in PAYLOAD_FIELDS}
+                        payload = {k: v for k, v in fields.items() if k in PAYLOAD_FIELDS}
+                        Job.update(**columns, updated_at=now).where(Job.id == job_id).execute()
+                        if payload:
+                            save_payload(job_id, **payload)
+                    if events:
+                        JobEvent.insert_many(events).execute()
+                    if time.monotonic() - self.pruned_at > 60:
+                        JobEvent.delete().where(JobEvent.created_at < now - timedelta(seconds=JOB_EVENT_TTL)).execute()
+                        self.pruned_at = time.monotonic()
+            except Exception:
+                # Put the batch back without overwriting newer values buffered meanwhile
+                with self.lock:
+                    for job_id, fields in batch.items():
+                        self.pending[job_id] = {**fields, **self.pending.get(job_id, {})}
+                    self.events = events + self.events
+                raise
+
+
+job_writer = JobStateWriter()
+
+# Do not lose buffered transitions when the process exits normally
+atexit.register(job_writer.flush)
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import socket
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds between snapshots of this process's metrics written for the /metrics endpoint
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# Directory of the per-process snapshots, shared by the API and worker processes (default: next to the database)
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+
+# Snapshots of processes gone for this long are deleted (their counters stop being reported)
+METRICS_FILE_TTL = float(os.getenv('METRICS_FILE_TTL', '86400'))
+
+# Latency buckets in seconds, from a fast query up to the 5 minute node timeout
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REGISTRY: List['Metric'] = []
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric:
+    """Base of the metric types: values are kept in one dict per thread
+
+    Each thread only ever writes its own shard, so recording takes no lock and
+    loses no update; collect() merges the shards.
+    """
+    type = ''
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.local = threading.local()
+        self.shards: List[dict] = []
+        self.shards_lock = threading.Lock()  # Taken once per thread, when its shard is created
+        REGISTRY.append(self)
+
+    def shard(self) -> dict:
+        try:
+            return self.local.values
+        except AttributeError:
+            values = self.local.values = {}
+            with self.shards_lock:
+                self.shards.append(values)
+            return values
+
+    def collect(self) -> Dict[LabelValues, object]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        values = self.shard()
+        values[label_values] = values.get(label_values, 0.0) + amount
+
+    def collect(self) -> Dict[LabelValues, float]:
+        merged = {}
+        for shard in list(self.shards):
+            for key, value in shard.copy().items():
+                merged[key] = merged.get(key, 0.0) + value
+        return merged
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values: str):
+        values = self.shard()
+        state = values.get(label_values)
+        if state is None:
+            # Count per bucket (not cumulative, the last one is +Inf), then the sum
+            state = values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def collect(self) -> Dict[LabelValues, list]:
+        merged = {}
+        for shard in list(self.shards):
+            for key, state in shard.copy().items():
+                merged[key] = merge_states(merged.get(key), list(state))
+        return merged
+
+
+class Gauge(Metric):
+    """Current value, set directly or read from `callback` when collected
+
+    Shared gauges are summed over the live processes (thread pool usage);
+    the others are only reported by the process serving /metrics (queue depth).
+    """
+    type = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+        shared: bool = True
+    ):
+        super().__init__(name, help, labels)
+        self.values: Dict[LabelValues, float] = {}
+        self.callbacks = [callback] if callback else []
+        self.shared = shared
+
+    def set(self, value: float, *label_values: str):
+        self.values[label_values] = value
+
+    def add_callback(self, callback: Callable[[], Dict[LabelValues, float]]):
+        self.callbacks.append(callback)
+
+    def collect(self) -> Dict[LabelValues, float]:
+        values = dict(self.values)
+        for callback in self.callbacks:
+            try:
+                values.update(callback())
+            except Exception as e:
+                print(f"Metric {self.name} callback failed: {str(e)}")
+        return values
+
+
+def merge_states(left: Optional[list], right: list) -> list:
+    if left is None:
+        return right
+    return [a + b for a, b in zip(left, right)]
+
+
+# Execution pipeline
+NODE_SECONDS = Histogram('apiflow_node_duration_seconds', 'Node run latency', ('connector_id', 'node_id', 'outcome'))
+UPSTREAM_RESPONSES = Counter(
+    'apiflow_upstream_responses_total', 'Upstream HTTP responses by status code (error: no response)',
+    ('connector_id', 'status')
+)
+WORKFLOW_SECONDS = Histogram('apiflow_workflow_duration_seconds', 'Workflow run duration', ('workflow_id', 'status'))
+MODULE_SECONDS = Histogram('apiflow_module_duration_seconds', 'Workflow module duration', ('module_type', 'outcome'))
+MODULE_RETRIES = Counter('apiflow_module_retries_total', 'Module retry attempts', ('workflow_id',))
+
+# Queue and worker
+CLAIM_SECONDS = Histogram('apiflow_job_claim_duration_seconds', 'Worker job claim latency')
+JOBS_CLAIMED = Counter('apiflow_jobs_claimed_total', 'Jobs claimed by workers')
+QUEUE_DEPTH = Gauge('apiflow_queue_depth', 'Jobs waiting or running', ('status',), shared=False)
+
+# Resources
+THREADPOOL_THREADS = Gauge('apiflow_threadpool_threads', 'Thread pool size', ('pool',))
+THREADPOOL_BUSY = Gauge('apiflow_threadpool_busy', 'Threads running a task', ('pool',))
+THREADPOOL_QUEUED = Gauge('apiflow_threadpool_queued', 'Tasks waiting for a thread', ('pool',))
+DB_QUERY_SECONDS = Histogram('apiflow_db_query_duration_seconds', 'Database statement execution time', ('statement',))
+
+
+def metrics_dir() -> str:
+    if METRICS_DIR:
+        return METRICS_DIR
+    from backend.lib.db import DATABASE_PATH
+
+    return os.path.join(os.path.dirname(DATABASE_PATH), 'metrics')
+
+
+def process_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def snapshot() -> dict:
+    """Metrics of this process, JSON serializable"""
+    return {
+        metric.name: [[list(key), value] for key, value in metric.collect().items()]
+        for metric in REGISTRY
+        if not (isinstance(metric, Gauge) and not metric.shared)
+    }
+
+
+def write_snapshot():
+    """Write this process's metrics where the process serving /metrics reads them"""
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{process_name()}.json")
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'time': time.time(), 'metrics': snapshot()}, f)
+    os.replace(path + '.tmp', path)
+
+
+def read_snapshots() -> List[dict]:
+    """Snapshots written by the other processes, deleting the expired ones"""
+    directory = metrics_dir()
+    own = f"{process_name()}.json"
+    snapshots = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return snapshots
+    for name in names:
+        if not name.endswith('.json') or name == own:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # Being replaced or removed
+        if time.time() - data.get('time', 0) > METRICS_FILE_TTL:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        snapshots.append(data)
+    return snapshots
+
+
+writer_thread = None
+
+
+def start_metrics_writer():
+    """Write this process's snapshot every METRICS_FLUSH_INTERVAL seconds and at exit"""
+    global writer_thread
+    if writer_thread is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                write_snapshot()
+            except Exception as e:
+                print(f"Metrics snapshot failed: {str(e)}")
+
+    writer_thread = threading.Thread(target=run, name='metrics-writer', daemon=True)
+    writer_thread.start()
+    atexit.register(write_snapshot)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics() -> str:
+    """Prometheus text format of the metrics of all processes
+
+    Counters and histograms are summed over every snapshot (and this process's
+    live values), shared gauges only over the snapshots of live processes.
+    """
+    fresh_after = time.time() - 3 * METRICS_FLUSH_INTERVAL
+    others = read_snapshots()
+    lines = []
+    for metric in REGISTRY:
+        merged = dict(metric.collect())
+        for data in others:
+            if isinstance(metric, Gauge) and (not metric.shared or data['time'] < fresh_after):
+                continue
+            for key, value in data['metrics'].get(metric.name, []):
+                key = tuple(key)
+                if isinstance(metric, Histogram):
+                    merged[key] = merge_states(merged.get(key), value)
+                else:
+                    merged[key] = merged.get(key, 0) + value
+
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for key, value in sorted(merged.items()):
+            if isinstance(metric, Histogram):
+                cumulative = 0
+                for bound, count in zip(list(metric.buckets) + ['+Inf'], value[:-1]):
+                    cumulative += count
+                    le = 'le="{}"'.format(bound if bound == '+Inf' else format_value(bound))
+                    lines.append(f"{metric.name}_bucket{format_labels(metric.labels, key, le)} {cumulative}")
+                lines.append(f"{metric.name}_sum{format_labels(metric.labels, key)} {format_value(value[-1])}")
+                lines.append(f"{metric.name}_count{format_labels(metric.labels, key)} {cumulative}")
+            else:
+                lines.append(f"{metric.name}{format_labels(metric.labels, key)} {format_value(value)}")
+    return '\n'.join(lines) + '\n'
@@ -2,57 +2,42 @@ import json
 import requests
 import re
 import os
+import time
+import asyncio
 import logging
-from typing import Any, Dict, List
-from backend.lib.db import Node, Connector
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from backend.lib.db import Node, Connector, connection_scope
+from backend.lib.trace import span
+from backend.lib.profiling import attribute_job_frames
+from backend.lib.validation import node_input_preparer
+from backend.lib.traffic import traffic_recorder
+from backend.lib.metrics import NODE_SECONDS, UPSTREAM_RESPONSES, THREADPOOL_BUSY, THREADPOOL_QUEUED, THREADPOOL_THREADS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Node runs block on HTTP for up to 5 minutes, they share one bounded pool per process
+NODE_EXECUTOR_THREADS = int(os.getenv('NODE_EXECUTOR_THREADS', '32'))
+node_executor = ThreadPoolExecutor(max_workers=NODE_EXECUTOR_THREADS, thread_name_prefix='node-run')
+node_runs_active = 0  # Node runs in node_executor threads
+node_runs_lock = threading.Lock()  # += / -= is a separate load, add and store: pool threads would lose updates
+
+THREADPOOL_THREADS.set(NODE_EXECUTOR_THREADS, 'node')
+THREADPOOL_BUSY.add_callback(lambda: {('node',): node_runs_active})
+THREADPOOL_QUEUED.add_callback(lambda: {('node',): node_executor._work_queue.qsize()})
+
 class NodeExecutor:
     def __init__(self, node: Node):
         self.node = node
         self.connector = node.connector
     
     def prepare_input(self, provided_input: Dict[str, Any]) -> Dict[str, Any]:
-        """Prepare input by merging provided values with defaults"""
-        prepared = {}
-        
-        for input_def in self.node.input:
-            name = input_def['name']
-            input_type = input_def.get('type', 'string')
-            
-            # Check if value is provided and not empty
-            if name in provided_input and provided_input[name] != '':
-                value = provided_input[name]
-                
-                # Type conversion for specific types
-                if input_type == 'boolean':
-                    if isinstance(value, str):
-                        value = value.lower() in ('true', '1', 'yes', 'on')
-                    else:
-                        value = bool(value)
-                elif input_type == 'integer':
-                    if isinstance(value, str) and value.isdigit():
-                        value = int(value)
-                elif input_type == 'number':
-                    if isinstance(value, str):
-                        try:
-                            value = float(value)
-                        except ValueError:
-                            pass
-                
-                prepared[name] = value
-            elif input_def.get('required', False):
-                if 'default' in input_def:
-                    prepared[name] = input_def['default']
-                else:
-                    raise ValueError(f"Required input '{name}' not provided and no default value")
-            elif 'default' in input_def:
-                prepared[name] = input_def['default']
-        
-        return prepared
+        """Prepare input by merging provided values with defaults, compiled once per node version"""
+        return node_input_preparer(self.node)(provided_input)
     
     def get_nested_value(self, data: Any, path: str) -> Any:
         """Get a nested value from data using dot notation (e.g., 'messages.0.content.0')"""
@@ -136,11 +121,8 @@ class NodeExecutor:
         logger.info(f"Building URL: base_url='{base_url}', node_path='{self.node.path}', full_url='{full_url}'")
         return full_url
     
-    def execute(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute the node with given input"""
-        logger.info(f"Executing node '{self.node.name}' (ID: {self.node.id})")
-        logger.info(f"Input data: {input_data}")
-        
+    def render_request(self, input_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any], Any]:
+        """URL, headers and body of the request for the given input"""
         # Prepare input
         prepared_input = self.prepare_input(input_data)
         logger.info(f"Prepared input: {prepared_input}")
@@ -174,17 +156,38 @@ class NodeExecutor:
         logger.info(f"Request method: {self.connector.method}")
         logger.info(f"Request URL: {url}")
         logger.info(f"Request body: {body}")
+        return url, headers, body
+    
+    def execute(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute the node with given input"""
+        logger.info(f"Executing node '{self.node.name}' (ID: {self.node.id})")
+        logger.info(f"Input data: {input_data}")
+        
+        with span('render'):
+            url, headers, body = self.render_request(input_data)
         
         # Make request
+        started = time.perf_counter()
         try:
-            response = requests.request(
-                method=self.connector.method,
-                url=url,
-                headers=headers,
-                json=body if body else None,
-                timeout=300  # 5 minutes timeout
+            with span('http', method=self.connector.method, url=url.split('?')[0]) as http:
+                response = requests.request(
+                    method=self.connector.method,
+                    url=url,
+                    headers=headers,
+                    json=body if body else None,
+                    timeout=300  # 5 minutes timeout
+                )
+                http.update(
+                    status=response.status_code,
+                    bytes_out=len(response.request.body or b''),
+                    bytes_in=len(response.content)
+                )
+            traffic_recorder.upstream(
+                self.connector.id, self.node.id, response.status_code, time.perf_counter() - started,
+                http['bytes_out'], http['bytes_in']
             )
             
+            UPSTREAM_RESPONSES.inc(str(self.connector.id), str(response.status_code))
             logger.info(f"Response status code: {response.status_code}")
             logger.info(f"Response headers: {dict(response.headers)}")
             
@@ -219,6 +222,9 @@ class NodeExecutor:
             return output
             
         except requests.exceptions.RequestException as e:
+            if e.response is None:
+                UPSTREAM_RESPONSES.inc(str(self.connector.id), 'error')
+                traffic_recorder.upstream(self.connector.id, self.node.id, 'error', time.perf_counter() - started, 0, 0)
             logger.error(f"Request failed: {str(e)}")
             logger.error(f"Response status: {getattr(e.response, 'status_code', 'N/A')}")
             logger.error(f"Response text: {getattr(e.response, 'text', 'N/A')}")
@@ -231,8 +237,40 @@ class NodeExecutor:
 def execute_node(node_id: int, input_data: Dict[str, Any]) -> Dict[str, Any]:
     """Execute a node by ID"""
     try:
-        node = Node.get(Node.id == node_id)
-        executor = NodeExecutor(node)
-        return executor.execute(input_data)
+        # Runs in thread pools: load the node on this thread's own connection
+        with connection_scope():
+            node = Node.get(Node.id == node_id)
+            executor = NodeExecutor(node)  # Loads the connector
     except Node.DoesNotExist:
         raise ValueError(f"Node with ID {node_id} not found")
+
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        output = executor.execute(input_data)
+        outcome = 'ok'
+        return output
+    finally:
+        NODE_SECONDS.observe(time.perf_counter() - start, str(node.connector_id), str(node_id), outcome)
+
+def run_pooled_node(node_id: int, input_data: Dict[str, Any], job_id: Optional[int] = None) -> Dict[str, Any]:
+    """execute_node counted in the node pool's busy threads (job_id names the job for profiles)"""
+    global node_runs_active
+    with node_runs_lock:
+        node_runs_active += 1
+    try:
+        return execute_node(node_id, input_data)
+    finally:
+        with node_runs_lock:
+            node_runs_active -= 1
+
+async def execute_node_async(node_id: int, input_data: Dict[str, Any], job_id: Optional[int] = None) -> Dict[str, Any]:
+    """Execute a node in the node pool without blocking the event loop"""
+    with span('node', node_id=node_id):
+        # The pool thread records its spans under this one
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            node_executor, context.run, run_pooled_node, node_id, input_data, job_id
+        )
+
+attribute_job_frames(run_pooled_node, lambda local_vars: local_vars['job_id'])
@@ -0,0 +1,82 @@
+import os
+import json
+import base64
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from peewee import DateTimeField, Field, Tuple as RowValue
+
+# Largest page a list endpoint returns
+MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '1000'))
+
+# Default page size of the job listings (definitions are returned whole unless a limit is given)
+DEFAULT_JOB_PAGE_SIZE = int(os.getenv('API_JOB_PAGE_SIZE', '100'))
+
+def encode_cursor(values: list) -> str:
+    """Opaque cursor holding the sort key of the last row of a page"""
+    data = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, order: List[Field]) -> list:
+    """Sort key values stored in a cursor"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(order):
+            raise ValueError(cursor)
+        return [
+            datetime.fromisoformat(value) if isinstance(field, DateTimeField) else value
+            for value, field in zip(values, order)
+        ]
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_fields(fields: Optional[str], field_map: Dict[str, tuple]) -> List[str]:
+    """Validate a fields= parameter (comma separated), all fields when it is empty"""
+    if not fields:
+        return list(field_map.keys())
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in field_map]
+    if unknown:
+        raise ValueError(f"Unknown fields {unknown}. Available: {list(field_map.keys())}")
+    return names
+
+
+def select_columns(field_map: Dict[str, tuple], names: List[str], required: List[Field]) -> List[Field]:
+    """Columns to select for the requested fields, plus the ones the cursor needs"""
+    columns = list(required)
+    for name in names:
+        for column in field_map[name][0]:
+            # Identity check: == on peewee fields builds an expression
+            if not any(column is selected for selected in columns):
+                columns.append(column)
+    return columns
+
+
+def keyset_page(
+    query,
+    order: List[Field],
+    cursor: Optional[str],
+    limit: Optional[int],
+    descending: bool = False
+) -> Tuple[list, Optional[str]]:
+    """One page of a query and the cursor of the next page (None on the last page)
+
+    `order` must be unique, so it ends with the primary key. The next page
+    starts after the last row's key instead of using OFFSET, so every page
+    costs the same index range scan however deep the client pages.
+    """
+    if cursor:
+        key = RowValue(*order)
+        bound = RowValue(*[field.db_value(value) for field, value in zip(order, decode_cursor(cursor, order))])
+        query = query.where(key < bound if descending else key > bound)
+    query = query.order_by(*[field.desc() if descending else field for field in order])
+
+    if limit is None:
+        return list(query), None
+
+    rows = list(query.limit(limit + 1))
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], field.name) for field in order])
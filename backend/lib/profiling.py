@@ -0,0 +1,182 @@
+import os
+import io
+import re
+import sys
+import json
+import time
+import pstats
+import signal
+import socket
+import asyncio
+import cProfile
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Optional
+
+# Longest profiling window, so a forgotten profile cannot slow a process down for long
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '300'))
+
+# Milliseconds between two stack samples
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+
+# Where signalled processes read request.json and write their profiles (default: profiles/ next to the database)
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')
+
+PROFILE_MODES = ('sampling', 'deterministic')
+
+# Leaf frames of threads waiting on a lock, queue, socket or select, left out unless idle stacks are asked for
+IDLE_LEAVES = (
+    'threading.py:wait', 'selectors.py:select', 'queue.py:get', 'thread.py:_worker',
+    'socket.py:readinto', 'ssl.py:read', 'socketserver.py:serve_forever', 'backend/lib/metrics.py:run'
+)
+
+# Code objects whose frames tell the job a stack works for, mapped to a function of the frame's locals
+JOB_FRAMES: Dict[Any, Callable[[dict], Optional[int]]] = {}
+
+# Source root, stripped from frame labels
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+profile_lock = threading.Lock()  # One profile at a time per process
+signal_tasks = set()  # Profiles started by SIGUSR2, referenced until done
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def attribute_job_frames(function: Callable, job_id: Callable[[dict], Optional[int]]):
+    """Samples with a frame of `function` on their stack belong to the job `job_id(frame locals)` returns"""
+    JOB_FRAMES[function.__code__] = job_id
+
+
+def frame_label(code) -> str:
+    filename = code.co_filename
+    if 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep)[-1]
+    elif filename.startswith(ROOT + os.sep):
+        filename = os.path.relpath(filename, ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f"{filename}:{code.co_name}"
+
+
+def sample_stacks(seconds: float, interval: float, job_id: Optional[int] = None, idle: bool = False) -> Counter:
+    """Count the Python stacks of every other thread, sampled every `interval` seconds
+
+    Only runs while profiling: reading frames from this thread costs the
+    sampled threads nothing but the GIL hand-off.
+    """
+    stacks = Counter()
+    own = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        # Pool threads are numbered (node-run_3): one root per pool merges their stacks
+        names = {thread.ident: re.sub(r'_\d+$', '', thread.name) for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            matched = job_id is None
+            while frame is not None:
+                code = frame.f_code
+                if not matched and code in JOB_FRAMES:
+                    try:
+                        matched = JOB_FRAMES[code](frame.f_locals) == job_id
+                    except Exception:
+                        pass
+                labels.append(frame_label(code))
+                frame = frame.f_back
+            if not matched or not labels or (not idle and labels[0].endswith(IDLE_LEAVES)):
+                continue
+            labels.append(names.get(ident, str(ident)).replace(';', ':'))
+            stacks[';'.join(reversed(labels))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def collapsed(stacks: Counter) -> str:
+    """Collapsed stack format (flamegraph.pl, speedscope, inferno): one `frame;frame;frame count` line per stack"""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+async def profile_event_loop(seconds: float, limit: int = 60) -> str:
+    """cProfile of the event loop thread (workflow execution, async endpoints) for `seconds`"""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+async def profile(
+    mode: str = 'sampling',
+    seconds: float = 10,
+    interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS,
+    job_id: Optional[int] = None,
+    idle: bool = False
+) -> str:
+    """Profile this process for a bounded window, collapsed stacks (sampling) or cProfile stats (deterministic)"""
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}'. Available: {list(PROFILE_MODES)}")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}")
+    if mode == 'deterministic' and job_id is not None:
+        raise ValueError("Profiles of a single job use the sampling mode")
+    if not profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this process")
+    try:
+        if mode == 'deterministic':
+            return await profile_event_loop(seconds)
+        stacks = await asyncio.to_thread(sample_stacks, seconds, max(interval_ms, 1) / 1000, job_id, idle)
+        return collapsed(stacks)
+    finally:
+        profile_lock.release()
+
+
+def profile_dir() -> str:
+    if PROFILE_DIR:
+        return PROFILE_DIR
+    from backend.lib.db import DATABASE_PATH
+
+    return os.path.join(os.path.dirname(DATABASE_PATH), 'profiles')
+
+
+async def profile_to_file():
+    """Profile as asked in <profile dir>/request.json and write the result next to it"""
+    directory = profile_dir()
+    try:
+        with open(os.path.join(directory, 'request.json')) as f:
+            request = json.load(f)
+    except FileNotFoundError:
+        request = {}
+    try:
+        result = await profile(**request)
+    except (ValueError, TypeError, ProfilerBusy) as e:
+        print(f"Profile request ignored: {str(e)}")
+        return
+
+    extension = 'txt' if request.get('mode') == 'deterministic' else 'folded'
+    path = os.path.join(directory, f"profile-{socket.gethostname()}-{os.getpid()}-{int(time.time())}.{extension}")
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        f.write(result)
+    os.replace(path + '.tmp', path)
+    print(f"Profile written to {path}")
+
+
+def install_profile_signal(loop: asyncio.AbstractEventLoop):
+    """Profile this process on SIGUSR2 (see python -m backend.profile)"""
+    # Signal handlers need the main thread (not the case under a test client)
+    if not hasattr(signal, 'SIGUSR2') or threading.current_thread() is not threading.main_thread():
+        return
+
+    def start():
+        task = loop.create_task(profile_to_file())
+        signal_tasks.add(task)
+        task.add_done_callback(signal_tasks.discard)
+
+    loop.add_signal_handler(signal.SIGUSR2, start)
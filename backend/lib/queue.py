@@ -0,0 +1,153 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+from peewee import fn
+from backend.lib.db import db, IS_POSTGRES, Job, User, lock_rows, write_transaction
+
+# Priority levels, higher runs first
+PRIORITIES = {
+    'low': -10,
+    'normal': 0,
+    'high': 10,
+    'critical': 20
+}
+
+# Default cap on running jobs per user across all workers (0 = unlimited)
+MAX_RUNNING_JOBS_PER_USER = int(os.getenv('MAX_RUNNING_JOBS_PER_USER', '0'))
+
+# Namespace of the PostgreSQL advisory locks that serialize claims of capped users
+CLAIM_LOCK_NAMESPACE = 0x4A0B
+
+
+def parse_priority(priority: str) -> int:
+    """Convert a priority level name to its stored value"""
+    try:
+        return PRIORITIES[priority]
+    except KeyError:
+        raise ValueError(f"Unknown priority '{priority}'. Available: {list(PRIORITIES.keys())}")
+
+
+def priority_name(value: int) -> str:
+    """Convert a stored priority value back to its level name"""
+    for name, level in PRIORITIES.items():
+        if level == value:
+            return name
+    return str(value)
+
+
+def running_counts() -> Dict[Optional[int], int]:
+    """Count running jobs per user id (None for jobs without a user)"""
+    query = (
+        Job.select(Job.user, fn.COUNT(Job.id))
+        .where(Job.status == 'running')
+        .group_by(Job.user)
+        .tuples()
+    )
+    return {user_id: count for user_id, count in query}
+
+
+def pending_user_ids() -> List[Optional[int]]:
+    """Ids of the users with pending jobs in id order, None (jobs without a user) last
+
+    Workers take the per-user advisory locks in this order, so they cannot deadlock.
+    """
+    query = Job.select(Job.user).where(Job.status == 'pending').group_by(Job.user).tuples()
+    user_ids = [user_id for user_id, in query]
+    ordered = sorted(user_id for user_id in user_ids if user_id is not None)
+    if None in user_ids:
+        ordered.append(None)
+    return ordered
+
+
+def queue_depth() -> Dict[str, int]:
+    """Count jobs waiting or running per status"""
+    query = (
+        Job.select(Job.status, fn.COUNT(Job.id))
+        .where(Job.status.in_(['scheduled', 'pending', 'running']))
+        .group_by(Job.status)
+        .tuples()
+    )
+    counts = {'scheduled': 0, 'pending': 0, 'running': 0}
+    counts.update(query)
+    return counts
+
+
+def promote_due_jobs(now: datetime) -> int:
+    """Move scheduled jobs whose run_at has passed into the pending queue"""
+    return (Job
+            .update(status='pending')
+            .where((Job.status == 'scheduled') & (Job.run_at <= now))
+            .execute())
+
+
+def claim_jobs(limit: int, worker_id: str) -> List[Job]:
+    """Atomically claim up to `limit` pending jobs for a worker
+
+    Jobs are ordered by priority first. Within a priority level users are
+    interleaved by weighted fair queuing: each queued job gets a virtual
+    start time of (running + position) / queue_weight for its user, so a user
+    with a large backlog cannot starve the others. Per-user caps count the
+    running jobs of all workers. On SQLite the IMMEDIATE transaction serializes
+    claims; on PostgreSQL workers claim concurrently with SKIP LOCKED and only
+    claims of capped users are serialized with an advisory lock.
+    """
+    if limit <= 0:
+        return []
+
+    with write_transaction():
+        now = datetime.now()
+        promote_due_jobs(now)
+        # Only users with something pending cost a head query (and a lock), not the whole user table
+        waiting = pending_user_ids()
+        if not waiting:
+            return []
+        running = running_counts()
+        users = {
+            user.id: user
+            for user in User.select(User.id, User.queue_weight, User.max_running_jobs).where(
+                User.id.in_([user_id for user_id in waiting if user_id is not None])
+            )
+        }
+
+        candidates = []
+        for user_id in waiting:
+            user = users.get(user_id)
+            weight = max(user.queue_weight, 0.01) if user else 1.0
+            cap = MAX_RUNNING_JOBS_PER_USER
+            if user and user.max_running_jobs is not None:
+                cap = user.max_running_jobs
+
+            already_running = running.get(user_id, 0)
+            if cap and IS_POSTGRES:
+                # Count again under the user's lock, other workers may have claimed meanwhile
+                db.execute_sql(
+                    "SELECT pg_advisory_xact_lock(%s, %s)", (CLAIM_LOCK_NAMESPACE, user_id or 0)
+                )
+                already_running = running_counts().get(user_id, 0)
+            slots = limit if not cap else min(limit, cap - already_running)
+            if slots <= 0:
+                continue
+
+            owner = Job.user.is_null() if user_id is None else (Job.user == user_id)
+            head = lock_rows(
+                Job.select(Job.id, Job.priority, Job.created_at)
+                .where((Job.status == 'pending') & owner)
+                .order_by(Job.priority.desc(), Job.created_at)
+                .limit(slots)
+            )
+            for position, job in enumerate(head):
+                virtual_time = (already_running + position) / weight
+                candidates.append((-job.priority, virtual_time, job.created_at, job.id))
+
+        candidates.sort()
+        job_ids = [candidate[-1] for candidate in candidates[:limit]]
+        if not job_ids:
+            return []
+
+        (Job
+         .update(status='running', claimed_by=worker_id, claimed_at=now)
+         .where(Job.id.in_(job_ids) & (Job.status == 'pending'))
+         .execute())
+
+    jobs = {job.id: job for job in Job.select().where(Job.id.in_(job_ids))}
+    return [jobs[job_id] for job_id in job_ids if job_id in jobs]
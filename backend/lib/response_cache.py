@@ -0,0 +1,61 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from backend.lib.db import TableVersion
+
+# Serialized definition responses kept per process
+API_RESPONSE_CACHE_SIZE = int(os.getenv('API_RESPONSE_CACHE_SIZE', '256'))
+
+
+def table_version(table: str) -> int:
+    """Current write counter of a definition table (one primary key lookup)"""
+    return TableVersion.select(TableVersion.version).where(TableVersion.name == table).scalar() or 0
+
+
+def make_etag(table: str, version: int, path: str, query: str) -> str:
+    """Strong ETag of a response: the table version plus the request it answers"""
+    digest = hashlib.blake2b(f"{path}?{query}".encode('utf-8'), digest_size=8).hexdigest()
+    return f'"{table}.{version}.{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 asks for this header)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+class ResponseCache:
+    """LRU of serialized response bodies keyed by ETag
+
+    The ETag holds the table version, so a write to the table makes every
+    entry of it unreachable and they age out of the LRU.
+    """
+
+    def __init__(self, max_size: int = API_RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries: 'OrderedDict[str, Tuple[bytes, Dict[str, str]]]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, etag: str) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        """Body and extra headers of a cached response"""
+        with self.lock:
+            entry = self.entries.get(etag)
+            if entry is not None:
+                self.entries.move_to_end(etag)
+            return entry
+
+    def put(self, etag: str, body: bytes, headers: Dict[str, str]):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[etag] = (body, headers)
+            self.entries.move_to_end(etag)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,198 @@
+import os
+import gzip
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+from backend.lib.db import (
+    db, connection_scope, load_payloads, lock_rows, write_transaction, DATABASE_PATH, IS_POSTGRES, Job, JobPayload, Workflow
+)
+
+# Retention policy, a job is archived when it matches the statuses and either rule
+JOB_RETENTION_DAYS = float(os.getenv('JOB_RETENTION_DAYS', '0'))  # 0 = no age rule
+JOB_RETENTION_KEEP_PER_WORKFLOW = int(os.getenv('JOB_RETENTION_KEEP_PER_WORKFLOW', '0'))  # 0 = no count rule
+JOB_RETENTION_STATUSES = [
+    status.strip()
+    for status in os.getenv('JOB_RETENTION_STATUSES', 'completed,failed,cancelled').split(',')
+    if status.strip()
+]
+JOB_RETENTION_BATCH_SIZE = int(os.getenv('JOB_RETENTION_BATCH_SIZE', '500'))
+JOB_RETENTION_INTERVAL = float(os.getenv('JOB_RETENTION_INTERVAL', '300'))
+# Seconds after which the claim of a pass that died before pruning is released
+JOB_RETENTION_CLAIM_TIMEOUT = 3600
+JOB_ARCHIVE_DIR = os.getenv('JOB_ARCHIVE_DIR', os.path.join(os.path.dirname(DATABASE_PATH), 'archive'))
+
+
+def retention_enabled() -> bool:
+    """Whether any retention rule is configured"""
+    return JOB_RETENTION_DAYS > 0 or JOB_RETENTION_KEEP_PER_WORKFLOW > 0
+
+
+def archivable():
+    """Jobs that are finished, still hold their payloads and are not claimed by a running pass"""
+    return Job.status.in_(JOB_RETENTION_STATUSES) & Job.archived_at.is_null() & Job.archive_segment.is_null()
+
+
+def expired_job_ids(limit: int) -> List[int]:
+    """Ids of jobs past the age rule"""
+    if JOB_RETENTION_DAYS <= 0:
+        return []
+    cutoff = datetime.now() - timedelta(days=JOB_RETENTION_DAYS)
+    query = lock_rows(Job
+                      .select(Job.id)
+                      .where(archivable() & (Job.updated_at < cutoff))
+                      .limit(limit))
+    return [job_id for job_id, in query.tuples()]
+
+
+def excess_job_ids(limit: int) -> List[int]:
+    """Ids of jobs beyond the newest JOB_RETENTION_KEEP_PER_WORKFLOW of each workflow"""
+    if JOB_RETENTION_KEEP_PER_WORKFLOW <= 0:
+        return []
+    job_ids = []
+    for workflow_id, in Workflow.select(Workflow.id).tuples():
+        query = lock_rows(Job
+                          .select(Job.id)
+                          .where((Job.workflow == workflow_id) & archivable())
+                          .order_by(Job.created_at.desc())
+                          .offset(JOB_RETENTION_KEEP_PER_WORKFLOW)
+                          .limit(limit - len(job_ids)))
+        job_ids.extend(job_id for job_id, in query.tuples())
+        if len(job_ids) >= limit:
+            break
+    return job_ids
+
+
+def segment_name(job_ids: List[int]) -> str:
+    return f"jobs-{min(job_ids)}-{max(job_ids)}-{datetime.now():%Y%m%d%H%M%S}.ndjson.gz"
+
+
+def write_segment(jobs: List[Job], name: str) -> str:
+    """Write jobs to a compressed NDJSON segment file and return its path"""
+    os.makedirs(JOB_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(JOB_ARCHIVE_DIR, name)
+    tmp_path = f"{path}.tmp"
+
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        for job in jobs:
+            f.write(json.dumps({
+                "id": job.id,
+                "name": job.name,
+                "workflow_id": job.workflow_id,
+                "status": job.status,
+                "retry_count": job.retry_count,
+                "input": job.input,
+                "output": job.output,
+                "trace": job.payload.trace,
+                "error": job.error,
+                "created_at": job.created_at.isoformat(),
+                "updated_at": job.updated_at.isoformat()
+            }, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    # The segment is complete on disk before any payload is pruned
+    os.replace(tmp_path, path)
+    return path
+
+
+def archive_batch(batch_size: int = JOB_RETENTION_BATCH_SIZE) -> int:
+    """Archive and prune one batch of jobs, returns the number of jobs archived
+
+    The segment file is written between two short write transactions, so the
+    database write lock is never held during file I/O:
+    1. claim the jobs by setting their archive_segment (other passes skip them),
+    2. write and fsync the segment,
+    3. prune the payloads and set archived_at.
+    """
+    with write_transaction():
+        job_ids = expired_job_ids(batch_size)
+        job_ids += excess_job_ids(batch_size - len(job_ids))
+        if not job_ids:
+            return 0
+        name = segment_name(job_ids)
+        Job.update(archive_segment=name).where(Job.id.in_(job_ids)).execute()
+
+    try:
+        with connection_scope():
+            jobs = load_payloads(list(Job.select().where(Job.id.in_(job_ids)).order_by(Job.id)), with_trace=True)
+        write_segment(jobs, name)
+    except BaseException:
+        release_claim(name)
+        raise
+
+    with write_transaction():
+        # Pruned payload rows read back as empty input/output
+        JobPayload.delete().where(JobPayload.job.in_(job_ids)).execute()
+        (Job
+         .update(archived_at=datetime.now())
+         .where(Job.id.in_(job_ids) & (Job.archive_segment == name))
+         .execute())
+
+    return len(jobs)
+
+
+def release_claim(name: str):
+    """Make the jobs claimed for a segment that was not written archivable again"""
+    with write_transaction():
+        (Job
+         .update(archive_segment=None)
+         .where((Job.archive_segment == name) & Job.archived_at.is_null())
+         .execute())
+
+
+def release_stale_claims():
+    """Release the claims of passes that died before pruning (JOB_RETENTION_CLAIM_TIMEOUT ago)"""
+    cutoff = datetime.now() - timedelta(seconds=JOB_RETENTION_CLAIM_TIMEOUT)
+    claimed = (Job
+               .select(Job.archive_segment)
+               .where(Job.archived_at.is_null() & Job.archive_segment.is_null(False))
+               .distinct())
+    for name, in claimed.tuples():
+        # Segment names end with the claim time, jobs-<first>-<last>-<YYYYmmddHHMMSS>.ndjson.gz
+        claimed_at = datetime.strptime(name.split('-')[-1].split('.')[0], '%Y%m%d%H%M%S')
+        if claimed_at < cutoff:
+            print(f"Releasing stale retention claim {name}")
+            release_claim(name)
+
+
+def run_retention_pass(max_batches: Optional[int] = None, pause: float = 0.05) -> int:
+    """Archive batches until nothing is left (or max_batches), returns the number of jobs archived"""
+    if not retention_enabled():
+        return 0
+
+    total = 0
+    batches = 0
+    with connection_scope():
+        release_stale_claims()
+        while max_batches is None or batches < max_batches:
+            archived = archive_batch()
+            if not archived:
+                break
+            total += archived
+            batches += 1
+            # Let other writers in between batches
+            time.sleep(pause)
+
+        if total:
+            if not IS_POSTGRES:
+                # Give freed pages back to the OS (no-op unless auto_vacuum is INCREMENTAL)
+                db.execute_sql("PRAGMA incremental_vacuum(1000);")
+            print(f"Archived {total} jobs to {JOB_ARCHIVE_DIR}")
+    return total
+
+
+def read_archived_job(job: Job) -> Optional[dict]:
+    """Load the full record of an archived job from its segment"""
+    if not job.archive_segment:
+        return None
+    with gzip.open(os.path.join(JOB_ARCHIVE_DIR, job.archive_segment), 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if record["id"] == job.id:
+                return record
+    return None
+
+
+if __name__ == "__main__":
+    run_retention_pass()
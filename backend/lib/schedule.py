@@ -0,0 +1,198 @@
+import random
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
+from backend.lib.db import Job, Schedule, Workflow, lock_rows, write_transaction
+
+# Cron field ranges: minute, hour, day of month, month, day of week (0 = Sunday)
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+CRON_ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *'
+}
+
+# Max schedules fired per worker poll, the rest are picked up on the next poll
+FIRE_BATCH_SIZE = 100
+
+# Upcoming runs of a cron expression looked at for its shortest interval
+INTERVAL_SAMPLES = 100
+
+
+class CronExpression:
+    """Standard 5-field cron expression (minute hour day month weekday)"""
+
+    def __init__(self, expr: str):
+        self.expr = expr.strip()
+        fields = CRON_ALIASES.get(self.expr, self.expr).split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression '{expr}': expected 5 fields")
+
+        parsed = [self.parse_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        # 7 is an alias for Sunday
+        if 7 in self.weekdays:
+            self.weekdays.discard(7)
+            self.weekdays.add(0)
+        # Like cron, when both day fields are restricted a day matching either one runs
+        self.days_restricted = fields[2] != '*'
+        self.weekdays_restricted = fields[4] != '*'
+
+    def parse_field(self, field: str, low: int, high: int) -> Set[int]:
+        """Parse one cron field (*, */n, a-b, a-b/n, lists) into the set of allowed values"""
+        # Day of week accepts 7 for Sunday
+        if low == 0 and high == 6:
+            high = 7
+
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step_str = part.split('/', 1)
+                step = int(step_str)
+                if step <= 0:
+                    raise ValueError(f"Invalid step in cron field '{field}'")
+
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start_str, end_str = part.split('-', 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+
+            if start < low or end > high or start > end:
+                raise ValueError(f"Value out of range in cron field '{field}' ({low}-{high})")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches_day(self, moment: datetime) -> bool:
+        """Check the day of month / day of week fields"""
+        weekday = (moment.weekday() + 1) % 7  # Python: Monday = 0, cron: Sunday = 0
+        day_ok = moment.day in self.days
+        weekday_ok = weekday in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First time strictly after `moment` that matches the expression"""
+        current = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = current + timedelta(days=366 * 5)
+
+        while current < limit:
+            if current.month not in self.months:
+                year = current.year + (current.month == 12)
+                month = current.month % 12 + 1
+                current = current.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self.matches_day(current):
+                current = (current + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if current.hour not in self.hours:
+                current = (current + timedelta(hours=1)).replace(minute=0)
+                continue
+            if current.minute not in self.minutes:
+                current += timedelta(minutes=1)
+                continue
+            return current
+
+        raise ValueError(f"Cron expression '{self.expr}' never matches")
+
+
+def spread_offset(schedule_id: int, spread: int) -> int:
+    """Stable per-schedule offset in [0, spread) seconds, spreads schedules sharing a cron expression"""
+    if spread <= 0:
+        return 0
+    # Knuth multiplicative hash, so consecutive ids land far apart
+    return (schedule_id * 2654435761) % (2 ** 32) % spread
+
+
+def shortest_interval(cron: str, samples: int = INTERVAL_SAMPLES) -> float:
+    """Shortest time in seconds between two of the next `samples` runs of a cron expression"""
+    expression = CronExpression(cron)
+    runs = [expression.next_after(datetime.now())]
+    for _ in range(samples - 1):
+        runs.append(expression.next_after(runs[-1]))
+    return min((later - earlier).total_seconds() for earlier, later in zip(runs, runs[1:]))
+
+
+def check_offsets(cron: str, spread: int, jitter: int):
+    """Raise ValueError unless spread + jitter stays below the shortest interval of the expression
+
+    A run delayed past the next cron time would make that run fire late or be skipped.
+    """
+    interval = shortest_interval(cron)
+    if spread + jitter >= interval:
+        raise ValueError(
+            f"spread + jitter ({spread + jitter}s) must be shorter than the shortest interval "
+            f"of '{cron}' ({interval:g}s)"
+        )
+
+
+def compute_next_run(schedule: Schedule, after: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """Next cron time of a schedule after `after` and its fire time: plus spread offset and random jitter"""
+    base = CronExpression(schedule.cron).next_after(after or datetime.now())
+    offset = spread_offset(schedule.id, schedule.spread)
+    if schedule.jitter > 0:
+        offset += random.uniform(0, schedule.jitter)
+    return base, base + timedelta(seconds=offset)
+
+
+def fire_due_schedules(now: Optional[datetime] = None) -> List[Job]:
+    """Create the jobs of every schedule that is due, and move each schedule to its next run
+
+    Runs inside a write transaction (rows locked on PostgreSQL) so several
+    workers never fire the same schedule twice. Missed runs (e.g. while no
+    worker was up) fire only once.
+    """
+    now = now or datetime.now()
+    jobs = []
+
+    with write_transaction():
+        due = list(lock_rows(
+            Schedule.select()
+            .where((Schedule.enabled == True) & (Schedule.next_run_at <= now))
+            .order_by(Schedule.next_run_at)
+            .limit(FIRE_BATCH_SIZE)
+        ))
+        # Schedules left by a workflow deleted outside the API (no cascade on SQLite) are removed, not fired
+        workflow_ids = list({schedule.workflow_id for schedule in due})
+        existing = {row.id for row in Workflow.select(Workflow.id).where(Workflow.id.in_(workflow_ids))} if due else set()
+        for schedule in [schedule for schedule in due if schedule.workflow_id not in existing]:
+            print(f"Deleting schedule {schedule.id}: workflow {schedule.workflow_id} no longer exists")
+            schedule.delete_instance()
+        due = [schedule for schedule in due if schedule.workflow_id in existing]
+
+        for schedule in due:
+            jobs.append(Job.create(
+                name=f"{schedule.name} ({schedule.next_run_at:%Y-%m-%d %H:%M})",
+                workflow=schedule.workflow_id,
+                user=schedule.user_id,
+                status='pending',
+                priority=schedule.priority,
+                input=schedule.input
+            ))
+            # Counted from the cron time of this run, not from its offset fire time, so offsets never add
+            # up; runs whose fire time has already passed are skipped
+            base = schedule.base_run_at or schedule.next_run_at
+            after = max(base, now - timedelta(seconds=spread_offset(schedule.id, schedule.spread)))
+            try:
+                base_run_at, next_run_at = compute_next_run(schedule, after=after)
+            except ValueError as e:
+                print(f"Disabling schedule {schedule.id}: {e}")
+                schedule.enabled = False
+                base_run_at = next_run_at = None
+            schedule.last_run_at = now
+            schedule.base_run_at = base_run_at
+            schedule.next_run_at = next_run_at
+            schedule.save()
+
+    if jobs:
+        print(f"Fired {len(jobs)} scheduled jobs")
+    return jobs
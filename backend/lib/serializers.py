@@ -0,0 +1,156 @@
+import json
+from datetime import date, datetime
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from fastapi.responses import JSONResponse
+from peewee import Field, JOIN
+from backend.lib.db import Connector, Node, Workflow, Job, Schedule
+from backend.lib.queue import priority_name
+from backend.lib.pagination import select_columns
+
+try:
+    import orjson  # In requirements.txt, the stdlib json encoder is the fallback
+except ImportError:
+    orjson = None
+
+# Field name -> (columns to select, function reading the value from a row) of a serialized resource
+FieldMap = Dict[str, Tuple[List[Field], Callable[[Any], Any]]]
+
+
+def column(field: Field) -> Tuple[List[Field], Callable[[Any], Any]]:
+    """Plain column field"""
+    return [field], attrgetter(field.name)
+
+
+CONNECTOR_FIELDS: FieldMap = {
+    "id": column(Connector.id),
+    "name": column(Connector.name),
+    "base_url": column(Connector.base_url),
+    "method": column(Connector.method),
+    "header": column(Connector.header),
+    "body": column(Connector.body),
+    "created_at": column(Connector.created_at),
+    "updated_at": column(Connector.updated_at)
+}
+
+NODE_FIELDS: FieldMap = {
+    "id": column(Node.id),
+    "name": column(Node.name),
+    "description": column(Node.description),
+    "connector_id": ([Node.connector], attrgetter("connector_id")),  # Raw foreign key, no connector query
+    "path": column(Node.path),
+    "input": column(Node.input),
+    "output": column(Node.output),
+    "data": column(Node.data),
+    "body_template": column(Node.body_template),
+    "created_at": column(Node.created_at),
+    "updated_at": column(Node.updated_at)
+}
+
+WORKFLOW_FIELDS: FieldMap = {
+    "id": column(Workflow.id),
+    "name": column(Workflow.name),
+    "description": column(Workflow.description),
+    "nodes": column(Workflow.nodes),
+    "created_at": column(Workflow.created_at),
+    "updated_at": column(Workflow.updated_at)
+}
+
+JOB_FIELDS: FieldMap = {
+    "id": column(Job.id),
+    "name": column(Job.name),
+    "workflow_id": ([Job.workflow], attrgetter("workflow_id")),
+    # Needs the workflow joined (see job_query), None when the workflow was deleted
+    "workflow_name": (
+        [Job.workflow, Workflow.id, Workflow.name], lambda row: row.workflow.name if row.workflow else None
+    ),
+    "status": column(Job.status),
+    "retry_count": column(Job.retry_count),
+    "batch_id": ([Job.batch], attrgetter("batch_id")),
+    "input": ([], attrgetter("input")),  # job_payload table, see load_payloads
+    "output": ([], attrgetter("output")),
+    "error": column(Job.error),
+    "archived_at": column(Job.archived_at),
+    "created_at": column(Job.created_at),
+    "updated_at": column(Job.updated_at)
+}
+
+SCHEDULE_FIELDS: FieldMap = {
+    "id": column(Schedule.id),
+    "name": column(Schedule.name),
+    "workflow_id": ([Schedule.workflow], attrgetter("workflow_id")),
+    "cron": column(Schedule.cron),
+    "input": column(Schedule.input),
+    "priority": ([Schedule.priority], lambda row: priority_name(row.priority)),
+    "spread": column(Schedule.spread),
+    "jitter": column(Schedule.jitter),
+    "enabled": column(Schedule.enabled),
+    "next_run_at": column(Schedule.next_run_at),
+    "last_run_at": column(Schedule.last_run_at),
+    "created_at": column(Schedule.created_at),
+    "updated_at": column(Schedule.updated_at)
+}
+
+RESOURCES: Dict[str, FieldMap] = {
+    "connector": CONNECTOR_FIELDS,
+    "node": NODE_FIELDS,
+    "workflow": WORKFLOW_FIELDS,
+    "job": JOB_FIELDS,
+    "schedule": SCHEDULE_FIELDS
+}
+
+
+@lru_cache(maxsize=256)
+def compile_serializer(resource: str, names: Tuple[str, ...]) -> Callable[[Any], dict]:
+    """Build (once per field selection) a function turning a row into a dict of the selected fields"""
+    field_map = RESOURCES[resource]
+    getters = tuple((name, field_map[name][1]) for name in names)
+
+    def serializer(row: Any) -> dict:
+        return {name: getter(row) for name, getter in getters}
+    return serializer
+
+
+def serialize(resource: str, row: Any, names: Optional[List[str]] = None) -> dict:
+    """Serialize one row with all fields or the given ones"""
+    return compile_serializer(resource, tuple(names or RESOURCES[resource]))(row)
+
+
+def serialize_many(resource: str, rows: list, names: Optional[List[str]] = None) -> List[dict]:
+    """Serialize rows with all fields or the given ones"""
+    serializer = compile_serializer(resource, tuple(names or RESOURCES[resource]))
+    return [serializer(row) for row in rows]
+
+
+def job_query(names: Optional[List[str]] = None):
+    """Select the job columns needed for `names`, joining the workflow only for workflow_name"""
+    names = names or list(JOB_FIELDS)
+    query = Job.select(*select_columns(JOB_FIELDS, names, [Job.id, Job.created_at]))
+    if "workflow_name" in names:
+        query = query.join(Workflow, JOIN.LEFT_OUTER)
+    return query
+
+
+def json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_bytes(content: Any) -> bytes:
+    """Compact JSON encoding of plain dicts and lists (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded straight from plain dicts (orjson when installed)
+
+    Skips FastAPI's jsonable_encoder pass: endpoints returning it must hand it
+    dicts, lists, strings, numbers and datetimes only.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return json_bytes(content)
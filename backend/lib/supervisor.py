@@ -0,0 +1,186 @@
+import os
+import json
+import queue
+import signal
+import socket
+import time
+import multiprocessing
+from typing import Any, Dict, Optional
+from backend.lib.db import DATABASE_PATH, Job
+
+# Where the aggregated worker health is written for probes and dashboards
+WORKER_HEALTH_PATH = os.getenv(
+    'WORKER_HEALTH_PATH', os.path.join(os.path.dirname(DATABASE_PATH), 'worker_health.json')
+)
+
+
+class Supervisor:
+    """Run N worker processes, restart crashed ones and drain them on SIGTERM"""
+
+    def __init__(self, processes: int, heartbeat_interval: float = 5, drain_timeout: Optional[float] = None):
+        self.processes = processes
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = float(os.getenv('WORKER_HEARTBEAT_TIMEOUT', heartbeat_interval * 6))
+        self.drain_timeout = drain_timeout or float(os.getenv('WORKER_DRAIN_TIMEOUT', '600'))
+        # spawn gives every child a fresh interpreter: no inherited sqlite connections or threads
+        self.context = multiprocessing.get_context('spawn')
+        self.heartbeats = self.context.Queue()
+        self.children: Dict[int, Dict[str, Any]] = {}
+        self.stopping = False
+
+    def start_child(self, index: int):
+        """Start (or restart) the worker process in slot `index`"""
+        from backend.worker import run_worker_process
+
+        process = self.context.Process(
+            target=run_worker_process,
+            args=(index, self.heartbeats, self.heartbeat_interval),
+            name=f"apiflow-worker-{index}",
+            daemon=False
+        )
+        process.start()
+
+        child = self.children.setdefault(index, {'restarts': 0, 'health': {}})
+        child.update(process=process, started_at=time.time(), last_heartbeat=time.time(), restart_at=None)
+        print(f"Started worker process {index} (pid {process.pid})")
+
+    def requeue_claimed_jobs(self, pid: int):
+        """Put jobs held by a dead worker process back in the queue"""
+        worker_id = f"{socket.gethostname()}:{pid}"
+        requeued = (Job
+                    .update(status='pending', claimed_by=None, claimed_at=None,
+                            retry_count=Job.retry_count + 1)
+                    .where((Job.claimed_by == worker_id) & (Job.status == 'running'))
+                    .execute())
+        if requeued:
+            print(f"Requeued {requeued} jobs claimed by dead worker {worker_id}")
+
+    def collect_heartbeats(self):
+        """Read the pending heartbeats sent by the children"""
+        while True:
+            try:
+                health = self.heartbeats.get_nowait()
+            except queue.Empty:
+                return
+            child = self.children.get(health['index'])
+            if child and child['process'].pid == health['pid']:
+                child['health'] = health
+                child['last_heartbeat'] = time.time()
+
+    def check_children(self):
+        """Restart children that crashed or stopped sending heartbeats"""
+        now = time.time()
+        for index, child in self.children.items():
+            process = child['process']
+
+            if child['restart_at'] is not None:
+                if now >= child['restart_at']:
+                    self.start_child(index)
+                continue
+
+            if process.is_alive() and now - child['last_heartbeat'] > self.heartbeat_timeout:
+                print(f"Worker process {index} (pid {process.pid}) missed heartbeats, killing it")
+                process.kill()
+                process.join(5)
+
+            if not process.is_alive():
+                print(f"Worker process {index} (pid {process.pid}) exited with code {process.exitcode}")
+                self.requeue_claimed_jobs(process.pid)
+                # Back off exponentially when a child keeps crashing right after start
+                if now - child['started_at'] > 60:
+                    child['restarts'] = 0
+                delay = min(2 ** child['restarts'], 30)
+                child['restarts'] += 1
+                child['restart_at'] = now + delay
+                print(f"Restarting worker process {index} in {delay}s")
+
+    def health(self) -> Dict[str, Any]:
+        """Aggregate the health of all children"""
+        children = []
+        totals = {'running_jobs': 0, 'processed': 0, 'failed': 0, 'alive': 0}
+        for index, child in sorted(self.children.items()):
+            alive = child['process'].is_alive()
+            health = child['health']
+            totals['alive'] += int(alive)
+            for key in ('running_jobs', 'processed', 'failed'):
+                totals[key] += health.get(key, 0)
+            children.append({
+                'index': index,
+                'pid': child['process'].pid,
+                'alive': alive,
+                'restarts': child['restarts'],
+                'last_heartbeat': child['last_heartbeat'],
+                **{key: health.get(key, 0) for key in ('running_jobs', 'processed', 'failed')}
+            })
+
+        return {
+            'status': 'draining' if self.stopping else ('healthy' if totals['alive'] == self.processes else 'degraded'),
+            'supervisor_pid': os.getpid(),
+            'processes': self.processes,
+            'time': time.time(),
+            **totals,
+            'children': children
+        }
+
+    def write_health(self):
+        """Write the aggregated health atomically"""
+        tmp_path = f"{WORKER_HEALTH_PATH}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.health(), f)
+        os.replace(tmp_path, WORKER_HEALTH_PATH)
+
+    def request_stop(self, signum, frame):
+        """Signal handler: drain all children"""
+        if not self.stopping:
+            print(f"Supervisor received signal {signum}, draining workers...")
+            self.stopping = True
+
+    def forward_signal(self, signum, frame):
+        """Signal handler: pass the signal on to every child (SIGUSR2 profiles them)"""
+        for child in self.children.values():
+            if child['process'].is_alive():
+                os.kill(child['process'].pid, signum)
+
+    def drain(self):
+        """Ask every child to finish its running jobs, kill the ones that take too long"""
+        for child in self.children.values():
+            if child['process'].is_alive():
+                child['process'].terminate()  # SIGTERM -> Worker.stop, running jobs finish
+
+        deadline = time.time() + self.drain_timeout
+        for index, child in self.children.items():
+            process = child['process']
+            # Keep reading heartbeats while waiting: a child cannot exit until its queue feeder has flushed
+            while process.is_alive() and time.time() < deadline:
+                self.collect_heartbeats()
+                process.join(min(0.5, max(deadline - time.time(), 0)))
+            if process.is_alive():
+                print(f"Worker process {index} (pid {process.pid}) did not drain in time, killing it")
+                process.kill()
+                process.join(5)
+                self.requeue_claimed_jobs(process.pid)
+
+    def run(self):
+        """Supervisor main loop"""
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2, self.forward_signal)
+
+        print(f"Supervisor starting {self.processes} worker processes...")
+        for index in range(self.processes):
+            self.start_child(index)
+
+        last_health_write = 0.0
+        while not self.stopping:
+            self.collect_heartbeats()
+            self.check_children()
+            if time.time() - last_health_write >= self.heartbeat_interval:
+                self.write_health()
+                last_health_write = time.time()
+            time.sleep(1)
+
+        self.drain()
+        self.collect_heartbeats()
+        self.write_health()
+        print("Supervisor stopped")
@@ -0,0 +1,242 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Record a span tree of every job run, stored with the job payload (GET /api/v1/jobs/{id}/trace)
+JOB_TRACE_ENABLED = os.getenv('JOB_TRACE_ENABLED', '1') == '1'
+
+# Spans kept per job run, the following ones are only counted (loops over large inputs)
+JOB_TRACE_MAX_SPANS = int(os.getenv('JOB_TRACE_MAX_SPANS', '5000'))
+
+# Response formats of the trace endpoint: span tree, Chrome trace events (Perfetto), OTLP/JSON (Jaeger, Tempo)
+TRACE_FORMATS = ('tree', 'chrome', 'otlp')
+
+# Trace and span index that code running in this task or thread records its spans under
+current_span: ContextVar[Optional[Tuple['JobTrace', int]]] = ContextVar('current_span', default=None)
+
+
+class JobTrace:
+    """Spans of one job run, in microseconds from the job's creation
+
+    Stored as {"version": 1, "start": <unix time>, "dropped": n, "spans": [...]}
+    where each span is [parent, name, start_us, duration_us, lane, attributes],
+    parent being its index in the list (-1 for the root). Concurrent spans get
+    a lane of their own, one per asyncio task.
+    """
+
+    def __init__(self, start: float):
+        self.start = start
+        self.origin = time.perf_counter() - (time.time() - start)  # perf_counter() at `start`
+        self.spans: List[list] = []
+        self.dropped = 0
+        self.lanes: Dict[int, int] = {}
+        self.lock = threading.Lock()  # Node threads add spans too
+
+    def now(self) -> int:
+        return int((time.perf_counter() - self.origin) * 1e6)
+
+    def at(self, moment: datetime) -> int:
+        return max(int((moment.timestamp() - self.start) * 1e6), 0)
+
+    def lane(self) -> Optional[int]:
+        """Lane of the running asyncio task, None outside the event loop"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            return None
+        if task is None:
+            return None
+        with self.lock:
+            return self.lanes.setdefault(id(task), len(self.lanes))
+
+    def add(self, name: str, parent: int, start: int, end: Optional[int] = None, lane: int = 0, **attrs) -> Optional[int]:
+        """Append a span, returns its index (None once JOB_TRACE_MAX_SPANS is reached)"""
+        with self.lock:
+            if len(self.spans) >= JOB_TRACE_MAX_SPANS:
+                self.dropped += 1
+                return None
+            self.spans.append([parent, name, start, end, lane, attrs])
+            return len(self.spans) - 1
+
+    def finish(self, index: int, **attrs):
+        span = self.spans[index]
+        span[3] = self.now()
+        span[5].update(attrs)
+
+    def to_dict(self) -> dict:
+        """Stored form, spans still open are closed now and flagged unfinished"""
+        now = self.now()
+        spans = []
+        for parent, name, start, end, lane, attrs in self.spans:
+            if end is None:
+                end, attrs = now, {**attrs, 'unfinished': True}
+            spans.append([parent, name, start, max(end - start, 0), lane, attrs])
+        return {'version': 1, 'start': self.start, 'dropped': self.dropped, 'spans': spans}
+
+
+def start_job_trace(job) -> Optional[JobTrace]:
+    """Trace of a job starting to run: the root span begins at its creation
+
+    Jobs run by a worker get their time in the queue (and waiting for run_at)
+    and between the claim and now as finished spans.
+    """
+    if not JOB_TRACE_ENABLED:
+        return None
+    trace = JobTrace(job.created_at.timestamp())
+    root = trace.add('job', -1, 0, lane=trace.lane() or 0, job_id=job.id, workflow_id=job.workflow_id)
+    if job.claimed_at:
+        queued_from = job.run_at if job.run_at and job.run_at > job.created_at else job.created_at
+        if queued_from > job.created_at:
+            trace.add('scheduled', root, 0, trace.at(queued_from))
+        trace.add('queued', root, trace.at(queued_from), trace.at(job.claimed_at))
+        trace.add('claimed', root, trace.at(job.claimed_at), trace.now(), worker=job.claimed_by)
+    return trace
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Record a child of the current span, yields its attributes to add to
+
+    Outside a traced job (or past the span limit) nothing is recorded and the
+    yielded dict is thrown away.
+    """
+    current = current_span.get()
+    index = None
+    if current is not None:
+        trace, parent = current
+        lane = trace.lane()
+        index = trace.add(name, parent, trace.now(), lane=trace.spans[parent][4] if lane is None else lane, **attrs)
+    if index is None:
+        yield attrs
+        return
+
+    token = current_span.set((trace, index))
+    try:
+        yield trace.spans[index][5]
+    except BaseException as e:
+        trace.spans[index][5]['error'] = str(e) or type(e).__name__
+        raise
+    finally:
+        current_span.reset(token)
+        trace.finish(index)
+
+
+def span_label(name: str, attrs: Dict[str, Any]) -> str:
+    """Readable span name for trace viewers"""
+    if name == 'module':
+        return f"module {attrs.get('id')} ({attrs.get('type')})"
+    if name == 'node':
+        return f"node {attrs.get('node_id')}"
+    if name == 'http':
+        return f"{attrs.get('method')} {attrs.get('url')}"
+    if name in ('retry', 'backoff'):
+        return f"{name} {attrs.get('attempt')}"
+    return name
+
+
+def trace_tree(data: dict, job_id: int) -> dict:
+    """Nested span tree with the critical path: from the root, the child ending last at each level"""
+    nodes = [
+        {
+            'name': name,
+            'label': span_label(name, attrs),
+            'start_ms': round(start / 1000, 3),
+            'duration_ms': round(duration / 1000, 3),
+            'attributes': attrs,
+            'children': []
+        }
+        for _, name, start, duration, _, attrs in data['spans']
+    ]
+    root = None
+    for (parent, *_), node in zip(data['spans'], nodes):
+        if parent < 0:
+            root = node
+        else:
+            nodes[parent]['children'].append(node)
+
+    critical_path = []
+    node = root
+    while node is not None:
+        critical_path.append({key: node[key] for key in ('label', 'start_ms', 'duration_ms')})
+        node = max(node['children'], key=lambda child: child['start_ms'] + child['duration_ms'], default=None)
+
+    return {
+        'job_id': job_id,
+        'start': datetime.fromtimestamp(data['start']).isoformat(),
+        'duration_ms': root['duration_ms'] if root else 0,
+        'dropped_spans': data.get('dropped', 0),
+        'critical_path': critical_path,
+        'root': root
+    }
+
+
+def chrome_trace(data: dict, job_id: int) -> dict:
+    """Chrome trace event format (chrome://tracing, ui.perfetto.dev), one thread per lane"""
+    origin = int(data['start'] * 1e6)
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': job_id, 'tid': 0, 'args': {'name': f"job {job_id}"}}]
+    for _, name, start, duration, lane, attrs in data['spans']:
+        events.append({
+            'name': span_label(name, attrs),
+            'cat': name,
+            'ph': 'X',
+            'ts': origin + start,
+            'dur': duration,
+            'pid': job_id,
+            'tid': lane,
+            'args': attrs
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_trace(data: dict, job_id: int) -> dict:
+    """OTLP/JSON export request (POST it to a collector's /v1/traces), trace id derived from the job id"""
+    trace_id = hashlib.blake2b(f"apiflow-job-{job_id}".encode('utf-8'), digest_size=16).hexdigest()
+    origin = int(data['start'] * 1e6)
+    spans = []
+    for index, (parent, name, start, duration, _, attrs) in enumerate(data['spans']):
+        span_data = {
+            'traceId': trace_id,
+            'spanId': f"{index + 1:016x}",
+            'name': span_label(name, attrs),
+            'kind': 3 if name == 'http' else 1,  # CLIENT, INTERNAL
+            'startTimeUnixNano': str((origin + start) * 1000),
+            'endTimeUnixNano': str((origin + start + duration) * 1000),
+            'attributes': [
+                {'key': f"apiflow.{key}", 'value': otlp_value(value)}
+                for key, value in [('span', name), ('job_id', job_id)] + list(attrs.items())
+            ],
+            'status': {'code': 2, 'message': str(attrs['error'])} if 'error' in attrs else {'code': 1}
+        }
+        if parent >= 0:
+            span_data['parentSpanId'] = f"{parent + 1:016x}"
+        spans.append(span_data)
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'apiflow'}}]},
+            'scopeSpans': [{'scope': {'name': 'apiflow.workflow'}, 'spans': spans}]
+        }]
+    }
+
+
+def export_trace(data: dict, job_id: int, output_format: str = 'tree') -> dict:
+    if output_format == 'chrome':
+        return chrome_trace(data, job_id)
+    if output_format == 'otlp':
+        return otlp_trace(data, job_id)
+    return trace_tree(data, job_id)
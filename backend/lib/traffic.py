@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import socket
+import atexit
+import threading
+from typing import Any, Optional
+
+# Directory of anonymised traffic recordings replayed by benchmarks/replay.py (empty: not recording)
+TRAFFIC_RECORD_DIR = os.getenv('TRAFFIC_RECORD_DIR', '')
+
+# Seconds between flushes of the recording file
+TRAFFIC_RECORD_FLUSH_INTERVAL = 1.0
+
+
+def input_shape(value: Any) -> Any:
+    """Anonymised copy of a job input: same keys, list lengths and string sizes, no values
+
+    Strings become {"$str": length}, numbers 0 or 0.0; booleans and nulls are kept.
+    """
+    if isinstance(value, dict):
+        return {key: input_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [input_shape(item) for item in value]
+    if isinstance(value, str):
+        return {'$str': len(value)}
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, int):
+        return 0
+    if isinstance(value, float):
+        return 0.0
+    return {'$str': len(str(value))}
+
+
+def input_from_shape(shape: Any) -> Any:
+    """Synthetic input with the structure and sizes of a recorded shape"""
+    if isinstance(shape, dict):
+        if set(shape) == {'$str'}:
+            return 'x' * shape['$str']
+        return {key: input_from_shape(item) for key, item in shape.items()}
+    if isinstance(shape, list):
+        return [input_from_shape(item) for item in shape]
+    return shape
+
+
+class TrafficRecorder:
+    """Appends submissions and upstream timings to one NDJSON file per process
+
+    Lines are buffered and flushed at most every TRAFFIC_RECORD_FLUSH_INTERVAL
+    seconds (and at exit), so recording costs a dict and a JSON dump per event.
+    """
+
+    def __init__(self, directory: str = TRAFFIC_RECORD_DIR):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.file = None
+        self.flushed_at = 0.0
+        self.lock = threading.Lock()
+
+    def write(self, record: dict):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.lock:
+            if self.file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"traffic-{socket.gethostname()}-{os.getpid()}.ndjson")
+                self.file = open(path, 'a', buffering=1 << 16)
+                atexit.register(self.flush)
+            self.file.write(line)
+            if time.monotonic() - self.flushed_at > TRAFFIC_RECORD_FLUSH_INTERVAL:
+                self.file.flush()
+                self.flushed_at = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def submission(self, mode: str, target_id: int, inputs: list, priority: str = 'normal', delay_seconds: Optional[float] = None):
+        """A workflow run (sync, enqueue or batch) or node run accepted by the API"""
+        if not self.enabled:
+            return
+        record = {
+            'type': 'submission',
+            't': time.time(),
+            'mode': mode,
+            'target_id': target_id,
+            'priority': priority,
+            'inputs': [input_shape(item) for item in inputs]
+        }
+        if delay_seconds:
+            record['delay_seconds'] = round(delay_seconds, 3)
+        self.write(record)
+
+    def upstream(self, connector_id: int, node_id: int, status: Any, duration: float, bytes_out: int, bytes_in: int):
+        """One HTTP call of a node run: status (or 'error' without response), seconds and sizes"""
+        if not self.enabled:
+            return
+        self.write({
+            'type': 'upstream',
+            't': time.time(),
+            'connector_id': connector_id,
+            'node_id': node_id,
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'bytes_out': bytes_out,
+            'bytes_in': bytes_in
+        })
+
+
+traffic_recorder = TrafficRecorder()
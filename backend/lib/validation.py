@@ -0,0 +1,332 @@
+import re
+import copy
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from backend.lib.db import Node, Workflow
+
+# Compiled validators kept per process, old versions are replaced on first use
+VALIDATOR_CACHE_SIZE = 4096
+
+# (path, message) of each invalid value, path relative to the validated input
+Errors = List[Tuple[tuple, str]]
+# Validates and coerces one value, appends problems to the error list
+Check = Callable[[Any, tuple, Errors], Any]
+
+MISSING = object()
+
+SCHEMA_TYPES = {
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+    'string': lambda value: isinstance(value, str),
+    'integer': lambda value: (isinstance(value, int) and not isinstance(value, bool))
+    or (isinstance(value, float) and value.is_integer()),
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'boolean': lambda value: isinstance(value, bool),
+    'null': lambda value: value is None
+}
+
+
+class SchemaError(ValueError):
+    pass
+
+
+class InputValidationError(ValueError):
+    """Input rejected by a workflow schema or node input definitions"""
+
+    def __init__(self, errors: Errors):
+        self.errors = errors
+        messages = [f"{'.'.join(str(key) for key in path) or 'input'}: {message}" for path, message in errors[:5]]
+        more = f" (and {len(errors) - 5} more)" if len(errors) > 5 else ''
+        super().__init__(f"Invalid input: {'; '.join(messages)}{more}")
+
+    def detail(self, *prefix) -> List[dict]:
+        """Errors in the format of FastAPI's own 422 responses"""
+        return [{'loc': [*prefix, *path], 'msg': message, 'type': 'value_error'} for path, message in self.errors]
+
+
+def compile_schema(schema: Any, where: str = 'schema') -> Optional[Check]:
+    """Build a check for a JSON Schema, None when it accepts anything
+
+    Supports type, enum, const, properties (with defaults), required,
+    additionalProperties, items, min/maxLength, pattern, minimum, maximum,
+    exclusiveMinimum, exclusiveMaximum and min/maxItems. Other keywords
+    (description, title, format...) are annotations and ignored.
+    """
+    if schema is True or schema is None:
+        return None
+    if not isinstance(schema, dict):
+        raise SchemaError(f"{where} must be an object")
+    checks: List[Check] = []
+
+    if 'type' in schema:
+        names = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+        unknown = [name for name in names if name not in SCHEMA_TYPES]
+        if unknown:
+            raise SchemaError(f"{where}.type: unknown type {unknown[0]!r}, expected one of {list(SCHEMA_TYPES)}")
+        tests = [SCHEMA_TYPES[name] for name in names]
+        expected = ' or '.join(names)
+
+        def check_type(value, path, errors):
+            if not any(test(value) for test in tests):
+                errors.append((path, f"expected {expected}, got {json_type(value)}"))
+            return value
+        checks.append(check_type)
+
+    if 'enum' in schema:
+        if not isinstance(schema['enum'], list):
+            raise SchemaError(f"{where}.enum must be a list")
+        allowed = schema['enum']
+
+        def check_enum(value, path, errors):
+            if value not in allowed:
+                errors.append((path, f"must be one of {allowed}"))
+            return value
+        checks.append(check_enum)
+
+    if 'const' in schema:
+        const = schema['const']
+
+        def check_const(value, path, errors):
+            if value != const:
+                errors.append((path, f"must be {const!r}"))
+            return value
+        checks.append(check_const)
+
+    checks += compile_bounds(schema, where)
+    if 'items' in schema:
+        checks += filter(None, [compile_items(schema['items'], f"{where}.items")])
+    if any(keyword in schema for keyword in ('properties', 'required', 'additionalProperties')):
+        checks.append(compile_object(schema, where))
+
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value, path, errors):
+        for check in checks:
+            value = check(value, path, errors)
+        return value
+    return check_all
+
+
+def compile_bounds(schema: dict, where: str) -> List[Check]:
+    """Length, pattern, range and size keywords, each applying to its own type only"""
+    checks = []
+    number = SCHEMA_TYPES['number']
+    bounds = [
+        ('minLength', lambda value: isinstance(value, str), lambda value, limit: len(value) >= limit,
+         'must have at least {} characters'),
+        ('maxLength', lambda value: isinstance(value, str), lambda value, limit: len(value) <= limit,
+         'must have at most {} characters'),
+        ('minimum', number, lambda value, limit: value >= limit, 'must be >= {}'),
+        ('maximum', number, lambda value, limit: value <= limit, 'must be <= {}'),
+        ('exclusiveMinimum', number, lambda value, limit: value > limit, 'must be > {}'),
+        ('exclusiveMaximum', number, lambda value, limit: value < limit, 'must be < {}'),
+        ('minItems', lambda value: isinstance(value, list), lambda value, limit: len(value) >= limit,
+         'must have at least {} items'),
+        ('maxItems', lambda value: isinstance(value, list), lambda value, limit: len(value) <= limit,
+         'must have at most {} items'),
+    ]
+    for keyword, applies, passes, message in bounds:
+        if keyword not in schema:
+            continue
+        limit = schema[keyword]
+        if not number(limit):
+            raise SchemaError(f"{where}.{keyword} must be a number")
+
+        def check_bound(value, path, errors, applies=applies, passes=passes, limit=limit, message=message):
+            if applies(value) and not passes(value, limit):
+                errors.append((path, message.format(limit)))
+            return value
+        checks.append(check_bound)
+
+    if 'pattern' in schema:
+        try:
+            pattern = re.compile(schema['pattern'])
+        except (re.error, TypeError) as e:
+            raise SchemaError(f"{where}.pattern: {str(e)}")
+
+        def check_pattern(value, path, errors):
+            if isinstance(value, str) and not pattern.search(value):
+                errors.append((path, f"must match {pattern.pattern!r}"))
+            return value
+        checks.append(check_pattern)
+    return checks
+
+
+def compile_items(items: Any, where: str) -> Optional[Check]:
+    item_check = compile_schema(items, where)
+    if item_check is None:
+        return None
+
+    def check_items(value, path, errors):
+        if not isinstance(value, list):
+            return value
+        checked = [item_check(item, path + (index,), errors) for index, item in enumerate(value)]
+        # Keep the caller's list unless an item got defaults
+        return checked if any(new is not old for new, old in zip(checked, value)) else value
+    return check_items
+
+
+def compile_object(schema: dict, where: str) -> Check:
+    properties = schema.get('properties', {})
+    required = schema.get('required', [])
+    additional = schema.get('additionalProperties', True)
+    if not isinstance(properties, dict):
+        raise SchemaError(f"{where}.properties must be an object")
+    if not isinstance(required, list):
+        raise SchemaError(f"{where}.required must be a list")
+
+    # (name, check, default) per declared property
+    fields = []
+    for name, subschema in properties.items():
+        check = compile_schema(subschema, f"{where}.properties.{name}")
+        default = subschema.get('default', MISSING) if isinstance(subschema, dict) else MISSING
+        fields.append((name, check, default))
+    # Required properties with a default are filled in, not missing
+    defaulted = {name for name, _, default in fields if default is not MISSING}
+    required = [name for name in required if name not in defaulted]
+    declared = set(properties)
+    additional_check = None if additional in (True, False) else compile_schema(additional, f"{where}.additionalProperties")
+
+    def check_object(value, path, errors):
+        if not isinstance(value, dict):
+            return value
+        for name in required:
+            if name not in value:
+                errors.append((path + (name,), 'required property missing'))
+        result = value
+        for name, check, default in fields:
+            if name in value:
+                if check is not None:
+                    item = check(value[name], path + (name,), errors)
+                    if item is not value[name]:
+                        result = {**result, name: item}
+            elif default is not MISSING:
+                result = {**result, name: copy.deepcopy(default)}
+        if additional is False:
+            for name in value:
+                if name not in declared:
+                    errors.append((path + (name,), 'unexpected property'))
+        elif additional_check is not None:
+            for name in value:
+                if name not in declared:
+                    item = additional_check(value[name], path + (name,), errors)
+                    if item is not value[name]:
+                        result = {**result, name: item}
+        return result
+    return check_object
+
+
+def json_type(value: Any) -> str:
+    for name in ('null', 'boolean', 'integer', 'number', 'string', 'array', 'object'):
+        if SCHEMA_TYPES[name](value):
+            return name
+    return type(value).__name__
+
+
+def check_workflow_schema(nodes: dict) -> dict:
+    """Raise SchemaError if the `schema` of a workflow definition cannot be compiled"""
+    compile_schema(nodes.get('schema'), 'nodes.schema')
+    return nodes
+
+
+def compile_node_input(definitions: List[dict]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """Build the function merging provided node inputs with defaults and coercing their types
+
+    Empty strings count as not provided. Booleans accept 'true', '1', 'yes',
+    'on'; digit strings become integers and numeric strings floats, other
+    values are passed through as given.
+    """
+    fields = []
+    for input_def in definitions:
+        input_type = input_def.get('type', 'string')
+        if input_type == 'boolean':
+            coerce = lambda value: value.lower() in ('true', '1', 'yes', 'on') if isinstance(value, str) else bool(value)
+        elif input_type == 'integer':
+            coerce = lambda value: int(value) if isinstance(value, str) and value.isdigit() else value
+        elif input_type == 'number':
+            coerce = coerce_number
+        else:
+            coerce = None
+        fields.append((input_def['name'], coerce, input_def.get('default', MISSING), input_def.get('required', False)))
+
+    def prepare(provided: Dict[str, Any]) -> Dict[str, Any]:
+        prepared = {}
+        missing = None
+        for name, coerce, default, required in fields:
+            value = provided.get(name, '')
+            if value != '':
+                prepared[name] = coerce(value) if coerce else value
+            elif default is not MISSING:
+                prepared[name] = copy.deepcopy(default)
+            elif required:
+                missing = (missing or []) + [((name,), f"Required input '{name}' not provided and no default value")]
+        if missing:
+            raise InputValidationError(missing)
+        return prepared
+    return prepare
+
+
+def coerce_number(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return value
+
+
+# (kind, id) -> (updated_at, compiled validator)
+compiled_validators: Dict[Tuple[str, int], Tuple[Any, Any]] = {}
+
+
+def cached_validator(kind: str, row: Any, build: Callable[[], Any]) -> Any:
+    """Compiled validator of a definition row, rebuilt when the row's updated_at changes"""
+    key = (kind, row.id)
+    entry = compiled_validators.get(key)
+    if entry is None or entry[0] != row.updated_at:
+        if len(compiled_validators) >= VALIDATOR_CACHE_SIZE:
+            compiled_validators.clear()
+        entry = (row.updated_at, build())
+        compiled_validators[key] = entry
+    return entry[1]
+
+
+def compile_workflow_schema(workflow: Workflow) -> Optional[Check]:
+    try:
+        return compile_schema((workflow.nodes or {}).get('schema'), 'nodes.schema')
+    except SchemaError as e:
+        # Saved before schemas were checked on save: keep accepting any input, as then
+        print(f"Workflow {workflow.id} schema not enforced: {str(e)}")
+        return None
+
+
+def validate_flow_input(workflow: Workflow, input_data: Any) -> Any:
+    """Check a workflow input against the workflow schema, returns it with schema defaults filled in"""
+    check = cached_validator('workflow', workflow, lambda: compile_workflow_schema(workflow))
+    if check is None:
+        return input_data
+    errors: Errors = []
+    input_data = check(input_data, (), errors)
+    if errors:
+        raise InputValidationError(errors)
+    return input_data
+
+
+def validate_flow_inputs(workflow: Workflow, inputs: List[Any], max_errors: Optional[int] = None) -> List[Any]:
+    """validate_flow_input for every input of a batch, errors are reported under the input's index"""
+    checked, errors = [], []
+    for index, input_data in enumerate(inputs):
+        try:
+            checked.append(validate_flow_input(workflow, input_data))
+        except InputValidationError as e:
+            errors += [((index, *path), message) for path, message in e.errors]
+    if errors:
+        raise InputValidationError(errors[:max_errors])
+    return checked
+
+
+def node_input_preparer(node: Node) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """Compiled prepare function of a node's input definitions"""
+    return cached_validator('node', node, lambda: compile_node_input(node.input))
@@ -1,17 +1,44 @@
 import json
 import asyncio
 import time
-from typing import Any, Dict, List, Optional
-from concurrent.futures import ThreadPoolExecutor
-from backend.lib.db import Workflow, Job, Node
-from backend.lib.node import execute_node
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from peewee import IntegrityError
+from backend.lib.db import db, connection_scope, Workflow, Job, Node, User
+from backend.lib.node import execute_node_async
+from backend.lib.job_writer import job_writer
+from backend.lib.events import publish_event, TERMINAL_STATUSES
+from backend.lib.metrics import WORKFLOW_SECONDS, MODULE_SECONDS, MODULE_RETRIES
+from backend.lib.trace import current_span, span, start_job_trace
+from backend.lib.profiling import attribute_job_frames
+from backend.lib.validation import InputValidationError, validate_flow_input
 
 class WorkflowExecutor:
     def __init__(self, workflow: Workflow, job: Job):
         self.workflow = workflow
         self.job = job
         self.results = {}
-        self.executor = ThreadPoolExecutor(max_workers=10)
+        self.trace = None  # Span tree of the run, see backend/lib/trace.py
+    
+    def set_state(self, durable: bool = False, **fields):
+        """Update job columns through the group-commit writer, skipping unchanged values"""
+        changed = {name: value for name, value in fields.items() if getattr(self.job, name) != value}
+        for name, value in changed.items():
+            setattr(self.job, name, value)
+        if changed or durable:
+            job_writer.update(self.job.id, durable=durable, **changed)
+        if 'status' in changed and self.job.status not in TERMINAL_STATUSES:
+            publish_event(self.job.id, 'job', status=self.job.status)
+
+    async def commit_state(self, **fields):
+        """Update job columns and commit them (terminal states) off the event loop"""
+        self.set_state(**fields)
+        if self.trace:
+            self.trace.finish(0, status=self.job.status)
+            job_writer.update(self.job.id, trace=self.trace.to_dict())
+        await asyncio.get_running_loop().run_in_executor(None, job_writer.flush)
+        # Published once committed, so a client reacting to it reads the final job
+        publish_event(self.job.id, 'job', status=self.job.status, error=self.job.error)
     
     def evaluate_expression(self, expr: str, context: Dict[str, Any]) -> Any:
         """Safely evaluate a JavaScript-like expression"""
@@ -160,6 +187,26 @@ class WorkflowExecutor:
         return result
     
     async def execute_module(self, module: Dict[str, Any], context: Dict[str, Any]) -> Any:
+        """Execute a single module, publishing its start, finish and error events"""
+        module_id = module.get('id', 'unknown')
+        module_type = module.get('value', {}).get('type', 'script')
+        publish_event(self.job.id, 'module_started', module_id=module_id, module_type=module_type)
+        start = time.perf_counter()
+        try:
+            with span('module', id=module_id, type=module_type):
+                result = await self.run_module(module, context)
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            MODULE_SECONDS.observe(elapsed, module_type, 'error')
+            publish_event(self.job.id, 'module_failed', module_id=module_id, error=str(e), duration_ms=round(elapsed * 1000, 2))
+            raise
+        elapsed = time.perf_counter() - start
+        MODULE_SECONDS.observe(elapsed, module_type, 'ok')
+        duration_ms = round(elapsed * 1000, 2)
+        publish_event(self.job.id, 'module_finished', module_id=module_id, duration_ms=duration_ms)
+        return result
+
+    async def run_module(self, module: Dict[str, Any], context: Dict[str, Any]) -> Any:
         """Execute a single module"""
         module_id = module.get('id', 'unknown')
         module_value = module.get('value', {})
@@ -174,12 +221,11 @@ class WorkflowExecutor:
                     
                     # Transform inputs
                     input_transforms = module_value.get('input_transforms', {})
-                    input_data = self.transform_input(input_transforms, context)
+                    with span('transform'):
+                        input_data = self.transform_input(input_transforms, context)
                     
                     # Execute node
-                    result = await asyncio.get_event_loop().run_in_executor(
-                        self.executor, execute_node, node_id, input_data
-                    )
+                    result = await execute_node_async(node_id, input_data, self.job.id)
                     
                     # Store result
                     self.results[module_id] = result
@@ -250,14 +296,20 @@ class WorkflowExecutor:
                 seconds = exponential.get('seconds', 5)
                 
                 for attempt in range(attempts):
+                    self.set_state(retry_count=self.job.retry_count + 1)
+                    MODULE_RETRIES.inc(str(self.workflow.id))
+                    publish_event(self.job.id, 'module_retrying', module_id=module_id, attempt=attempt + 1, error=str(e))
                     if attempt > 0:
                         wait_time = seconds * (multiplier ** (attempt - 1))
-                        await asyncio.sleep(wait_time)
+                        with span('backoff', attempt=attempt + 1, seconds=wait_time):
+                            await asyncio.sleep(wait_time)
                     
                     try:
                         # Retry the execution
-                        return await self.execute_module(module, context)
-                    except Exception:
+                        with span('retry', attempt=attempt + 1):
+                            return await self.run_module(module, context)
+                    except Exception as retry_error:
+                        e = retry_error
                         if attempt == attempts - 1:
                             raise
             else:
@@ -265,10 +317,18 @@ class WorkflowExecutor:
     
     async def execute(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute the workflow"""
+        try:
+            # Submissions are checked already, this catches jobs queued before a schema change
+            input_data = validate_flow_input(self.workflow, input_data)
+        except InputValidationError as e:
+            await self.commit_state(status='failed', error=str(e))
+            raise
+        
         # Update job status
-        self.job.status = 'running'
-        self.job.input = input_data
-        self.job.save()
+        self.set_state(status='running', input=input_data)
+        start = time.perf_counter()
+        self.trace = start_job_trace(self.job)
+        token = current_span.set((self.trace, 0) if self.trace else None)
         
         try:
             # Initialize context
@@ -288,40 +348,104 @@ class WorkflowExecutor:
                 final_result = result
             
             # Update job with success
-            self.job.status = 'completed'
-            self.job.output = self.results
-            self.job.save()
+            # Terminal states are committed before returning
+            await self.commit_state(status='completed', output=self.results)
+            WORKFLOW_SECONDS.observe(time.perf_counter() - start, str(self.workflow.id), 'completed')
             
             return self.results
             
         except Exception as e:
             # Update job with failure
-            self.job.status = 'failed'
-            self.job.error = str(e)
-            self.job.save()
+            await self.commit_state(status='failed', error=str(e))
+            WORKFLOW_SECONDS.observe(time.perf_counter() - start, str(self.workflow.id), 'failed')
             raise
         finally:
-            self.executor.shutdown(wait=False)
+            current_span.reset(token)
 
+# Every stack of a job on the event loop runs under its execute() coroutine
+attribute_job_frames(WorkflowExecutor.execute, lambda local_vars: local_vars['self'].job.id)
 
-async def execute_workflow(workflow_id: int, input_data: Dict[str, Any], job_name: Optional[str] = None) -> Job:
-    """Execute a workflow by ID"""
-    try:
-        workflow = Workflow.get(Workflow.id == workflow_id)
-        
-        # Create job
+
+def start_job(workflow_id: int, input_data: Dict[str, Any], job_name: Optional[str] = None, user: Optional[User] = None) -> Tuple[Workflow, Job]:
+    """Create a job as running so the worker never picks it up as well"""
+    with connection_scope():
+        try:
+            workflow = Workflow.get(Workflow.id == workflow_id)
+        except Workflow.DoesNotExist:
+            raise ValueError(f"Workflow with ID {workflow_id} not found")
+        input_data = validate_flow_input(workflow, input_data)
         job = Job.create(
             name=job_name or f"Job for {workflow.name}",
             workflow=workflow,
-            status='pending',
+            user=user,
+            status='running',
             input=input_data
         )
-        
-        # Execute workflow
-        executor = WorkflowExecutor(workflow, job)
-        await executor.execute(input_data)
-        
-        return job
-        
+    return workflow, job
+
+
+async def execute_workflow(
+    workflow_id: int,
+    input_data: Dict[str, Any],
+    job_name: Optional[str] = None,
+    user: Optional[User] = None
+) -> Job:
+    """Execute a workflow by ID"""
+    # Database work runs in a thread, node runs in the node pool: the event loop never blocks
+    workflow, job = await asyncio.get_running_loop().run_in_executor(
+        None, start_job, workflow_id, input_data, job_name, user
+    )
+    
+    # Execute workflow
+    executor = WorkflowExecutor(workflow, job)
+    await executor.execute(input_data)
+    
+    return job
+
+
+def idempotency_scope(model, idempotency_key: str, workflow: Workflow, user: Optional[User]):
+    """Rows of `model` (Job or JobBatch) submitted with a key, keys only repeat within one user and workflow"""
+    owner = model.user.is_null() if user is None else (model.user == user.id)
+    return (model.idempotency_key == idempotency_key) & (model.workflow == workflow.id) & owner
+
+
+def enqueue_workflow(
+    workflow_id: int,
+    input_data: Dict[str, Any],
+    job_name: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    user: Optional[User] = None,
+    priority: int = 0,
+    run_at: Optional[datetime] = None
+) -> Tuple[Job, bool]:
+    """Create a pending job for the worker pool, returns (job, created)"""
+    try:
+        workflow = Workflow.get(Workflow.id == workflow_id)
     except Workflow.DoesNotExist:
         raise ValueError(f"Workflow with ID {workflow_id} not found")
+    input_data = validate_flow_input(workflow, input_data)
+
+    if idempotency_key:
+        existing = Job.get_or_none(idempotency_scope(Job, idempotency_key, workflow, user))
+        if existing:
+            return existing, False
+
+    try:
+        with db.atomic():
+            job = Job.create(
+                name=job_name or f"Job for {workflow.name}",
+                workflow=workflow,
+                user=user,
+                # Delayed jobs wait in the due-time queue until the worker promotes them
+                status='scheduled' if run_at and run_at > datetime.now() else 'pending',
+                run_at=run_at,
+                priority=priority,
+                input=input_data,
+                idempotency_key=idempotency_key
+            )
+        return job, True
+    except IntegrityError:
+        # A concurrent submission with the same key won the race
+        if idempotency_key:
+            return Job.get(idempotency_scope(Job, idempotency_key, workflow, user)), False
+        raise
@@ -0,0 +1,7 @@
+"""Node path and body template columns"""
+from backend.lib.db import Node, add_column_if_missing
+
+
+def migrate():
+    add_column_if_missing('node', 'path', Node.path)
+    add_column_if_missing('node', 'body_template', Node.body_template)
@@ -0,0 +1,20 @@
+"""Job queue: idempotency keys, priorities, fair scheduling and delayed jobs"""
+from backend.lib.db import Job, User, add_column_if_missing, create_index
+
+
+def migrate():
+    add_column_if_missing('job', 'idempotency_key', Job.idempotency_key)
+    add_column_if_missing('job', 'priority', Job.priority)
+    add_column_if_missing('job', 'user_id', Job.user)
+    add_column_if_missing('job', 'run_at', Job.run_at)
+    add_column_if_missing('job', 'claimed_by', Job.claimed_by)
+    add_column_if_missing('job', 'claimed_at', Job.claimed_at)
+    add_column_if_missing('user', 'queue_weight', User.queue_weight)
+    add_column_if_missing('user', 'max_running_jobs', User.max_running_jobs)
+
+    # NULL keys are allowed more than once, so jobs without a key are unaffected
+    create_index('job_idempotency_key', 'job', 'idempotency_key', unique=True)
+    # Per-user queue heads and running counts for the worker claim query
+    create_index('job_status_user_priority_created', 'job', 'status, user_id, priority DESC, created_at')
+    # Due-time queue of delayed jobs, promoted to pending by the claim
+    create_index('job_status_run_at', 'job', 'status, run_at')
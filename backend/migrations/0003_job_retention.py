@@ -0,0 +1,12 @@
+"""Job archival columns"""
+from backend.lib.db import Job, add_column_if_missing, create_index
+
+
+def migrate():
+    add_column_if_missing('job', 'archived_at', Job.archived_at)
+    add_column_if_missing('job', 'archive_segment', Job.archive_segment)
+
+    # Retention candidates, only rows that still hold their payloads are indexed
+    create_index(
+        'job_unarchived_status_updated', 'job', 'status, updated_at', where='archived_at IS NULL'
+    )
@@ -0,0 +1,11 @@
+"""Indexes for the job listings and the pending queue"""
+from backend.lib.db import create_index
+
+
+def migrate():
+    # GET /api/v1/jobs: newest first
+    create_index('job_created_at', 'job', 'created_at')
+    # GET /api/v1/workflow/{id}/jobs: newest first within a workflow
+    create_index('job_workflow_created_at', 'job', 'workflow_id, created_at')
+    # Jobs of one status in arrival order (pending queue, status filters)
+    create_index('job_status_created_at', 'job', 'status, created_at')
@@ -0,0 +1,37 @@
+"""Move job input/output into the job_payload table"""
+import json
+from backend.lib.db import db, drop_column_if_exists, JobPayload
+
+BATCH_SIZE = 500
+
+
+def load(value):
+    # SQLite returns the JSON text, PostgreSQL the decoded JSONB
+    if isinstance(value, str):
+        return json.loads(value)
+    return value if value is not None else {}
+
+
+def migrate():
+    if 'input' not in [c.name for c in db.get_columns('job')]:
+        return
+
+    db.create_tables([JobPayload])
+    last_id = 0
+    while True:
+        rows = db.execute_sql(
+            f"SELECT id, input, output FROM job WHERE id > {db.param} ORDER BY id LIMIT {BATCH_SIZE}",
+            (last_id,)
+        ).fetchall()
+        if not rows:
+            break
+        (JobPayload
+         .insert_many([{'job': job_id, 'input': load(input), 'output': load(output)}
+                       for job_id, input, output in rows])
+         .on_conflict_ignore()
+         .execute())
+        last_id = rows[-1][0]
+        print(f"Copied payloads of jobs up to {last_id}")
+
+    drop_column_if_exists('job', 'input')
+    drop_column_if_exists('job', 'output')
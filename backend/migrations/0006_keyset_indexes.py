@@ -0,0 +1,11 @@
+"""Job listing indexes ending with id, so keyset pages of (created_at, id) are index range scans"""
+from backend.lib.db import db, create_index
+
+
+def migrate():
+    # SQLite appends the rowid to every index, PostgreSQL needs id in the key
+    create_index('job_created_at_id', 'job', 'created_at, id')
+    create_index('job_workflow_created_at_id', 'job', 'workflow_id, created_at, id')
+    create_index('job_status_created_at_id', 'job', 'status, created_at, id')
+    for name in ('job_created_at', 'job_workflow_created_at', 'job_status_created_at'):
+        db.execute_sql(f"DROP INDEX IF EXISTS {name};")
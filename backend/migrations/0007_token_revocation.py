@@ -0,0 +1,6 @@
+"""Table of token revocations shared by all API processes"""
+from backend.lib.db import db, TokenRevocation
+
+
+def migrate():
+    db.create_tables([TokenRevocation])
@@ -0,0 +1,6 @@
+"""Table relaying job progress events between the worker and API processes"""
+from backend.lib.db import db, JobEvent
+
+
+def migrate():
+    db.create_tables([JobEvent])
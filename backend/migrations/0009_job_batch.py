@@ -0,0 +1,9 @@
+"""Bulk job submissions: job_batch table and the job column pointing to it"""
+from backend.lib.db import db, Job, JobBatch, add_column_if_missing, create_index
+
+
+def migrate():
+    db.create_tables([JobBatch])
+    add_column_if_missing('job', 'batch_id', Job.batch)
+    # Batch progress (job counts per status) without reading the job rows
+    create_index('job_batch_status', 'job', 'batch_id, status')
@@ -0,0 +1,8 @@
+"""Write counters of the definition tables, the ETags of their GET endpoints"""
+from backend.lib.db import db, TableVersion, create_version_trigger
+
+
+def migrate():
+    db.create_tables([TableVersion])
+    for table in ('connector', 'node', 'workflow'):
+        create_version_trigger(table)
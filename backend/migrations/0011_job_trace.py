@@ -0,0 +1,6 @@
+"""Span tree of each job run, stored with its payload"""
+from backend.lib.db import JobPayload, add_column_if_missing
+
+
+def migrate():
+    add_column_if_missing('job_payload', 'trace', JobPayload.trace)
@@ -0,0 +1,14 @@
+"""Idempotency keys scoped to the submitting user and the workflow instead of the whole table"""
+from backend.lib.db import db, create_index
+
+# A user without an account (NULL) gets its own scope
+IDEMPOTENCY_SCOPE = 'idempotency_key, workflow_id, COALESCE(user_id, 0)'
+
+
+def migrate():
+    # Keys were unique across all users and workflows, so the existing rows satisfy the scoped indexes
+    db.execute_sql("DROP INDEX IF EXISTS job_idempotency_key;")
+    db.execute_sql("DROP INDEX IF EXISTS jobbatch_idempotency_key;")
+    create_index('job_idempotency_scope', 'job', IDEMPOTENCY_SCOPE, unique=True, where='idempotency_key IS NOT NULL')
+    create_index('job_batch_idempotency_scope', 'job_batch', IDEMPOTENCY_SCOPE, unique=True,
+                 where='idempotency_key IS NOT NULL')
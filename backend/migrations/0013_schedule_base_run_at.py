@@ -0,0 +1,7 @@
+"""Cron time of a schedule's next run, kept apart from its offset fire time"""
+from backend.lib.db import Schedule, add_column_if_missing
+
+
+def migrate():
+    # Existing schedules have none yet: their next run is computed from next_run_at once
+    add_column_if_missing('schedule', 'base_run_at', Schedule.base_run_at)
@@ -0,0 +1,71 @@
+"""Versioned schema migrations
+
+Each migration is a module named NNNN_description.py in this package with a
+docstring and a migrate() function. Migrations run in order, each in its own
+transaction, and the applied versions are recorded in the schema_version
+table. Every migration must be idempotent: databases created before the
+framework existed already have some of the columns.
+"""
+import pkgutil
+import importlib
+from datetime import datetime
+from typing import List, Tuple
+from types import ModuleType
+from backend.lib.db import db, IS_POSTGRES, SchemaVersion, write_transaction
+
+# Advisory lock key serializing migrations across processes on PostgreSQL
+MIGRATION_LOCK_KEY = 0x4A0B0001
+
+
+def discover() -> List[Tuple[int, str, ModuleType]]:
+    """All migrations of this package as (version, name, module), ordered by version"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        prefix, _, name = module_info.name.partition('_')
+        if not prefix.isdigit():
+            continue
+        module = importlib.import_module(f"{__name__}.{module_info.name}")
+        migrations.append((int(prefix), name, module))
+
+    migrations.sort(key=lambda migration: migration[0])
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return migrations
+
+
+def latest_version() -> int:
+    """Version of the newest migration"""
+    migrations = discover()
+    return migrations[-1][0] if migrations else 0
+
+
+def current_version() -> int:
+    """Highest version applied to the database (0 when none)"""
+    if not SchemaVersion.table_exists():
+        return 0
+    row = SchemaVersion.select(SchemaVersion.version).order_by(SchemaVersion.version.desc()).first()
+    return row.version if row else 0
+
+
+def apply_migrations() -> int:
+    """Apply the pending migrations in order, returns the number applied"""
+    SchemaVersion.create_table(safe=True)
+    applied = 0
+
+    for version, name, module in discover():
+        with write_transaction():
+            if IS_POSTGRES:
+                db.execute_sql("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            # Checked inside the transaction: another process may have applied it meanwhile
+            if SchemaVersion.get_or_none(SchemaVersion.version == version):
+                continue
+
+            print(f"Applying migration {version:04d} {name}...")
+            module.migrate()
+            SchemaVersion.create(version=version, name=name, applied_at=datetime.now())
+            applied += 1
+
+    if applied:
+        print(f"Applied {applied} migrations, schema is at version {current_version()}")
+    return applied
@@ -0,0 +1,78 @@
+"""Profile a running API or worker process
+
+    python -m backend.profile <pid> --seconds 10 [--job-id 42] [--mode deterministic] > worker.folded
+
+Writes the request to <profile dir>/request.json, sends SIGUSR2 to the
+process and prints the profile it writes. Signalling a worker supervisor
+profiles all of its worker processes; their collapsed stacks are merged.
+The API process can also be profiled through POST /api/v1/admin/profile.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import signal
+import argparse
+from collections import Counter
+from backend.lib.profiling import PROFILE_MODES, PROFILE_SAMPLE_INTERVAL_MS, profile_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pid", type=int, help="API, worker or worker supervisor process id")
+    parser.add_argument("--mode", choices=PROFILE_MODES, default="sampling")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--interval-ms", type=float, default=PROFILE_SAMPLE_INTERVAL_MS)
+    parser.add_argument("--job-id", type=int, help="Only keep the stacks working for this job")
+    parser.add_argument("--idle", action="store_true", help="Keep stacks of threads waiting on locks, queues or sockets")
+    parser.add_argument("--wait", type=float, default=2, help="Seconds to wait for more processes once one answered")
+    args = parser.parse_args()
+
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    request = {"mode": args.mode, "seconds": args.seconds, "interval_ms": args.interval_ms, "idle": args.idle}
+    if args.job_id is not None:
+        request["job_id"] = args.job_id
+    request_path = os.path.join(directory, "request.json")
+    with open(request_path, "w") as f:
+        json.dump(request, f)
+
+    before = set(glob.glob(os.path.join(directory, "profile-*")))
+    os.kill(args.pid, signal.SIGUSR2)
+
+    # Wait for the first profile, then a little for the other processes of a supervisor
+    deadline = time.time() + args.seconds + 30
+    written = []
+    while time.time() < deadline:
+        written = sorted(set(glob.glob(os.path.join(directory, "profile-*"))) - before)
+        written = [path for path in written if not path.endswith(".tmp")]
+        if written:
+            time.sleep(args.wait)
+            written = sorted(set(glob.glob(os.path.join(directory, "profile-*"))) - before)
+            written = [path for path in written if not path.endswith(".tmp")]
+            break
+        time.sleep(0.2)
+    os.remove(request_path)
+
+    if not written:
+        print(f"No profile written in {directory}, see the output of process {args.pid}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Profiles: {', '.join(written)}", file=sys.stderr)
+
+    if args.mode == "deterministic":
+        for path in written:
+            with open(path) as f:
+                sys.stdout.write(f.read())
+        return
+    stacks = Counter()
+    for path in written:
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                stacks[stack] += int(count)
+    sys.stdout.write("".join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+
+
+if __name__ == "__main__":
+    main()
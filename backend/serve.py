@@ -0,0 +1,45 @@
+"""Production API launcher
+
+    python -m backend.serve --workers 4 --port 8000
+
+Bootstraps the database once (schema, migrations, admin user) and then starts
+uvicorn with prefork workers sharing the listening socket, without the
+reloader. Workers skip the bootstrap in their startup (APIFLOW_BOOTSTRAPPED).
+"""
+import os
+import argparse
+import uvicorn
+from backend.lib.bootstrap import bootstrap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="APIFlow API server")
+    parser.add_argument("--host", default=os.getenv('API_HOST', '0.0.0.0'))
+    parser.add_argument("--port", type=int, default=int(os.getenv('API_PORT', '8000')))
+    parser.add_argument(
+        "--workers", type=int,
+        default=int(os.getenv('API_WORKERS') or os.cpu_count() or 1),
+        help="Number of API processes"
+    )
+    parser.add_argument("--log-level", default=os.getenv('API_LOG_LEVEL', 'info'))
+    args = parser.parse_args()
+
+    admin_user = bootstrap()
+    print(f"Admin API token: {admin_user.api_token}")
+    print(f"Starting {args.workers} API workers on {args.host}:{args.port}")
+
+    # Inherited by the workers: their startup must not redo the bootstrap
+    os.environ['APIFLOW_BOOTSTRAPPED'] = '1'
+    uvicorn.run(
+        "backend.api:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        proxy_headers=True,
+        access_log=os.getenv('API_ACCESS_LOG', '0') == '1'
+    )
+
+
+if __name__ == "__main__":
+    main()
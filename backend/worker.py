@@ -1,14 +1,27 @@
 import os
 import asyncio
+import argparse
+import signal
+import socket
 import time
-from datetime import datetime
-from backend.lib.db import db, create_tables, Job, Workflow
+from backend.lib.db import Job, connection_scope
+from backend.lib.bootstrap import ensure_schema
+from backend.lib.queue import claim_jobs
+from backend.lib.schedule import fire_due_schedules
+from backend.lib.metrics import CLAIM_SECONDS, JOBS_CLAIMED, start_metrics_writer
+from backend.lib.profiling import install_profile_signal
+from backend.lib.retention import JOB_RETENTION_INTERVAL, retention_enabled, run_retention_pass
 from backend.lib.workflow import WorkflowExecutor
 
 class Worker:
-    def __init__(self, poll_interval=5):
+    def __init__(self, poll_interval=5, concurrency=5):
         self.poll_interval = poll_interval
+        self.concurrency = concurrency  # Max jobs running at once in this worker
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.tasks = set()
         self.running = False
+        self.stats = {'processed': 0, 'failed': 0}
+        self.retention = retention_enabled()  # Only one process of a supervisor archives jobs
         
     async def process_job(self, job: Job):
         """Process a single job"""
@@ -25,41 +38,67 @@ class Worker:
             await executor.execute(job.input)
             
             print(f"Job {job.id} completed successfully")
+            self.stats['processed'] += 1
             
         except Exception as e:
             print(f"Job {job.id} failed: {str(e)}")
+            self.stats['failed'] += 1
             # The executor already updates the job status
     
+    def poll_database(self, limit: int) -> list:
+        """Fire due schedules and claim up to limit jobs, blocking: run off the event loop"""
+        with connection_scope():
+            # Turn due cron schedules into pending jobs
+            fire_due_schedules()
+            
+            # Claim jobs for the free slots (priority and per-user fairness are handled by the queue)
+            claim_started = time.perf_counter()
+            claimed_jobs = claim_jobs(limit, self.worker_id)
+            CLAIM_SECONDS.observe(time.perf_counter() - claim_started)
+        JOBS_CLAIMED.inc(amount=len(claimed_jobs))
+        return claimed_jobs
+    
+    async def retention_loop(self):
+        """Archive old jobs in the background, in small batches off the event loop"""
+        loop = asyncio.get_running_loop()
+        while self.running:
+            try:
+                await loop.run_in_executor(None, run_retention_pass, 20)
+            except Exception as e:
+                print(f"Retention error: {str(e)}")
+            await asyncio.sleep(JOB_RETENTION_INTERVAL)
+    
     async def run(self):
         """Main worker loop"""
         self.running = True
         print("Worker started, polling for jobs...")
         
+        retention = asyncio.create_task(self.retention_loop()) if self.retention else None
+        loop = asyncio.get_running_loop()
+        
         while self.running:
             try:
-                # Get pending jobs
-                with db.atomic():
-                    pending_jobs = list(
-                        Job.select()
-                        .where(Job.status == 'pending')
-                        .order_by(Job.created_at)
-                        .limit(5)  # Process up to 5 jobs at a time
-                    )
+                # Off the event loop, the running jobs keep going while the database is busy
+                claimed_jobs = await loop.run_in_executor(
+                    None, self.poll_database, self.concurrency - len(self.tasks)
+                )
                 
-                if pending_jobs:
-                    print(f"Found {len(pending_jobs)} pending jobs")
+                if claimed_jobs:
+                    print(f"Claimed {len(claimed_jobs)} pending jobs")
                     
                     # Process jobs concurrently
-                    tasks = []
-                    for job in pending_jobs:
+                    for job in claimed_jobs:
                         task = asyncio.create_task(self.process_job(job))
-                        tasks.append(task)
-                    
-                    # Wait for all jobs to complete
-                    await asyncio.gather(*tasks, return_exceptions=True)
+                        self.tasks.add(task)
+                        task.add_done_callback(self.tasks.discard)
                 
-                # Wait before next poll
-                await asyncio.sleep(self.poll_interval)
+                # Wait before next poll, or until a slot frees up
+                if self.tasks:
+                    await asyncio.wait(
+                        self.tasks, timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED
+                    )
+                else:
+                    await asyncio.sleep(self.poll_interval)
                 
             except KeyboardInterrupt:
                 print("Worker interrupted by user")
@@ -68,20 +107,83 @@ class Worker:
             except Exception as e:
                 print(f"Worker error: {str(e)}")
                 await asyncio.sleep(self.poll_interval)
+        
+        if retention:
+            retention.cancel()
+        
+        # Drain: let the jobs already claimed finish before exiting
+        if self.tasks:
+            print(f"Draining {len(self.tasks)} running jobs...")
+            await asyncio.gather(*self.tasks, return_exceptions=True)
     
     def stop(self):
         """Stop the worker"""
         self.running = False
         print("Worker stopping...")
+    
+    def health(self) -> dict:
+        """Snapshot of the worker state for the supervisor"""
+        return {
+            'worker_id': self.worker_id,
+            'pid': os.getpid(),
+            'running_jobs': len(self.tasks),
+            'concurrency': self.concurrency,
+            'processed': self.stats['processed'],
+            'failed': self.stats['failed'],
+            'time': time.time()
+        }
+
+
+def create_worker() -> Worker:
+    """Create a worker configured from the environment"""
+    return Worker(
+        poll_interval=float(os.getenv('WORKER_POLL_INTERVAL', '5')),
+        concurrency=int(os.getenv('WORKER_CONCURRENCY', '5'))
+    )
+
+
+async def heartbeat(worker: Worker, index: int, heartbeat_queue, interval: float):
+    """Periodically report the worker state to the supervisor"""
+    while True:
+        heartbeat_queue.put({'index': index, **worker.health()})
+        await asyncio.sleep(interval)
+
+
+async def run_child(index: int, heartbeat_queue, heartbeat_interval: float):
+    """Event loop of a supervised worker process"""
+    worker = create_worker()
+    worker.retention = worker.retention and index == 0
+    loop = asyncio.get_running_loop()
+    
+    # SIGTERM drains the worker, the supervisor handles SIGINT for the whole group
+    loop.add_signal_handler(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # SIGUSR2 (forwarded by the supervisor) profiles this process, see backend/profile.py
+    install_profile_signal(loop)
+    
+    start_metrics_writer()
+    reporter = asyncio.create_task(heartbeat(worker, index, heartbeat_queue, heartbeat_interval))
+    try:
+        await worker.run()
+    finally:
+        reporter.cancel()
+        heartbeat_queue.put({'index': index, **worker.health()})
+
+
+def run_worker_process(index: int, heartbeat_queue, heartbeat_interval: float):
+    """Entry point of a child worker process, each child owns its loop and connections"""
+    asyncio.run(run_child(index, heartbeat_queue, heartbeat_interval))
 
 
 async def main():
-    """Main entry point"""
+    """Run a single worker in this process"""
     # Create tables if needed
-    create_tables()
+    ensure_schema()
     
     # Create and run worker
-    worker = Worker(poll_interval=5)
+    worker = create_worker()
+    start_metrics_writer()
+    install_profile_signal(asyncio.get_running_loop())
     
     try:
         await worker.run()
@@ -92,4 +194,17 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="APIFlow worker")
+    parser.add_argument(
+        "--processes", type=int,
+        default=int(os.getenv('WORKER_PROCESSES', os.cpu_count() or 1)),
+        help="Number of worker processes to supervise (0 runs a single worker in-process)"
+    )
+    args = parser.parse_args()
+    
+    if args.processes > 0:
+        from backend.lib.supervisor import Supervisor
+        ensure_schema()
+        Supervisor(args.processes).run()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,160 @@
+"""/health latency of a live API process while slow node runs are in progress
+
+    python -m benchmarks.health_latency --slow-runs 20 --delay 5 --duration 4
+
+Starts a mock upstream that answers after --delay seconds, then an API
+process (uvicorn) on a fresh database with a node pointing at that upstream.
+While --slow-runs node runs wait on the upstream, /health and an
+authenticated list endpoint are polled. Prints the latencies as JSON and exits
+with an error when the /health p99 exceeds --max-p99-ms (a blocked event loop).
+"""
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_upstream(delay: float) -> int:
+    """Mock upstream API that answers every request after `delay` seconds"""
+    class SlowHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = json.dumps({'ok': True}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', free_port()), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def start_api(database_path: str, port: int) -> subprocess.Popen:
+    env = {**os.environ, 'DATABASE_PATH': database_path}
+    env.pop('DATABASE_URL', None)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'backend.api:app', '--port', str(port), '--log-level', 'warning'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/health', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('API did not start')
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    pick = lambda q: round(samples[min(int(len(samples) * q), len(samples) - 1)] * 1000, 2)
+    return {'count': len(samples), 'p50_ms': pick(0.5), 'p99_ms': pick(0.99), 'max_ms': round(samples[-1] * 1000, 2)}
+
+
+def poll(url: str, headers: dict, duration: float, interval: float = 0.02, timeout: float = 5) -> list:
+    """Latencies of sequential GETs for `duration` seconds, a timeout counts as `timeout`"""
+    samples = []
+    end = time.time() + duration
+    while time.time() < end:
+        start = time.perf_counter()
+        try:
+            requests.get(url, headers=headers, timeout=timeout).raise_for_status()
+            samples.append(time.perf_counter() - start)
+        except requests.Timeout:
+            samples.append(timeout)
+        time.sleep(interval)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slow-runs', type=int, default=20)
+    parser.add_argument('--delay', type=float, default=5)
+    parser.add_argument('--duration', type=float, default=4)
+    parser.add_argument('--max-p99-ms', type=float, default=100)
+    args = parser.parse_args()
+
+    upstream_port = start_upstream(args.delay)
+    database_path = os.path.join(tempfile.mkdtemp(), 'apiflow.db')
+    api_port = free_port()
+    api = start_api(database_path, api_port)
+    base = f'http://127.0.0.1:{api_port}'
+
+    try:
+        with sqlite3.connect(database_path) as conn:
+            token, = conn.execute('SELECT api_token FROM user WHERE is_admin = 1').fetchone()
+        headers = {'Authorization': f'Bearer {token}'}
+
+        connector = requests.post(f'{base}/api/v1/connectors', headers=headers, json={
+            'name': 'slow upstream', 'base_url': f'http://127.0.0.1:{upstream_port}', 'method': 'GET'
+        }).json()
+        node = requests.post(f'{base}/api/v1/nodes', headers=headers, json={
+            'name': 'slow node', 'description': '', 'connector_id': connector['id'], 'path': '/slow'
+        }).json()
+
+        idle = percentiles(poll(f'{base}/health', {}, 1))
+
+        runs = [
+            threading.Thread(
+                target=requests.post,
+                args=(f"{base}/api/v1/node/{node['id']}/run",),
+                kwargs={'headers': headers, 'json': {'input': {}}, 'timeout': args.delay + 60}
+            )
+            for _ in range(args.slow_runs)
+        ]
+        for run in runs:
+            run.start()
+        time.sleep(0.2)  # Let the runs reach the upstream
+
+        list_samples = []
+        lister = threading.Thread(
+            target=lambda: list_samples.extend(poll(f'{base}/api/v1/workflows', headers, args.duration))
+        )
+        lister.start()
+        busy = percentiles(poll(f'{base}/health', {}, args.duration))
+        lister.join()
+        for run in runs:
+            run.join()
+
+        result = {
+            'slow_runs': args.slow_runs,
+            'upstream_delay_s': args.delay,
+            'health_idle': idle,
+            'health_during_runs': busy,
+            'workflows_during_runs': percentiles(list_samples)
+        }
+        print(json.dumps(result))
+    finally:
+        api.terminate()
+        api.wait(10)
+
+    if busy['p99_ms'] > args.max_p99_ms:
+        print(f"/health p99 {busy['p99_ms']}ms exceeds {args.max_p99_ms}ms while nodes run", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
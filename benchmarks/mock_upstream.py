@@ -0,0 +1,179 @@
+"""Configurable mock upstream API for benchmarks
+
+    python -m benchmarks.mock_upstream --port 9000 --latency lognormal:50:0.5 --payload-bytes 2048 \
+        --error-rate 0.01 --rate-limit-rate 0.02
+
+Answers every method and path with a JSON object padded to --payload-bytes,
+after a delay drawn from --latency:
+
+    fixed:MS                 always MS milliseconds (fixed:0 answers at once)
+    uniform:MIN_MS:MAX_MS
+    normal:MEAN_MS:STDDEV_MS
+    lognormal:MEDIAN_MS:SIGMA
+    exp:MEAN_MS
+
+--error-rate of the requests get a 500, --rate-limit-rate a 429 with a
+Retry-After header. GET /__stats returns the request count, status counts and
+upstream time (`?reset=1` starts over), so benchmarks can tell APIFlow time
+from upstream time.
+
+With --samples (written by benchmarks.replay from a traffic recording),
+requests under /replay/<connector id>/ get the delay, status and response size
+of a random recorded call of that connector instead.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit, parse_qs
+
+LATENCY_DISTRIBUTIONS = {
+    'fixed': lambda ms: (lambda: ms / 1000),
+    'uniform': lambda low, high: (lambda: random.uniform(low, high) / 1000),
+    'normal': lambda mean, stddev: (lambda: max(random.gauss(mean, stddev), 0) / 1000),
+    'lognormal': lambda median, sigma: (lambda: random.lognormvariate(0, sigma) * median / 1000),
+    'exp': lambda mean: (lambda: random.expovariate(1 / mean) / 1000 if mean > 0 else 0.0),
+}
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Sampler of response delays in seconds from a distribution spec like lognormal:50:0.5"""
+    name, *params = spec.split(':')
+    if name not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution '{name}'. Available: {list(LATENCY_DISTRIBUTIONS)}")
+    try:
+        return LATENCY_DISTRIBUTIONS[name](*[float(param) for param in params])
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid latency spec '{spec}', see python -m benchmarks.mock_upstream --help")
+
+
+class MockUpstream(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port: int, latency: str = 'fixed:0', payload_bytes: int = 256,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 samples: Optional[Dict[str, List[list]]] = None):
+        super().__init__(('127.0.0.1', port), MockHandler)
+        self.sample_latency = parse_latency(latency)
+        self.samples = samples or {}  # Connector id -> [duration_ms, status, response bytes] of recorded calls
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        # Padding sized so the whole JSON body is about payload_bytes
+        self.padding = 'x' * max(payload_bytes - 40, 0)
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = 0
+            self.statuses = {}
+            self.upstream_seconds = 0.0
+            self.bytes_in = 0
+
+    def record(self, status: int, delay: float, bytes_in: int):
+        with self.lock:
+            self.requests += 1
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            self.upstream_seconds += delay
+            self.bytes_in += bytes_in
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'statuses': dict(self.statuses),
+                'upstream_mean_ms': round(self.upstream_seconds / self.requests * 1000, 3) if self.requests else 0,
+                'bytes_in': self.bytes_in
+            }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, as real APIs
+
+    def send_json(self, status: int, data: dict, headers: dict = None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def answer(self):
+        server: MockUpstream = self.server
+        url = urlsplit(self.path)
+        if url.path == '/__stats':
+            stats = server.stats()
+            if parse_qs(url.query).get('reset') == ['1']:
+                server.reset_stats()
+            return self.send_json(200, stats)
+
+        bytes_in = int(self.headers.get('Content-Length') or 0)
+        if bytes_in:
+            self.rfile.read(bytes_in)
+
+        parts = url.path.split('/')
+        recorded = server.samples.get(parts[2]) if len(parts) > 2 and parts[1] == 'replay' else None
+        if recorded:
+            duration_ms, status, size = random.choice(recorded)
+            delay = duration_ms / 1000
+            time.sleep(delay)
+            if not isinstance(status, int):
+                # Recorded without a response (timeout, connection error): drop the connection
+                server.record('error', delay, bytes_in)
+                self.close_connection = True
+                return
+            server.record(status, delay, bytes_in)
+            return self.send_json(status, {'ok': status < 400, 'padding': 'x' * max(size - 30, 0)})
+
+        delay = server.sample_latency()
+        if delay:
+            time.sleep(delay)
+
+        draw = random.random()
+        if draw < server.error_rate:
+            status, data, headers = 500, {'error': 'mock failure'}, None
+        elif draw < server.error_rate + server.rate_limit_rate:
+            status, data, headers = 429, {'error': 'rate limited'}, {'Retry-After': '1'}
+        else:
+            status, data, headers = 200, {'ok': True, 'text': 'mock', 'padding': server.padding}, None
+        server.record(status, delay, bytes_in)
+        self.send_json(status, data, headers)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = answer
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', default='fixed:0')
+    parser.add_argument('--payload-bytes', type=int, default=256)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--samples', help='JSON file of recorded calls per connector id')
+    args = parser.parse_args()
+
+    samples = None
+    if args.samples:
+        with open(args.samples) as f:
+            samples = json.load(f)
+    server = MockUpstream(
+        args.port, args.latency, args.payload_bytes, args.error_rate, args.rate_limit_rate, samples
+    )
+    print(f"Mock upstream on http://127.0.0.1:{server.server_address[1]} ({args.latency})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
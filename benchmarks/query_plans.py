@@ -0,0 +1,154 @@
+"""Check that the hot-path queries use the indexes created by the migrations
+
+    python -m benchmarks.query_plans --rows 200000
+
+Builds a fresh database through create_tables() (so every migration runs),
+fills it with jobs, then for every hot-path query prints its SQLite query
+plan and its latency with and without the hot-path indexes. Exits with an
+error when a query does not use its index, scans the job table or sorts it in
+a temp b-tree. tests/test_query_plans.py runs the same checks.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'apiflow.db')
+os.environ.pop('DATABASE_URL', None)
+
+from peewee import fn, Tuple
+from backend.lib.db import db, create_tables, Job, Workflow, User, Schedule
+from backend.lib.retention import archivable
+
+# Job listing indexes (0004_hot_path_indexes, 0006_keyset_indexes), dropped for the "without" timing
+HOT_PATH_INDEXES = ['job_created_at_id', 'job_workflow_created_at_id', 'job_status_created_at_id']
+
+
+def hot_path_queries():
+    """(name, query, index it must use) of every query the API and worker run per request or per poll"""
+    now = datetime.now()
+    page_key = (Tuple(Job.created_at, Job.id) < Tuple(now - timedelta(days=30), 10 ** 9))
+    return [
+        ('worker pending queue', Job.select(Job.id).where(Job.status == 'pending').order_by(Job.created_at).limit(5),
+            'job_status_created_at_id'),
+        ('claim: users with pending jobs', Job.select(Job.user).where(Job.status == 'pending').group_by(Job.user),
+            'job_status_user_priority_created'),
+        ('claim: per-user queue head', Job.select(Job.id, Job.priority, Job.created_at)
+            .where((Job.status == 'pending') & (Job.user == 1))
+            .order_by(Job.priority.desc(), Job.created_at).limit(5), 'job_status_user_priority_created'),
+        ('claim: running per user', Job.select(Job.user, fn.COUNT(Job.id))
+            .where(Job.status == 'running').group_by(Job.user), 'job_status_user_priority_created'),
+        ('claim: due scheduled jobs', Job.select(Job.id)
+            .where((Job.status == 'scheduled') & (Job.run_at <= now)), 'job_status_run_at'),
+        ('GET /jobs', Job.select().order_by(Job.created_at.desc()).limit(100), 'job_created_at_id'),
+        ('GET /workflow/{id}/jobs', Job.select().where(Job.workflow == 1).order_by(Job.created_at.desc()).limit(100),
+            'job_workflow_created_at_id'),
+        ('jobs by status', Job.select().where(Job.status == 'failed').order_by(Job.created_at.desc()).limit(100),
+            'job_status_created_at_id'),
+        ('GET /jobs next page', Job.select().where(page_key)
+            .order_by(Job.created_at.desc(), Job.id.desc()).limit(100), 'job_created_at_id'),
+        ('GET /workflow/{id}/jobs next page', Job.select().where((Job.workflow == 1) & page_key)
+            .order_by(Job.created_at.desc(), Job.id.desc()).limit(100), 'job_workflow_created_at_id'),
+        ('jobs by status next page', Job.select().where((Job.status == 'failed') & page_key)
+            .order_by(Job.created_at.desc(), Job.id.desc()).limit(100), 'job_status_created_at_id'),
+        ('jobs in a time range', Job.select(Job.id, Job.status)
+            .where((Job.created_at >= now - timedelta(days=7)) & (Job.created_at < now))
+            .order_by(Job.created_at.desc(), Job.id.desc()).limit(100), 'job_created_at_id'),
+        ('idempotency lookup', Job.select()
+            .where((Job.idempotency_key == 'key-1') & (Job.workflow == 1) & (Job.user == 1)), 'job_idempotency_scope'),
+        ('retention candidates', Job.select(Job.id)
+            .where(archivable() & (Job.updated_at < now - timedelta(days=30))).limit(500),
+            'job_unarchived_status_updated'),
+        ('due schedules', Schedule.select().where((Schedule.enabled == True) & (Schedule.next_run_at <= now)),
+            'schedule_enabled_next_run_at'),
+        ('auth token lookup', User.select().where(User.api_token == 'token'), 'user_api_token'),
+    ]
+
+
+def populate(rows: int):
+    """Insert `rows` jobs spread over a few workflows, users and statuses"""
+    user = User.create(username='bench', email='bench@apiflow.local', password_hash='', api_token='token')
+    workflows = [Workflow.create(name=f'w{i}', description='', nodes={}) for i in range(10)]
+    statuses = ['completed'] * 80 + ['failed'] * 10 + ['pending'] * 8 + ['running'] * 2
+    start = datetime.now() - timedelta(days=60)
+
+    with db.atomic():
+        batch = []
+        for i in range(rows):
+            created_at = start + timedelta(seconds=i * 60 * 60 * 24 * 60 / rows)
+            batch.append({
+                'name': f'job {i}',
+                'workflow': random.choice(workflows).id,
+                'user': user.id,
+                'status': random.choice(statuses),
+                'created_at': created_at, 'updated_at': created_at
+            })
+            if len(batch) == 500:
+                Job.insert_many(batch).execute()
+                batch = []
+        if batch:
+            Job.insert_many(batch).execute()
+    db.execute_sql('ANALYZE;')
+
+
+def explain(query) -> list:
+    sql, params = query.sql()
+    return [row[-1] for row in db.execute_sql(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+
+def timed(query, repeat: int = 20) -> float:
+    """Median latency of a query in milliseconds"""
+    sql, params = query.sql()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.execute_sql(sql, params).fetchall()
+        samples.append(time.perf_counter() - start)
+    return round(sorted(samples)[len(samples) // 2] * 1000, 3)
+
+
+def is_full_scan(plan: list) -> bool:
+    return any(
+        (step.startswith('SCAN') and 'USING' not in step) or 'TEMP B-TREE' in step
+        for step in plan
+    )
+
+
+def uses_index(plan: list, index: str) -> bool:
+    return any(f'INDEX {index} ' in f'{step} ' for step in plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    create_tables()
+    populate(args.rows)
+
+    results = []
+    for name, query, index in hot_path_queries():
+        plan = explain(query)
+        results.append({
+            'query': name, 'plan': plan, 'index': index, 'uses_index': uses_index(plan, index),
+            'full_scan': is_full_scan(plan), 'indexed_ms': timed(query)
+        })
+
+    for index in HOT_PATH_INDEXES:
+        db.execute_sql(f'DROP INDEX {index};')
+    for result, (_, query, _) in zip(results, hot_path_queries()):
+        result['without_hot_path_indexes_ms'] = timed(query)
+        print(json.dumps(result))
+
+    failures = [result['query'] for result in results if result['full_scan'] or not result['uses_index']]
+    if failures:
+        print(f'Queries without a usable index: {failures}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Replay recorded production traffic against a local API, worker and mock upstream
+
+    python -m benchmarks.replay data/traffic --definitions export.ndjson --speed 10 --workers 2 --output replay.json
+
+Reads the traffic recordings written with TRAFFIC_RECORD_DIR (files or
+directories of traffic-*.ndjson) and the definitions exported with
+GET /api/v1/export, then on a fresh database:
+
+- imports the definitions, with every connector pointing to a mock upstream
+  that answers with the delays, statuses and sizes recorded for it,
+- starts an API process and `python -m backend.worker --processes --workers`,
+- sends every recorded submission (sync runs, queued runs, batches, node runs)
+  at its recorded time divided by --speed, with synthetic inputs of the
+  recorded shape, without waiting for earlier ones (open loop),
+- waits for the queued jobs to finish.
+
+Prints a JSON report: achieved submission rate and lateness (a late
+schedule means the load generator itself could not keep up), API latency per
+mode, job queue wait, run time and end-to-end latency, failures and upstream
+calls.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+import requests
+from backend.lib.traffic import input_from_shape
+from benchmarks.health_latency import free_port, percentiles, start_api
+
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+def load_recording(paths: List[str]) -> Tuple[List[dict], Dict[str, List[list]]]:
+    """Submissions in arrival order, and recorded upstream calls per connector id"""
+    files = []
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, 'traffic-*.ndjson'))) if os.path.isdir(path) else [path]
+    submissions, samples = [], defaultdict(list)
+    for name in files:
+        with open(name) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record['type'] == 'submission':
+                    submissions.append(record)
+                elif record['type'] == 'upstream':
+                    samples[str(record['connector_id'])].append(
+                        [record['duration_ms'], record['status'], record['bytes_in']]
+                    )
+    submissions.sort(key=lambda record: record['t'])
+    return submissions, dict(samples)
+
+
+def start_mock_upstream(samples_path: str) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.mock_upstream', '--port', str(port), '--samples', samples_path],
+        stdout=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            requests.get(f'{url}/__stats', timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('Mock upstream did not start')
+
+
+def import_definitions(base: str, headers: dict, definitions_path: str, upstream_url: str) -> dict:
+    """Import the exported definitions with connectors pointing to the mock, returns the id maps"""
+    lines = []
+    with open(definitions_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['kind'] == 'connector':
+                record['base_url'] = f"{upstream_url}/replay/{record['id']}"
+            lines.append(json.dumps(record))
+    response = requests.post(
+        f'{base}/api/v1/import?match=none', headers={**headers, 'Content-Type': 'application/x-ndjson'},
+        data='\n'.join(lines).encode()
+    )
+    response.raise_for_status()
+    return response.json()['ids']
+
+
+def submit(session: requests.Session, base: str, headers: dict, record: dict, target_id: int) -> int:
+    """Send one recorded submission, returns the HTTP status"""
+    inputs = [input_from_shape(shape) for shape in record['inputs']]
+    mode = record['mode']
+    if mode == 'node':
+        url, body = f'{base}/api/v1/node/{target_id}/run', {'input': inputs[0]}
+    elif mode == 'batch':
+        params = {'priority': record['priority']}
+        if record.get('delay_seconds'):
+            params['delay_seconds'] = record['delay_seconds']
+        return session.post(
+            f'{base}/api/v1/workflow/{target_id}/batch', headers=headers, params=params, json=inputs, timeout=600
+        ).status_code
+    else:
+        url, body = f'{base}/api/v1/workflow/{target_id}/run', {'input': inputs[0], 'enqueue': mode == 'enqueue'}
+        if mode == 'enqueue':
+            body['priority'] = record['priority']
+            if record.get('delay_seconds'):
+                body['delay_seconds'] = record['delay_seconds']
+    return session.post(url, headers=headers, json=body, timeout=600).status_code
+
+
+def wait_for_jobs(database_path: str, timeout: float) -> int:
+    """Wait until no job is scheduled, pending or running, returns how many still are"""
+    deadline = time.time() + timeout
+    with sqlite3.connect(database_path) as conn:
+        while True:
+            open_jobs, = conn.execute(
+                f"SELECT COUNT(*) FROM job WHERE status NOT IN {TERMINAL_STATUSES}"
+            ).fetchone()
+            if not open_jobs or time.time() > deadline:
+                return open_jobs
+            time.sleep(0.2)
+
+
+def job_report(database_path: str) -> dict:
+    """Queue wait, run time and end-to-end latency of the replayed jobs"""
+    parse = lambda value: datetime.fromisoformat(value) if value else None
+    queue_wait, run_time, end_to_end, statuses = [], [], [], defaultdict(int)
+    with sqlite3.connect(database_path) as conn:
+        rows = conn.execute("SELECT status, created_at, claimed_at, updated_at FROM job").fetchall()
+    for status, created_at, claimed_at, updated_at in rows:
+        statuses[status] += 1
+        created_at, claimed_at, updated_at = parse(created_at), parse(claimed_at), parse(updated_at)
+        if status in TERMINAL_STATUSES:
+            end_to_end.append((updated_at - created_at).total_seconds())
+        if claimed_at:
+            queue_wait.append((claimed_at - created_at).total_seconds())
+            if status in TERMINAL_STATUSES:
+                run_time.append((updated_at - claimed_at).total_seconds())
+    return {
+        'jobs': len(rows),
+        'statuses': dict(statuses),
+        'queue_wait': percentiles(queue_wait),
+        'run_time': percentiles(run_time),
+        'end_to_end': percentiles(end_to_end)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('recordings', nargs='+', help='Recording files or directories (TRAFFIC_RECORD_DIR)')
+    parser.add_argument('--definitions', required=True, help='NDJSON from GET /api/v1/export')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay N times faster than recorded')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+    parser.add_argument('--limit', type=int, help='Replay only the first N submissions')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Concurrent client requests')
+    parser.add_argument('--drain-timeout', type=float, default=600)
+    parser.add_argument('--output', help='Also write the report to this JSON file')
+    args = parser.parse_args()
+
+    submissions, samples = load_recording(args.recordings)
+    submissions = submissions[:args.limit] if args.limit else submissions
+    if not submissions:
+        parser.error('No submissions in the recordings')
+
+    directory = tempfile.mkdtemp()
+    database_path = os.path.join(directory, 'apiflow.db')
+    samples_path = os.path.join(directory, 'samples.json')
+    with open(samples_path, 'w') as f:
+        json.dump(samples, f)
+    # The replayed API and worker must not record the replay
+    os.environ.pop('TRAFFIC_RECORD_DIR', None)
+
+    upstream, upstream_url = start_mock_upstream(samples_path)
+    api_port = free_port()
+    api = start_api(database_path, api_port)
+    worker = None
+    base = f'http://127.0.0.1:{api_port}'
+    try:
+        with sqlite3.connect(database_path) as conn:
+            token, = conn.execute('SELECT api_token FROM user WHERE is_admin = 1').fetchone()
+        headers = {'Authorization': f'Bearer {token}'}
+        ids = import_definitions(base, headers, args.definitions, upstream_url)
+
+        worker = subprocess.Popen(
+            [sys.executable, '-m', 'backend.worker', '--processes', str(args.workers)],
+            env={**os.environ, 'DATABASE_PATH': database_path, 'WORKER_POLL_INTERVAL': '0.1'},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+        results = defaultdict(list)  # mode -> [(latency, status)]
+        lateness, skipped = [], 0
+        lock = threading.Lock()
+        local = threading.local()
+
+        def send(record: dict, target_id: int):
+            session = getattr(local, 'session', None) or requests.Session()
+            local.session = session
+            start = time.perf_counter()
+            try:
+                status_code = submit(session, base, headers, record, target_id)
+            except requests.RequestException:
+                status_code = 'error'
+            with lock:
+                results[record['mode']].append((time.perf_counter() - start, status_code))
+
+        first = submissions[0]['t']
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.max_in_flight) as pool:
+            for record in submissions:
+                kind = 'node' if record['mode'] == 'node' else 'workflow'
+                target_id = ids[kind].get(str(record['target_id']))
+                if target_id is None:
+                    skipped += 1  # Definition not in the export
+                    continue
+                due = (record['t'] - first) / args.speed
+                wait = due - (time.perf_counter() - started)
+                if wait > 0:
+                    time.sleep(wait)
+                lateness.append(max(time.perf_counter() - started - due, 0))
+                pool.submit(send, record, target_id)
+        submitted_in = time.perf_counter() - started
+
+        still_open = wait_for_jobs(database_path, args.drain_timeout)
+        recorded_span = (submissions[-1]['t'] - first) or 1
+
+        report = {
+            'submissions': len(submissions) - skipped,
+            'skipped': skipped,
+            'speed': args.speed,
+            'workers': args.workers,
+            'recorded_rate_per_s': round(len(submissions) / recorded_span, 2),
+            'target_rate_per_s': round(len(submissions) / recorded_span * args.speed, 2),
+            'achieved_rate_per_s': round((len(submissions) - skipped) / (submitted_in or 1), 2),
+            'schedule_lateness': percentiles(lateness),
+            'api': {
+                mode: {
+                    **percentiles([latency for latency, _ in calls]),
+                    'statuses': {str(code): sum(1 for _, status in calls if status == code) for code in {s for _, s in calls}}
+                }
+                for mode, calls in results.items()
+            },
+            **job_report(database_path),
+            'jobs_still_open': still_open,
+            'duration_s': round(time.perf_counter() - started, 2),
+            'upstream': requests.get(f'{upstream_url}/__stats').json()
+        }
+        print(json.dumps(report))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if worker is not None:
+            worker.terminate()
+            worker.wait(30)
+        api.terminate()
+        api.wait(10)
+        upstream.terminate()
+        upstream.wait(10)
+
+
+if __name__ == '__main__':
+    main()
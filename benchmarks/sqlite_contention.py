@@ -0,0 +1,163 @@
+"""Concurrent job status writes against the default and production SQLite profiles
+
+    python -m benchmarks.sqlite_contention --writers 8 --readers 2 --duration 5
+
+Every writer process updates random job rows in its own transaction (like
+WorkflowExecutor status transitions), every reader runs the worker pending
+query. Prints one JSON line per profile and the write throughput gain.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'apiflow.db'))
+
+from peewee import SqliteDatabase, OperationalError
+from backend.lib.db import SQLITE_BUSY_TIMEOUT_MS, sqlite_pragmas
+
+STATUSES = ['pending', 'running', 'completed', 'failed']
+
+
+def open_database(path: str, profile: str) -> SqliteDatabase:
+    """Open the database the way backend/lib/db.py does for the given profile"""
+    if profile == 'default':
+        return SqliteDatabase(path)
+    return SqliteDatabase(path, pragmas=sqlite_pragmas(profile), timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+
+
+def setup(path: str, profile: str, jobs: int):
+    """Create a job table with `jobs` rows and realistic payload sizes"""
+    database = open_database(path, profile)
+    database.execute_sql(
+        "CREATE TABLE job (id INTEGER PRIMARY KEY, status VARCHAR(255) NOT NULL, "
+        "input TEXT NOT NULL, output TEXT NOT NULL, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL)"
+    )
+    payload = json.dumps({"prompt": "x" * 2000})
+    with database.atomic():
+        for _ in range(jobs):
+            database.execute_sql(
+                "INSERT INTO job (status, input, output, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                ('pending', payload, payload, time.time(), time.time())
+            )
+    database.close()
+
+
+def writer(path: str, profile: str, jobs: int, duration: float, start_barrier, results):
+    """Update job statuses one transaction at a time for `duration` seconds once all processes are up"""
+    database = open_database(path, profile)
+    latencies, errors = [], 0
+    start_barrier.wait()
+    started = time.time()
+    while time.time() < started + duration:
+        start = time.perf_counter()
+        try:
+            with database.atomic():
+                database.execute_sql(
+                    "UPDATE job SET status = ?, updated_at = ? WHERE id = ?",
+                    (random.choice(STATUSES), time.time(), random.randint(1, jobs))
+                )
+            latencies.append(time.perf_counter() - start)
+        except OperationalError:
+            # 'database is locked' once the busy timeout is exhausted
+            errors += 1
+    elapsed = time.time() - started
+    database.close()
+    results.put(('write', latencies, errors, elapsed))
+
+
+def reader(path: str, profile: str, duration: float, start_barrier, results):
+    """Run the worker pending query in a loop for `duration` seconds once all processes are up"""
+    database = open_database(path, profile)
+    count, errors = 0, 0
+    start_barrier.wait()
+    started = time.time()
+    while time.time() < started + duration:
+        try:
+            database.execute_sql(
+                "SELECT id, input FROM job WHERE status = 'pending' ORDER BY created_at LIMIT 5"
+            ).fetchall()
+            count += 1
+        except OperationalError:
+            errors += 1
+    elapsed = time.time() - started
+    database.close()
+    results.put(('read', count, errors, elapsed))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_profile(profile: str, writers: int, readers: int, duration: float, jobs: int) -> dict:
+    """Run one contention round and return its metrics"""
+    path = os.path.join(tempfile.mkdtemp(), f'contention-{profile}.db')
+    setup(path, profile, jobs)
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    # Processes start measuring together, once all of them are up and connected
+    start_barrier = context.Barrier(writers + readers)
+    processes = [
+        context.Process(target=writer, args=(path, profile, jobs, duration, start_barrier, results))
+        for _ in range(writers)
+    ] + [
+        context.Process(target=reader, args=(path, profile, duration, start_barrier, results))
+        for _ in range(readers)
+    ]
+    for process in processes:
+        process.start()
+
+    # Rates are summed per process, each over the window it actually measured
+    latencies, write_errors, write_rate, read_rate, read_errors = [], 0, 0.0, 0.0, 0
+    for _ in processes:
+        kind, value, errors, elapsed = results.get()
+        if kind == 'write':
+            latencies.extend(value)
+            write_errors += errors
+            write_rate += len(value) / elapsed
+        else:
+            read_rate += value / elapsed
+            read_errors += errors
+    for process in processes:
+        process.join()
+
+    return {
+        'profile': profile,
+        'writers': writers,
+        'readers': readers,
+        'duration_s': duration,
+        'writes_per_s': round(write_rate, 1),
+        'reads_per_s': round(read_rate, 1),
+        'write_p50_ms': round(percentile(latencies, 0.5) * 1000, 3) if latencies else None,
+        'write_p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'locked_errors': write_errors + read_errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--jobs', type=int, default=1000)
+    args = parser.parse_args()
+
+    results = {}
+    for profile in ('default', 'production'):
+        results[profile] = run_profile(profile, args.writers, args.readers, args.duration, args.jobs)
+        print(json.dumps(results[profile]))
+
+    if results['default']['writes_per_s']:
+        gain = results['production']['writes_per_s'] / results['default']['writes_per_s']
+        print(json.dumps({'write_throughput_gain': round(gain, 2)}))
+
+
+if __name__ == '__main__':
+    main()
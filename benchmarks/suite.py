@@ -0,0 +1,362 @@
+"""APIFlow overhead benchmarks against a local mock upstream
+
+    python -m benchmarks.suite --latency fixed:0 --ops 200 --concurrency 10 --output results.json
+    python -m benchmarks.suite --baseline results.json --max-regression 0.2
+
+Starts benchmarks.mock_upstream in its own process (see its --help for the
+latency specs), then runs every scenario in a fresh process on a fresh
+database:
+
+    node                 execute_node_async calls
+    workflow_sequential  execute_workflow of --modules script modules in a row
+    workflow_branchone   a branchone picking the last of three branches of --modules modules
+    workflow_branchall   a parallel branchall of --width script modules
+    worker               --ops queued jobs (the sequential workflow) drained by the Worker loop
+    api                  synchronous POST /api/v1/workflow/{id}/run on a uvicorn process
+
+With the default fixed:0 latency the upstream answers at once, so the numbers
+are APIFlow's own cost. Prints one JSON line per scenario: throughput,
+latency percentiles, CPU seconds, peak RSS (of the API process for `api`,
+its startup CPU reported apart as startup_cpu_s) and the upstream requests. --output writes them with the environment to a
+file; --baseline compares with such a file and exits with an error when a
+scenario's throughput drops or its p99 grows by more than --max-regression.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from typing import Callable, List, Tuple
+import requests
+from benchmarks.health_latency import free_port, percentiles, start_api
+
+SCENARIOS = ('node', 'workflow_sequential', 'workflow_branchone', 'workflow_branchall', 'worker', 'api')
+
+
+def start_mock_upstream(args) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.mock_upstream', '--port', str(port), '--latency', args.latency,
+         '--payload-bytes', str(args.payload_bytes), '--error-rate', str(args.error_rate),
+         '--rate-limit-rate', str(args.rate_limit_rate)],
+        stdout=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            requests.get(f'{url}/__stats', timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('Mock upstream did not start')
+
+
+def script_module(module_id: str, node_id: int) -> dict:
+    return {'id': module_id, 'value': {
+        'type': 'script', 'path': f'node/{node_id}',
+        'input_transforms': {'prompt': {'type': 'javascript', 'expr': 'flow_input.prompt'}}
+    }}
+
+
+def create_fixtures(upstream_url: str, modules: int, width: int) -> dict:
+    """Connector, node and one workflow per workflow shape, returns their ids"""
+    from backend.lib.db import Connector, Node, Workflow
+
+    connector = Connector.create(name='mock upstream', base_url=upstream_url, method='POST')
+    node = Node.create(
+        name='mock node', description='', connector=connector, path='/v1/predict',
+        input=[{'name': 'prompt', 'type': 'string', 'required': True}],
+        output=[{'name': 'text', 'mapping': 'text'}]
+    )
+    chain = lambda prefix: [script_module(f'{prefix}{i}', node.id) for i in range(modules)]
+    shapes = {
+        'sequential': {'modules': chain('m')},
+        'branchone': {'modules': [{'id': 'choose', 'value': {
+            'type': 'branchone',
+            'branches': [
+                {'expr': 'flow_input.branch == 1', 'modules': chain('a')},
+                {'expr': 'flow_input.branch == 2', 'modules': chain('b')},
+                {'expr': 'flow_input.branch == 3', 'modules': chain('c')}
+            ],
+            'default': []
+        }}]},
+        'branchall': {'modules': [{'id': 'fan_out', 'value': {
+            'type': 'branchall', 'parallel': True,
+            'branches': [{'modules': [script_module(f'w{i}', node.id)]} for i in range(width)]
+        }}]},
+    }
+    ids = {'node': node.id}
+    for shape, value in shapes.items():
+        ids[shape] = Workflow.create(name=f'benchmark {shape}', description='', nodes={'value': value}).id
+    return ids
+
+
+async def run_concurrently(operation: Callable, ops: int, concurrency: int) -> Tuple[List[float], int]:
+    """Latencies of `ops` awaited operations, at most `concurrency` at a time, and the error count"""
+    latencies, errors = [], 0
+    remaining = iter(range(ops))
+
+    async def lane():
+        nonlocal errors
+        for index in remaining:
+            start = time.perf_counter()
+            try:
+                await operation(index)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[lane() for _ in range(concurrency)])
+    return latencies, errors
+
+
+async def drain_with_worker(workflow_id: int, ops: int, concurrency: int) -> Tuple[List[float], int]:
+    """Queue `ops` jobs and run the Worker loop until all of them are finished"""
+    from backend.lib.batch import submit_batch
+    from backend.lib.db import Job, connection_scope
+    from backend.worker import Worker
+
+    submit_batch(workflow_id, [{'prompt': f'job {i}'} for i in range(ops)])
+    worker = Worker(poll_interval=0.05, concurrency=concurrency)
+    loop = asyncio.get_running_loop()
+
+    def finished() -> int:
+        with connection_scope():
+            return Job.select().where(Job.status.in_(['completed', 'failed'])).count()
+
+    runner = asyncio.create_task(worker.run())
+    while await loop.run_in_executor(None, finished) < ops:
+        await asyncio.sleep(0.05)
+    worker.stop()
+    await runner
+
+    with connection_scope():
+        rows = Job.select(Job.claimed_at, Job.updated_at, Job.status).tuples()
+        latencies = [(updated - claimed).total_seconds() for claimed, updated, _ in rows if claimed]
+        errors = sum(1 for *_, status in rows if status == 'failed')
+    return latencies, errors
+
+
+def call_api(base: str, headers: dict, workflow_id: int, ops: int, concurrency: int) -> Tuple[List[float], int]:
+    """Synchronous workflow runs through the REST API from `concurrency` client threads"""
+    latencies, errors = [], 0
+    counter = iter(range(ops))
+    lock = threading.Lock()
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            start = time.perf_counter()
+            response = session.post(
+                f'{base}/api/v1/workflow/{workflow_id}/run', headers=headers,
+                json={'input': {'prompt': f'run {index}'}}, timeout=120
+            )
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors += response.status_code != 200
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def cpu_seconds(usage) -> float:
+    return usage.ru_utime + usage.ru_stime
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """User + system CPU a running process has used so far (Linux /proc), 0 where unavailable"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Fields after the parenthesized command name, starting with the state (field 3 of proc(5))
+            fields = f.read().rpartition(')')[2].split()
+    except OSError:
+        return 0.0
+    utime, stime = int(fields[11]), int(fields[12])  # Fields 14 and 15, in clock ticks
+    return (utime + stime) / os.sysconf('SC_CLK_TCK')
+
+
+def run_scenario(name: str, args: dict, upstream_url: str, results):
+    """Child process entry point: fresh database, fixtures, one timed scenario"""
+    directory = tempfile.mkdtemp()
+    database_path = os.path.join(directory, 'apiflow.db')
+    os.environ['DATABASE_PATH'] = database_path
+    os.environ['METRICS_DIR'] = os.path.join(directory, 'metrics')
+    os.environ.pop('DATABASE_URL', None)
+    if not args['verbose']:
+        # Node runs log every request, keep them out of the report
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+
+    from backend.lib.bootstrap import bootstrap
+    from backend.lib.db import connection_scope
+    from backend.lib.node import execute_node_async
+    from backend.lib.workflow import execute_workflow
+
+    admin = bootstrap()
+    with connection_scope():
+        ids = create_fixtures(upstream_url, args['modules'], args['width'])
+    ops, concurrency = args['ops'], args['concurrency']
+    inputs = {'workflow_branchone': {'branch': 3}}
+
+    requests.get(f'{upstream_url}/__stats?reset=1')
+    api = None
+    startup_cpu = None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    if name == 'node':
+        latencies, errors = asyncio.run(run_concurrently(
+            lambda i: execute_node_async(ids['node'], {'prompt': f'run {i}'}), ops, concurrency
+        ))
+    elif name.startswith('workflow_'):
+        workflow_id = ids[name.split('_', 1)[1]]
+        input_data = inputs.get(name, {})
+        latencies, errors = asyncio.run(run_concurrently(
+            lambda i: execute_workflow(workflow_id, {**input_data, 'prompt': f'run {i}'}), ops, concurrency
+        ))
+    elif name == 'worker':
+        latencies, errors = asyncio.run(drain_with_worker(ids['sequential'], ops, concurrency))
+    else:
+        port = free_port()
+        api = start_api(database_path, port)
+        # Interpreter start, imports and bootstrap, not part of the per-request cost
+        startup_cpu = process_cpu_seconds(api.pid)
+        headers = {'Authorization': f'Bearer {admin.api_token}'}
+        start = time.perf_counter()
+        latencies, errors = call_api(f'http://127.0.0.1:{port}', headers, ids['sequential'], ops, concurrency)
+    elapsed = time.perf_counter() - start
+
+    if api is not None:
+        # Cost of the API process, collected once it has exited, minus its startup
+        api.terminate()
+        api.wait(30)
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu, peak_rss_kb = cpu_seconds(usage) - startup_cpu, usage.ru_maxrss
+    else:
+        cpu = cpu_seconds(resource.getrusage(resource.RUSAGE_SELF)) - cpu_seconds(usage)
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    result = {
+        'scenario': name,
+        'ops': ops,
+        'concurrency': concurrency,
+        'errors': errors,
+        'duration_s': round(elapsed, 3),
+        'throughput_per_s': round(ops / elapsed, 1),
+        'latency': {**percentiles(latencies), 'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2)},
+        'cpu_s': round(cpu, 3),
+        'cpu_ms_per_op': round(cpu / ops * 1000, 3),
+        'peak_rss_mb': round(peak_rss_kb / 1024, 1),
+        'upstream': requests.get(f'{upstream_url}/__stats').json()
+    }
+    if startup_cpu is not None:
+        result['startup_cpu_s'] = round(startup_cpu, 3)
+    results.put(result)
+
+
+def environment(args) -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    }
+
+
+def regressions(results: List[dict], baseline: dict, max_regression: float) -> List[str]:
+    """Scenarios slower than the baseline by more than max_regression (0.2 = 20%)"""
+    previous = {result['scenario']: result for result in baseline['results']}
+    found = []
+    for result in results:
+        before = previous.get(result['scenario'])
+        if not before:
+            continue
+        if result['throughput_per_s'] < before['throughput_per_s'] * (1 - max_regression):
+            found.append(f"{result['scenario']}: throughput {before['throughput_per_s']} -> {result['throughput_per_s']}/s")
+        if result['latency']['p99_ms'] > before['latency']['p99_ms'] * (1 + max_regression):
+            found.append(f"{result['scenario']}: p99 {before['latency']['p99_ms']} -> {result['latency']['p99_ms']}ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated subset of ' + ', '.join(SCENARIOS))
+    parser.add_argument('--ops', type=int, default=200, help='Node runs, workflow runs, jobs or requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--modules', type=int, default=5, help='Script modules of the sequential and branchone workflows')
+    parser.add_argument('--width', type=int, default=20, help='Parallel modules of the branchall workflow')
+    parser.add_argument('--latency', default='fixed:0', help='Mock upstream latency distribution')
+    parser.add_argument('--payload-bytes', type=int, default=256)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='Write the results and environment to this JSON file')
+    parser.add_argument('--baseline', help='Results file of a previous version to compare with')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    parser.add_argument('--verbose', action='store_true', help='Keep the output of the scenario processes')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios {sorted(unknown)}. Available: {list(SCENARIOS)}")
+
+    upstream, upstream_url = start_mock_upstream(args)
+    context = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        for name in names:
+            queue = context.Queue()
+            process = context.Process(target=run_scenario, args=(name, vars(args), upstream_url, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(json.dumps({'scenario': name, 'failed': f'exit code {process.exitcode}'}))
+                continue
+            result = queue.get()
+            results.append(result)
+            print(json.dumps(result), flush=True)
+    finally:
+        upstream.terminate()
+        upstream.wait(10)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(args), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.max_regression)
+        if found:
+            print('Regressions against ' + args.baseline + ':\n  ' + '\n  '.join(found), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
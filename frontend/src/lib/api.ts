@@ -1,5 +1,8 @@
 import { PUBLIC_API_URL } from '$env/static/public';
 
+// Rows per request when reading every page of a listing (the API default of API_MAX_PAGE_SIZE)
+const PAGE_SIZE = 1000;
+
 export interface Connector {
   id: number;
   name: string;
@@ -41,6 +44,7 @@ export interface Job {
   workflow_name: string;
   status: string;
   retry_count: number;
+  batch_id?: number | null;
   input: Record<string, any>;
   output: Record<string, any>;
   error: string | null;
@@ -48,6 +52,37 @@ export interface Job {
   updated_at: string;
 }
 
+export interface JobEvent {
+  type: 'job' | 'module_started' | 'module_finished' | 'module_failed' | 'module_retrying';
+  job_id: number;
+  time?: number;
+  status?: string;
+  error?: string | null;
+  module_id?: string;
+  module_type?: string;
+  duration_ms?: number;
+  attempt?: number;
+  snapshot?: boolean;
+}
+
+export interface TraceSpan {
+  name: string;
+  label: string;
+  start_ms: number;
+  duration_ms: number;
+  attributes: Record<string, any>;
+  children: TraceSpan[];
+}
+
+export interface JobTrace {
+  job_id: number;
+  start: string;
+  duration_ms: number;
+  dropped_spans: number;
+  critical_path: Pick<TraceSpan, 'label' | 'start_ms' | 'duration_ms'>[];
+  root: TraceSpan;
+}
+
 export interface User {
   id: number;
   username: string;
@@ -88,6 +123,33 @@ class ApiClient {
     endpoint: string,
     options: RequestInit = {}
   ): Promise<T> {
+    const response = await this.fetchResponse(endpoint, options);
+
+    if (response.status === 204) {
+      return {} as T;
+    }
+
+    return response.json();
+  }
+
+  // Every page of a keyset paginated listing, following the X-Next-Cursor header
+  private async requestAllPages<T>(endpoint: string): Promise<T[]> {
+    const rows: T[] = [];
+    const separator = endpoint.includes('?') ? '&' : '?';
+    let cursor: string | null = null;
+    do {
+      const query: string = `limit=${PAGE_SIZE}` + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : '');
+      const response = await this.fetchResponse(`${endpoint}${separator}${query}`);
+      rows.push(...(await response.json()));
+      cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return rows;
+  }
+
+  private async fetchResponse(
+    endpoint: string,
+    options: RequestInit = {}
+  ): Promise<Response> {
     const url = `${this.baseUrl}${endpoint}`;
     const headers: Record<string, string> = {
       'Content-Type': 'application/json',
@@ -110,11 +172,7 @@ class ApiClient {
       throw new Error(error.detail || `HTTP error! status: ${response.status}`);
     }
 
-    if (response.status === 204) {
-      return {} as T;
-    }
-
-    return response.json();
+    return response;
   }
 
   // Connector methods
@@ -218,9 +276,16 @@ class ApiClient {
     });
   }
 
+  async enqueueWorkflow(id: number, input: Record<string, any>, idempotencyKey?: string): Promise<any> {
+    return this.request(`/api/v1/workflow/${id}/run`, {
+      method: 'POST',
+      body: JSON.stringify({ input, enqueue: true, idempotency_key: idempotencyKey }),
+    });
+  }
+
   // Job methods
   async getJobs(): Promise<Job[]> {
-    return this.request('/api/v1/jobs');
+    return this.requestAllPages('/api/v1/jobs');
   }
 
   async getJob(id: number): Promise<Job> {
@@ -228,7 +293,28 @@ class ApiClient {
   }
 
   async getWorkflowJobs(workflowId: number): Promise<Job[]> {
-    return this.request(`/api/v1/workflow/${workflowId}/jobs`);
+    return this.requestAllPages(`/api/v1/workflow/${workflowId}/jobs`);
+  }
+
+  // Server-sent events of a job until it completes, fails or is cancelled; returns a function closing the stream
+  subscribeJobEvents(id: number, onEvent: (event: JobEvent) => void): () => void {
+    const token = encodeURIComponent(this.token || '');
+    const source = new EventSource(`${this.baseUrl}/api/v1/jobs/${id}/events?token=${token}`);
+    const handle = (message: MessageEvent) => {
+      const event: JobEvent = JSON.parse(message.data);
+      onEvent(event);
+      if (event.type === 'job' && ['completed', 'failed', 'cancelled'].includes(event.status || '')) {
+        source.close();
+      }
+    };
+    for (const type of ['job', 'module_started', 'module_finished', 'module_failed', 'module_retrying']) {
+      source.addEventListener(type, handle as EventListener);
+    }
+    return () => source.close();
+  }
+
+  async getJobTrace(id: number): Promise<JobTrace> {
+    return this.request(`/api/v1/jobs/${id}/trace`);
   }
 
   async cancelJob(id: number): Promise<any> {
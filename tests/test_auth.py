@@ -0,0 +1,39 @@
+"""Token cache revocations and profile updates"""
+from backend.lib.auth import TokenCache
+from backend.lib.db import TokenRevocation, User
+
+
+def make_user(name: str) -> User:
+    return User.create(username=name, email=f"{name}@example.com", password_hash='-', api_token=f"token-{name}")
+
+
+def test_late_committed_revocation_is_applied():
+    first, second = make_user('first'), make_user('second')
+    cache = TokenCache(ttl=60, revocation_window=0)
+    cache.poll_revocations()
+    for user in (first, second):
+        cache.put(user.api_token, user)
+
+    TokenRevocation.create(id=10, user_id=first.id)
+    cache.poll_revocations()
+    assert cache.get(first.api_token) is None
+    cache.put(first.api_token, first)
+
+    # A lower id committed after the poll that read id 10
+    TokenRevocation.create(id=5, user_id=second.id)
+    cache.poll_revocations()
+    assert cache.get(second.api_token) is None
+    # Rows already applied are skipped
+    assert cache.get(first.api_token) is not None
+
+
+def test_update_user_keeps_other_columns(client, admin_headers):
+    admin = User.get(User.is_admin == True)
+    # Cached row of the admin, older than what another process writes next
+    assert client.get('/api/v1/workflows', headers=admin_headers).status_code == 200
+    User.update(queue_weight=7).where(User.id == admin.id).execute()
+
+    response = client.patch('/api/v1/user', headers=admin_headers, json={'email': 'new@example.com'})
+    assert response.status_code == 200
+    assert response.json()['email'] == 'new@example.com'
+    assert User.get_by_id(admin.id).queue_weight == 7
@@ -0,0 +1,34 @@
+"""Batch submissions: every input must be a JSON object, bad ones are reported by position"""
+import pytest
+from backend.lib.db import Job, Workflow
+
+
+@pytest.fixture
+def workflow(client):
+    return Workflow.create(name='batch', description='', nodes={'value': {'modules': []}})
+
+
+def test_json_null_input_is_rejected(client, admin_headers, workflow):
+    response = client.post(f"/api/v1/workflow/{workflow.id}/batch", headers=admin_headers, json=[None, {'a': 1}])
+    assert response.status_code == 422
+    assert 'Input 0: must be a JSON object, got null' in response.json()['detail']
+    assert Job.select().count() == 0
+
+
+def test_ndjson_null_line_is_rejected(client, admin_headers, workflow):
+    response = client.post(
+        f"/api/v1/workflow/{workflow.id}/batch",
+        headers={**admin_headers, 'Content-Type': 'application/x-ndjson'},
+        content=b'{"a": 1}\nnull\n{bad\n'
+    )
+    assert response.status_code == 422
+    detail = response.json()['detail']
+    assert 'Line 2: must be a JSON object, got null' in detail
+    assert 'Line 3: invalid JSON' in detail
+    assert Job.select().count() == 0
+
+
+def test_object_inputs_are_submitted(client, admin_headers, workflow):
+    response = client.post(f"/api/v1/workflow/{workflow.id}/batch", headers=admin_headers, json=[{'a': 1}, {}])
+    assert response.status_code == 202
+    assert response.json()['job_count'] == 2
@@ -0,0 +1,39 @@
+"""Idempotency keys of enqueued jobs and batches, scoped to (user, workflow, key)"""
+from backend.lib.batch import submit_batch
+from backend.lib.db import Job, JobBatch, User, Workflow
+from backend.lib.workflow import enqueue_workflow
+
+
+def make_user(name: str) -> User:
+    return User.create(username=name, email=f"{name}@example.com", password_hash='-', api_token=f"token-{name}")
+
+
+def test_job_keys_are_scoped_to_user_and_workflow():
+    first, second = make_user('first'), make_user('second')
+    workflow = Workflow.create(name='a', description='', nodes={})
+    other_workflow = Workflow.create(name='b', description='', nodes={})
+
+    job, created = enqueue_workflow(workflow.id, {}, idempotency_key='key', user=first)
+    assert created
+    again, created = enqueue_workflow(workflow.id, {}, idempotency_key='key', user=first)
+    assert (again.id, created) == (job.id, False)
+
+    for user, workflow_id in ((second, workflow.id), (first, other_workflow.id), (None, workflow.id)):
+        other, created = enqueue_workflow(workflow_id, {}, idempotency_key='key', user=user)
+        assert created and other.id != job.id
+    assert enqueue_workflow(workflow.id, {}, idempotency_key='key')[0].id == other.id
+    assert Job.select().count() == 4
+
+
+def test_batch_keys_are_scoped_to_user_and_workflow():
+    first, second = make_user('first'), make_user('second')
+    workflow = Workflow.create(name='a', description='', nodes={})
+
+    batch, job_ids, created = submit_batch(workflow.id, [{}, {}], idempotency_key='key', user=first)
+    assert created
+    again, again_ids, created = submit_batch(workflow.id, [{}, {}], idempotency_key='key', user=first)
+    assert (again.id, again_ids, created) == (batch.id, job_ids, False)
+
+    other, _, created = submit_batch(workflow.id, [{}], idempotency_key='key', user=second)
+    assert created and other.id != batch.id
+    assert JobBatch.select().count() == 2
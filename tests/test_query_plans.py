@@ -0,0 +1,16 @@
+"""The hot-path queries use their indexes on a database built through the migrations (SQLite query plans)"""
+import pytest
+from backend.lib.db import IS_POSTGRES
+from benchmarks.query_plans import explain, hot_path_queries, is_full_scan, populate, uses_index
+
+pytestmark = pytest.mark.skipif(IS_POSTGRES, reason="EXPLAIN QUERY PLAN is SQLite only")
+
+
+def test_hot_path_queries_use_their_index():
+    populate(5000)
+    failures = {}
+    for name, query, index in hot_path_queries():
+        plan = explain(query)
+        if not uses_index(plan, index) or is_full_scan(plan):
+            failures[name] = (index, plan)
+    assert not failures
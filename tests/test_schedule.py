@@ -0,0 +1,49 @@
+"""Schedule offsets: runs stay on their cron times whatever the spread, too large offsets are rejected"""
+from datetime import datetime, timedelta
+from backend.lib.db import Job, Schedule, Workflow
+from backend.lib.schedule import compute_next_run, fire_due_schedules, spread_offset
+
+
+def test_large_spread_fires_every_run_without_drift():
+    workflow = Workflow.create(name='scheduled', description='', nodes={})
+    schedule = Schedule.create(name='hourly', workflow=workflow, cron='@hourly', spread=3500)
+    schedule.base_run_at, schedule.next_run_at = compute_next_run(schedule, after=datetime(2030, 1, 1, 0, 30))
+    schedule.save()
+    offset = timedelta(seconds=spread_offset(schedule.id, schedule.spread))
+
+    for hour in range(1, 25):
+        base = datetime(2030, 1, 1) + timedelta(hours=hour)
+        schedule = Schedule.get_by_id(schedule.id)
+        assert (schedule.base_run_at, schedule.next_run_at) == (base, base + offset)
+        # The worker polls late, past the next cron time but before that run's fire time: no run is skipped
+        assert len(fire_due_schedules(now=base + timedelta(hours=1) + offset / 2)) == 1
+    assert Job.select().count() == 24
+
+
+def test_missed_runs_fire_once():
+    workflow = Workflow.create(name='scheduled', description='', nodes={})
+    schedule = Schedule.create(name='hourly', workflow=workflow, cron='@hourly', spread=1800)
+    schedule.base_run_at, schedule.next_run_at = compute_next_run(schedule, after=datetime(2030, 1, 1, 0, 30))
+    schedule.save()
+
+    # No worker for five hours
+    now = datetime(2030, 1, 1, 6, 10)
+    assert len(fire_due_schedules(now=now)) == 1
+    assert fire_due_schedules(now=now + timedelta(seconds=1)) == []
+    schedule = Schedule.get_by_id(schedule.id)
+    assert schedule.base_run_at > now - timedelta(seconds=spread_offset(schedule.id, schedule.spread))
+
+
+def test_offsets_must_stay_below_the_cron_interval(client, admin_headers):
+    workflow = Workflow.create(name='scheduled', description='', nodes={})
+    body = {'name': 'often', 'workflow_id': workflow.id, 'cron': '*/15 * * * *', 'spread': 800, 'jitter': 100}
+    response = client.post('/api/v1/schedules', headers=admin_headers, json=body)
+    assert response.status_code == 400
+    assert 'shortest interval' in response.json()['detail']
+
+    response = client.post('/api/v1/schedules', headers=admin_headers, json={**body, 'spread': 700})
+    assert response.status_code == 201
+    schedule_id = response.json()['id']
+    response = client.patch(f'/api/v1/schedules/{schedule_id}', headers=admin_headers, json={'cron': '*/10 * * * *'})
+    assert response.status_code == 400
+    assert Schedule.get_by_id(schedule_id).cron == '*/15 * * * *'